@@ -12,45 +12,111 @@ from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.tools import tool
 from langchain_anthropic import ChatAnthropic
 
-from config import LLM_MODEL_NAME
-from vectordb.vector_store import load_vector_store
-
-# Global variable for lazy loading
-_vectorstore: Any | None = None
+from config import (
+    DEFAULT_COLLECTION_NAME,
+    DEFAULT_RESULT_TOKEN_BUDGET,
+    LLM_MODEL_NAME,
+    MAX_NEIGHBOUR_CHUNKS,
+)
+from processing.snippets import format_snippet, pack_results
+from vectordb.federated import federated_search
+from vectordb.filters import build_filter, split_values
+from vectordb.vector_store import load_vector_store, resolve_collections
 
 
 @tool("search_repo", return_direct=True)
-def search_repo(query: str) -> str:
-    """Searches code chunks only."""
-    return _search(query, filter_dict={"source_type": "repo"})
+def search_repo(
+    query: str,
+    collections: str = DEFAULT_COLLECTION_NAME,
+    coarse_to_fine: bool = False,
+    paths: str = "",
+    languages: str = "",
+    extensions: str = "",
+    top_level_dirs: str = "",
+    neighbours: int = 0,
+) -> str:
+    """Searches code chunks only. `collections` is a comma-separated list of
+    collection names or globs (e.g. "org-*") to search together. Set
+    `coarse_to_fine` to first pick relevant directories/files from their
+    summaries and search only within them (best for broad questions on large
+    repositories). Optionally restrict the search with comma-separated
+    `paths` (exact file paths), `languages` (e.g. "python,typescript"),
+    `extensions` (e.g. ".py,.pyi") or `top_level_dirs` (e.g. "src,tests").
+    Set `neighbours` (up to 3) to also get that many chunks before and after
+    each hit, e.g. to see the rest of a function."""
+    where = build_filter(
+        "repo",
+        split_values(paths),
+        languages=split_values(languages),
+        extensions=split_values(extensions),
+        top_level_dirs=split_values(top_level_dirs),
+    )
+    return _search(
+        query,
+        filter_dict=where,
+        collections=collections,
+        coarse_to_fine=coarse_to_fine,
+        neighbours=neighbours,
+    )
 
 
 @tool("search_docs", return_direct=True)
-def search_docs(query: str) -> str:
-    """Searches documentation chunks only."""
-    return _search(query, filter_dict={"source_type": "docs"})
+def search_docs(
+    query: str,
+    collections: str = DEFAULT_COLLECTION_NAME,
+    paths: str = "",
+    neighbours: int = 0,
+) -> str:
+    """Searches documentation chunks only. `collections` is a comma-separated
+    list of collection names or globs (e.g. "org-*") to search together.
+    Optionally restrict to comma-separated page URL `paths` (e.g.
+    "/guide/install"). Set `neighbours` (up to 3) to also get that many
+    chunks before and after each hit."""
+    where = build_filter("docs", split_values(paths))
+    return _search(
+        query, filter_dict=where, collections=collections, neighbours=neighbours
+    )
 
 
-def _search(query: str, filter_dict: dict[str, str]) -> str:
+def _search(
+    query: str,
+    filter_dict: dict[str, Any] | None,
+    collections: str = DEFAULT_COLLECTION_NAME,
+    coarse_to_fine: bool = False,
+    neighbours: int = 0,
+) -> str:
     """Internal search function with filtering."""
-    global _vectorstore
-    if _vectorstore is None:
-        _vectorstore = load_vector_store("project")
-
-    if _vectorstore is None:
+    names = resolve_collections(collections)
+    if not names:
         return "Error: Vector store not found. Run ingestion first."
 
-    retriever = _vectorstore.as_retriever(
-        search_kwargs={"k": 6, "filter": filter_dict}
+    # The filter is applied inside the vector query of every collection
+    neighbours = min(max(neighbours, 0), MAX_NEIGHBOUR_CHUNKS)
+    result = federated_search(
+        query,
+        names,
+        k=6,
+        where=filter_dict,
+        coarse_to_fine=coarse_to_fine,
+        neighbours=neighbours,
+    )
+    # Hits widened with their neighbours are returned whole
+    snippets = pack_results(
+        result.documents,
+        query,
+        DEFAULT_RESULT_TOKEN_BUDGET,
+        whole_hits=neighbours > 0,
     )
-    docs = retriever.get_relevant_documents(query)
-    return "\n---\n".join(d.page_content for d in docs)
+    text = "\n---\n".join(format_snippet(s, i) for i, s in enumerate(snippets, 1))
+    if result.timed_out:
+        text += f"\n(Timed out searching: {', '.join(result.timed_out)})"
+    return text
 
 
 TOOLS = [search_repo, search_docs]
 
 
-def get_vector_store(collection_name: str = "project") -> Any | None:
+def get_vector_store(collection_name: str = DEFAULT_COLLECTION_NAME) -> Any | None:
     """Get the vector store instance for direct access."""
     return load_vector_store(collection_name)
 
@@ -0,0 +1,224 @@
+"""
+Semantic answer cache for the agent.
+
+Questions are embedded and compared against previously answered questions of
+the same collection version; a close enough paraphrase returns the stored
+answer without running the agent. Entries expire after a TTL and the least
+recently used entry is evicted once the cache is full.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any
+
+import numpy as np
+
+from config import (
+    ANSWER_CACHE_MAX_ENTRIES,
+    ANSWER_CACHE_SIMILARITY_THRESHOLD,
+    ANSWER_CACHE_TTL_SECONDS,
+)
+from vectordb.vector_store import get_embedder
+
+
+@dataclass
+class CacheEntry:
+    """A previously answered question."""
+
+    question: str
+    embedding: np.ndarray
+    answer: str
+    collection: str
+    version: str | None
+    created_at: float
+    hits: int = 0
+
+
+@dataclass
+class CacheStats:
+    """Counters describing cache effectiveness."""
+
+    hits: int = 0
+    exact_hits: int = 0
+    misses: int = 0
+    bypasses: int = 0
+    expired: int = 0
+    evicted: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        """Fraction of non-bypassed lookups answered from the cache."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+def _normalise_question(question: str) -> str:
+    """Canonical form used for exact-match lookups."""
+    return " ".join(question.lower().split())
+
+
+class SemanticAnswerCache:
+    """
+    Cache of agent answers keyed by question meaning.
+
+    Args:
+        similarity_threshold: Minimum cosine similarity for a cache hit
+        ttl_seconds: Age after which an entry is no longer served
+        max_entries: Maximum number of entries kept (LRU eviction)
+    """
+
+    def __init__(
+        self,
+        similarity_threshold: float = ANSWER_CACHE_SIMILARITY_THRESHOLD,
+        ttl_seconds: float = ANSWER_CACHE_TTL_SECONDS,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+    ) -> None:
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.stats = CacheStats()
+        self._entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, collection: str, version: str | None, question: str) -> str:
+        return f"{collection}\0{version}\0{_normalise_question(question)}"
+
+    def _embed(self, question: str) -> np.ndarray:
+        vector = np.asarray(get_embedder().embed_query(question), dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else vector
+
+    def _expire(self, now: float) -> None:
+        """Drop entries older than the TTL (caller holds the lock)."""
+        stale = [
+            key for key, entry in self._entries.items()
+            if now - entry.created_at > self.ttl_seconds
+        ]
+        for key in stale:
+            del self._entries[key]
+        self.stats.expired += len(stale)
+
+    def lookup(
+        self,
+        question: str,
+        collection: str,
+        version: str | None,
+        *,
+        bypass: bool = False,
+    ) -> tuple[str | None, np.ndarray | None]:
+        """
+        Find a cached answer for a question or one of its paraphrases.
+
+        Args:
+            question: Incoming question
+            collection: Collection the answer must come from
+            version: Current version of that collection
+            bypass: Skip the lookup (the fresh answer is still stored)
+
+        Returns:
+            Tuple of the cached answer (or None) and the question embedding,
+            which can be passed to `store` to avoid embedding twice
+        """
+        if bypass:
+            with self._lock:
+                self.stats.bypasses += 1
+            return None, None
+
+        key = self._key(collection, version, question)
+        with self._lock:
+            self._expire(time.time())
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                entry.hits += 1
+                self.stats.hits += 1
+                self.stats.exact_hits += 1
+                return entry.answer, entry.embedding
+
+        embedding = self._embed(question)
+
+        with self._lock:
+            candidates = [
+                (key, entry) for key, entry in self._entries.items()
+                if entry.collection == collection and entry.version == version
+            ]
+            if candidates:
+                matrix = np.stack([entry.embedding for _, entry in candidates])
+                similarities = matrix @ embedding
+                best = int(np.argmax(similarities))
+                if float(similarities[best]) >= self.similarity_threshold:
+                    best_key, best_entry = candidates[best]
+                    if best_key in self._entries:
+                        self._entries.move_to_end(best_key)
+                        best_entry.hits += 1
+                        self.stats.hits += 1
+                        return best_entry.answer, embedding
+
+            self.stats.misses += 1
+        return None, embedding
+
+    def store(
+        self,
+        question: str,
+        answer: str,
+        collection: str,
+        version: str | None,
+        embedding: np.ndarray | None = None,
+    ) -> None:
+        """
+        Remember the answer to a question.
+
+        Args:
+            question: Question that was answered
+            answer: Agent answer
+            collection: Collection the answer was produced from
+            version: Version of the collection at answer time
+            embedding: Question embedding returned by `lookup`, if any
+        """
+        if embedding is None:
+            embedding = self._embed(question)
+
+        key = self._key(collection, version, question)
+        with self._lock:
+            self._entries[key] = CacheEntry(
+                question=question,
+                embedding=embedding,
+                answer=answer,
+                collection=collection,
+                version=version,
+                created_at=time.time(),
+            )
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats.evicted += 1
+
+    def clear(self) -> None:
+        """Remove every entry (statistics are kept)."""
+        with self._lock:
+            self._entries.clear()
+
+    def metrics(self) -> dict[str, Any]:
+        """
+        Report cache size and hit-rate counters.
+
+        Returns:
+            Dictionary suitable for a JSON response
+        """
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "similarity_threshold": self.similarity_threshold,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.stats.hits,
+                "exact_hits": self.stats.exact_hits,
+                "misses": self.stats.misses,
+                "bypasses": self.stats.bypasses,
+                "expired": self.stats.expired,
+                "evicted": self.stats.evicted,
+                "hit_rate": round(self.stats.hit_rate, 4),
+            }
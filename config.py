@@ -15,16 +15,93 @@ VECTOR_STORE_DIR.mkdir(exist_ok=True)
 README_OUTPUT_DIR = DATA_DIR / "summaries"
 README_OUTPUT_DIR.mkdir(exist_ok=True)
 
-# Embedding model
+# Directory summaries cached by content hash between runs
+SUMMARY_CACHE_DIR = README_OUTPUT_DIR / ".cache"
+
+# Checkpoint journals and fetched documents of interrupted ingestion runs
+INGEST_JOURNAL_DIR = DATA_DIR / "journal"
+
+# Raw bytes per independently compressed frame in the file/page blob store;
+# a range read decompresses only the frames it overlaps
+BLOB_FRAME_SIZE = 64 * 1024
+
+# Chunks fetched per page when collection statistics are rebuilt by a scan,
+# and the largest per-path and per-document counts a statistics read returns
+STATS_SCAN_PAGE_SIZE = 1000
+STATS_TOP_ENTRIES = 20
+
+# Largest share of the stored documentation pages a refresh may delete
+# because they left the sitemap; more than this needs `docs --full`
+DOCS_MAX_REMOVED_FRACTION = 0.5
+
+# Embedding model, and documents embedded and written per request
 EMBED_MODEL_NAME = "text-embedding-3-small"
+EMBED_BATCH_SIZE = 100
 
 # Default chunking parameters
 DEFAULT_CHUNK_SIZE = 800
 DEFAULT_CHUNK_OVERLAP = 200
 
+# Token budget for the snippets returned by a single search tool call
+DEFAULT_RESULT_TOKEN_BUDGET = 2000
+
+# Lines of context kept around each query-matching line, and the maximum
+# number of such windows taken from one search hit
+SNIPPET_CONTEXT_LINES = 3
+SNIPPET_MAX_WINDOWS = 3
+
+# Most neighbouring chunks a search may attach on each side of a hit
+MAX_NEIGHBOUR_CHUNKS = 3
+
 # LLM model for summaries and agent
 LLM_MODEL_NAME = "claude-3-5-sonnet-20241022"
 
+# Collection searched when none is given
+DEFAULT_COLLECTION_NAME = "project"
+
+# Federated search: seconds each collection may wait for a free thread, and
+# then to answer once its search starts, before it is left out of the merged
+# results; threads shared by all searches; and timed-out searches of one
+# collection that may still be running before it is skipped
+FEDERATED_COLLECTION_TIMEOUT = 5.0
+FEDERATED_MAX_WORKERS = 16
+FEDERATED_MAX_ABANDONED = 2
+
+# Two-stage retrieval: summary-tier entries used to scope a search, the
+# maximum number of file paths a scoped search may cover, and how much of
+# each file is embedded in the tier alongside its directory summary
+COARSE_TOP_N = 8
+COARSE_MAX_PATHS = 500
+COARSE_FILE_DIGEST_CHARS = 400
+
+# Semantic answer cache for the /ask endpoint
+ANSWER_CACHE_SIMILARITY_THRESHOLD = 0.92
+ANSWER_CACHE_TTL_SECONDS = 24 * 60 * 60
+ANSWER_CACHE_MAX_ENTRIES = 1000
+
+# Micro-batching of concurrent /search requests: how long the first request
+# waits for others, and the batch size that triggers an immediate flush
+SEARCH_BATCH_WINDOW_MS = 5
+SEARCH_BATCH_MAX_SIZE = 32
+
+# Directory summarisation: LLM calls in flight and started per minute, and
+# how much file content a single directory prompt may include
+SUMMARY_MAX_CONCURRENCY = 4
+SUMMARY_REQUESTS_PER_MINUTE = 50
+SUMMARY_FILE_EXCERPT_CHARS = 1500
+SUMMARY_DIR_CONTEXT_CHARS = 8000
+
+# Batch ingestion: worker processes and the embedding token budget they share
+BATCH_INGEST_WORKERS = 4
+EMBED_TOKENS_PER_MINUTE = 1_000_000
+
+# Background ingestion jobs on the HTTP server: jobs running at once (each in
+# its own worker process), jobs allowed to wait for a free worker, and
+# finished jobs kept for status queries
+INGEST_JOB_WORKERS = 2
+INGEST_JOB_MAX_QUEUED = 20
+INGEST_JOB_HISTORY = 100
+
 # Server configuration
 DEFAULT_PORT = 8000
 DEFAULT_HOST = "0.0.0.0"
@@ -0,0 +1,248 @@
+"""
+Batch ingestion of many repositories from a manifest, using a process pool.
+
+The manifest is a JSON list (or an object with a "repos" list) of entries:
+
+    [
+      {
+        "repo": "https://github.com/org/service-a",
+        "docs_url": "https://docs.org.dev/service-a",
+        "collection": "service-a",
+        "token_env": "GITHUB_TOKEN"
+      }
+    ]
+
+`token_env` names an environment variable holding the GitHub token, so that
+manifests can be committed without secrets. Entries that share a collection
+run one after another in the same worker, because a Chroma directory must not
+be written by two processes at once. All workers draw from a single
+embedding-token budget, so running more workers does not exceed the provider's
+rate limit.
+"""
+from __future__ import annotations
+
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from config import DEFAULT_COLLECTION_NAME, README_OUTPUT_DIR
+from ingestion.pipeline import IngestReport, run_ingest
+
+
+@dataclass
+class ManifestEntry:
+    """One repository to ingest."""
+
+    repo: str
+    collection: str = DEFAULT_COLLECTION_NAME
+    docs_url: str | None = None
+    token_env: str | None = None
+
+
+def load_manifest(path: Path) -> list[ManifestEntry]:
+    """
+    Read and validate a batch ingestion manifest.
+
+    Args:
+        path: JSON manifest file
+
+    Returns:
+        Manifest entries in file order
+    """
+    data: Any = json.loads(path.read_text())
+    if isinstance(data, dict):
+        data = data.get("repos", [])
+    if not isinstance(data, list):
+        raise ValueError("Manifest must be a list of repository entries")
+
+    entries: list[ManifestEntry] = []
+    for i, item in enumerate(data, 1):
+        if not isinstance(item, dict) or not item.get("repo"):
+            raise ValueError(f"Manifest entry {i} needs a 'repo'")
+        entries.append(ManifestEntry(
+            repo=item["repo"],
+            collection=item.get("collection") or DEFAULT_COLLECTION_NAME,
+            docs_url=item.get("docs_url"),
+            token_env=item.get("token_env"),
+        ))
+    return entries
+
+
+class EmbeddingRateBudget:
+    """
+    Token budget for embedding requests shared by all worker processes.
+
+    Requests are spaced so that, across every process holding the budget,
+    no more than `tokens_per_minute` tokens are sent per minute.
+
+    Args:
+        tokens_per_minute: Shared embedding token budget
+        next_slot: Shared time at which the next request may start
+        lock: Shared lock guarding `next_slot`
+    """
+
+    def __init__(
+        self,
+        tokens_per_minute: int,
+        next_slot: Any,
+        lock: Any,
+    ) -> None:
+        self.tokens_per_second = tokens_per_minute / 60
+        self._next_slot = next_slot
+        self._lock = lock
+
+    def __call__(self, tokens: int) -> None:
+        """Block until `tokens` more tokens fit in the budget."""
+        if self.tokens_per_second <= 0:
+            return
+        with self._lock:
+            now = time.time()
+            start = max(now, self._next_slot.value)
+            self._next_slot.value = start + tokens / self.tokens_per_second
+        if start > now:
+            time.sleep(start - now)
+
+
+def _init_worker(tokens_per_minute: int, next_slot: Any, lock: Any) -> None:
+    """Install the shared embedding budget in a freshly started worker."""
+    from vectordb.vector_store import set_embedding_throttle
+
+    set_embedding_throttle(EmbeddingRateBudget(tokens_per_minute, next_slot, lock))
+
+
+def _ingest_collection(
+    entries: list[ManifestEntry],
+    resume: bool = False,
+) -> list[IngestReport]:
+    """Ingest the entries of one collection in order (runs in a worker)."""
+    reports: list[IngestReport] = []
+    for entry in entries:
+        name = entry.repo.rstrip("/").rsplit("/", 1)[-1].removesuffix(".git")
+        token = os.environ.get(entry.token_env) if entry.token_env else None
+        try:
+            report = run_ingest(
+                entry.repo,
+                docs_url=entry.docs_url,
+                token=token,
+                collection=entry.collection,
+                # Repositories sharing a collection each keep their own summary
+                summary_file=README_OUTPUT_DIR / f"{entry.collection}_{name}_dir_summary.md",
+                log=lambda msg, name=name: print(f"[{name}] {msg}", flush=True),
+                resume=resume,
+            )
+        except Exception as e:
+            report = IngestReport(repo=entry.repo, collection=entry.collection)
+            report.error = f"{type(e).__name__}: {e}"
+        reports.append(report)
+    return reports
+
+
+def run_batch(
+    entries: list[ManifestEntry],
+    *,
+    workers: int,
+    tokens_per_minute: int,
+    resume: bool = False,
+) -> list[IngestReport]:
+    """
+    Ingest manifest entries in a process pool under a shared embedding budget.
+
+    Args:
+        entries: Repositories to ingest
+        workers: Number of worker processes
+        tokens_per_minute: Embedding tokens per minute shared by all workers
+        resume: Continue interrupted runs from their journals
+
+    Returns:
+        One report per entry, in manifest order
+    """
+    by_collection: dict[str, list[ManifestEntry]] = {}
+    for entry in entries:
+        by_collection.setdefault(entry.collection, []).append(entry)
+
+    # Spawned workers start clean instead of inheriting open Chroma clients
+    ctx = multiprocessing.get_context("spawn")
+    next_slot = ctx.Value("d", 0.0, lock=False)
+    lock = ctx.Lock()
+
+    results: dict[int, IngestReport] = {}
+    with ProcessPoolExecutor(
+        max_workers=max(1, min(workers, len(by_collection))),
+        mp_context=ctx,
+        initializer=_init_worker,
+        initargs=(tokens_per_minute, next_slot, lock),
+    ) as pool:
+        futures = {
+            pool.submit(_ingest_collection, group, resume): group
+            for group in by_collection.values()
+        }
+        for future in as_completed(futures):
+            group = futures[future]
+            try:
+                reports = future.result()
+            except Exception as e:
+                # The worker itself died; mark the whole group as failed
+                reports = [
+                    IngestReport(entry.repo, entry.collection, error=str(e))
+                    for entry in group
+                ]
+            for entry, report in zip(group, reports, strict=True):
+                results[id(entry)] = report
+
+    return [results[id(entry)] for entry in entries]
+
+
+def _status(report: IngestReport) -> str:
+    """Status cell of one repository."""
+    if report.error:
+        return f"FAILED: {report.error}"
+    if report.docs_error:
+        return f"FAILED (docs): {report.docs_error}"
+    return "ok"
+
+
+def format_report_table(reports: list[IngestReport]) -> str:
+    """
+    Render batch results as a plain-text table.
+
+    Args:
+        reports: Reports returned by `run_batch`
+
+    Returns:
+        Table with one row per repository and a totals row
+    """
+    header = ("Repo", "Collection", "Docs", "Chunks", "Embeddings", "Time (s)", "Status")
+    rows = [
+        (
+            report.repo,
+            report.collection,
+            str(report.documents),
+            str(report.chunks),
+            str(report.embeddings),
+            f"{report.seconds:.1f}",
+            _status(report),
+        )
+        for report in reports
+    ]
+    failures = sum(1 for report in reports if report.failed)
+    rows.append((
+        "TOTAL",
+        "",
+        str(sum(r.documents for r in reports)),
+        str(sum(r.chunks for r in reports)),
+        str(sum(r.embeddings for r in reports)),
+        f"{sum(r.seconds for r in reports):.1f}",
+        f"{failures} failed" if failures else "ok",
+    ))
+
+    widths = [max(len(row[i]) for row in [header, *rows]) for i in range(len(header))]
+    lines = ["  ".join(cell.ljust(w) for cell, w in zip(header, widths, strict=True))]
+    lines.append("  ".join("-" * w for w in widths))
+    for row in rows:
+        lines.append("  ".join(cell.ljust(w) for cell, w in zip(row, widths, strict=True)))
+    return "\n".join(lines)
@@ -3,33 +3,82 @@ Scrape documentation pages (sitemap) and convert to LangChain `Document`s.
 """
 from __future__ import annotations
 
+from urllib.parse import urlsplit
+
 # Type imports handled by __future__ annotations
 from langchain_community.document_loaders.sitemap import SitemapLoader
 from langchain_core.documents import Document
 
+from processing.languages import path_metadata
+
+
+def _loader(base_url: str, restrict_domain: bool) -> SitemapLoader:
+    """Sitemap loader for a documentation site."""
+    return SitemapLoader(
+        web_path=base_url,
+        restrict_to_same_domain=restrict_domain
+    )
+
+
+def list_pages(base_url: str, restrict_domain: bool = True) -> list[dict[str, str]]:
+    """
+    Read the sitemap of a documentation site without fetching any page.
+
+    Args:
+        base_url: Sitemap URL of the documentation site
+        restrict_domain: Whether to restrict to pages on the same domain
 
-def scrape_docs(base_url: str, restrict_domain: bool = True) -> list[Document]:
+    Returns:
+        Sitemap entries with "loc" and, where the sitemap has them, "lastmod",
+        "changefreq" and "priority"
+    """
+    loader = _loader(base_url, restrict_domain)
+    entries = loader.parse_sitemap(loader.scrape(parser="xml"))
+    return [entry for entry in entries if "loc" in entry]
+
+
+def scrape_docs(
+    base_url: str,
+    restrict_domain: bool = True,
+    pages: list[dict[str, str]] | None = None,
+) -> list[Document]:
     """
     Scrape documentation from a website using sitemap.
 
     Args:
         base_url: Base URL of the documentation site
         restrict_domain: Whether to restrict scraping to the same domain
+        pages: Sitemap entries (from `list_pages`) to fetch; every page in
+            the sitemap if None
 
     Returns:
         List of Document objects with documentation content and metadata
     """
-    loader = SitemapLoader(
-        web_path=base_url,
-        restrict_to_same_domain=restrict_domain
-    )
-    docs = loader.load()
+    loader = _loader(base_url, restrict_domain)
+    if pages is None:
+        docs = loader.load()
+    elif not pages:
+        docs = []
+    else:
+        results = loader.scrape_all([page["loc"] for page in pages])
+        docs = [
+            Document(
+                page_content=loader.parsing_function(result),
+                metadata=loader.meta_function(page, result),
+            )
+            for page, result in zip(pages, results, strict=True)
+        ]
 
-    # Add metadata to identify these as documentation
+    # Add metadata to identify these as documentation, with the same
+    # filterable fields as repository files (path is the URL path)
     for d in docs:
+        path = urlsplit(d.metadata.get("source", "")).path or "/"
         d.metadata.update({
             "source_type": "docs",
-            "docs_base": base_url
+            "docs_base": base_url,
+            "path": path,
+            **path_metadata(path),
+            "language": "docs",
         })
 
     return docs
@@ -0,0 +1,197 @@
+"""
+Checkpoint journal that lets an interrupted ingestion run be resumed.
+
+Each (collection, source) pair gets a JSON journal recording the collection
+version being built, the stages that finished and the chunk batches that
+were committed to it, plus a JSONL copy of the fetched documents so a resumed
+run does not fetch them again. Chunk IDs are deterministic, so re-writing a
+batch that was stored but not yet journaled upserts it instead of duplicating
+it.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Any
+
+from langchain_core.documents import Document
+
+from config import EMBED_BATCH_SIZE, INGEST_JOURNAL_DIR
+from vectordb.vector_store import CollectionStore, stored_ids
+
+
+def _write_atomic(path: Path, text: str) -> None:
+    """Replace a file in one step so a crash never leaves it half written."""
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(text)
+    os.replace(tmp, path)
+
+
+class IngestJournal:
+    """
+    Progress of one source being ingested into one collection.
+
+    Args:
+        collection: Collection being written
+        source: Repository URL/path or documentation URL being ingested
+    """
+
+    def __init__(self, collection: str, source: str) -> None:
+        self.collection = collection
+        self.source = source
+        key = hashlib.sha1(source.encode()).hexdigest()[:16]
+        self.dir = INGEST_JOURNAL_DIR / collection / key
+        self.path = self.dir / "journal.json"
+        self.documents_path = self.dir / "documents.jsonl"
+        self._state: dict[str, Any] = {"source": source, "stages": [], "batches": {}}
+
+    @classmethod
+    def open(cls, collection: str, source: str, *, resume: bool) -> IngestJournal:
+        """
+        Open the journal for a run.
+
+        Args:
+            collection: Collection being written
+            source: Repository URL/path or documentation URL being ingested
+            resume: Continue from the existing journal; otherwise discard it
+
+        Returns:
+            Journal ready to record progress
+        """
+        journal = cls(collection, source)
+        if resume and journal.path.exists():
+            journal._state = json.loads(journal.path.read_text())
+        else:
+            journal.clear()
+        return journal
+
+    @property
+    def resuming(self) -> bool:
+        """Whether earlier progress was loaded."""
+        return bool(self._state["stages"] or self._state["batches"])
+
+    @property
+    def version(self) -> str | None:
+        """Collection version the run writes into."""
+        return self._state.get("version")
+
+    @version.setter
+    def version(self, version: str) -> None:
+        previous = self._state.get("version")
+        if previous == version:
+            return
+        if previous is not None:
+            # The version earlier attempts wrote to is gone (e.g. deleted as
+            # abandoned), and with it everything their stages stored. Only the
+            # fetched documents, kept in the journal itself, are still valid.
+            self._state["stages"] = [s for s in self._state["stages"] if s == "fetch"]
+            self._state["batches"] = {}
+        self._state["version"] = version
+        self._save()
+
+    def release_version(self) -> None:
+        """
+        Stop writing into the journaled version, e.g. once an enclosing run
+        has published it.
+
+        Like a change of version, this keeps only the fetched documents, so a
+        resumed run fetches nothing again but writes a new version.
+        """
+        if self.version is None:
+            return
+        del self._state["version"]
+        self._state["stages"] = [s for s in self._state["stages"] if s == "fetch"]
+        self._state["batches"] = {}
+        self._save()
+
+    def _save(self) -> None:
+        self.dir.mkdir(parents=True, exist_ok=True)
+        _write_atomic(self.path, json.dumps(self._state, indent=2))
+
+    def done(self, stage: str) -> bool:
+        """Whether a stage finished in an earlier attempt."""
+        return stage in self._state["stages"]
+
+    def mark_done(self, stage: str) -> None:
+        """Record that a stage finished."""
+        if stage not in self._state["stages"]:
+            self._state["stages"].append(stage)
+            self._save()
+
+    def save_documents(self, docs: list[Document]) -> None:
+        """Keep the fetched documents so a resumed run can skip fetching."""
+        self.dir.mkdir(parents=True, exist_ok=True)
+        lines = [
+            json.dumps({"page_content": d.page_content, "metadata": d.metadata})
+            for d in docs
+        ]
+        _write_atomic(self.documents_path, "\n".join(lines))
+
+    def load_documents(self) -> list[Document] | None:
+        """Documents saved by an earlier attempt, or None if there are none."""
+        if not self.documents_path.exists():
+            return None
+        text = self.documents_path.read_text()
+        return [Document(**json.loads(line)) for line in text.splitlines() if line]
+
+    def save_value(self, key: str, value: Any) -> None:
+        """Keep a JSON-serialisable value for a resumed run."""
+        self._state.setdefault("values", {})[key] = value
+        self._save()
+
+    def load_value(self, key: str) -> Any:
+        """Value saved by an earlier attempt, or None."""
+        return self._state.get("values", {}).get(key)
+
+    def committed_batches(
+        self,
+        stage: str,
+        chunks: list[Document],
+        vs: CollectionStore | None,
+    ) -> set[int]:
+        """
+        Batches of a stage that are journaled and actually stored.
+
+        A journaled batch only counts if every one of its chunk IDs is found in
+        the collection; anything else is written again. The journal is reset
+        for the stage if the chunks differ from the ones it was written for
+        (e.g. after changing the chunk size).
+
+        Args:
+            stage: Stage the batches belong to
+            chunks: Chunks the stage writes, in order
+            vs: The collection, or None if it does not exist
+
+        Returns:
+            Start offsets of the batches that can be skipped
+        """
+        ids = [c.id or "" for c in chunks]
+        digest = hashlib.sha1("\n".join(ids).encode()).hexdigest()
+        entry = self._state["batches"].get(stage)
+        if entry is None or entry["digest"] != digest or vs is None:
+            self._state["batches"][stage] = {"digest": digest, "ranges": []}
+            self._save()
+            return set()
+
+        verified: list[list[int]] = []
+        journaled = [(start, end) for start, end in entry["ranges"]]
+        present = stored_ids(vs, [i for start, end in journaled for i in ids[start:end]])
+        for start, end in journaled:
+            if start % EMBED_BATCH_SIZE == 0 and all(i in present for i in ids[start:end]):
+                verified.append([start, end])
+        entry["ranges"] = verified
+        self._save()
+        return {start for start, _ in verified}
+
+    def commit_batch(self, stage: str, start: int, end: int) -> None:
+        """Record that chunks [start, end) of a stage are stored."""
+        self._state["batches"][stage]["ranges"].append([start, end])
+        self._save()
+
+    def clear(self) -> None:
+        """Forget all progress, e.g. once the run has completed."""
+        shutil.rmtree(self.dir, ignore_errors=True)
+        self._state = {"source": self.source, "stages": [], "batches": {}}
@@ -0,0 +1,101 @@
+"""
+Per-page records of ingested documentation sites.
+
+For every page of a site, the collection keeps the sitemap `lastmod`, a hash
+of the page text and the IDs of the chunks stored for it in a
+`docs_pages.json` sidecar next to its index. A refresh uses them to fetch only
+pages whose `lastmod` changed, re-embed only pages whose text changed, and
+delete the chunks of pages that are no longer in the sitemap.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any
+
+PAGES_FILE = "docs_pages.json"
+
+
+@dataclass
+class PageRecord:
+    """What is stored for one documentation page."""
+
+    lastmod: str | None
+    content_hash: str
+    chunk_ids: list[str] = field(default_factory=list)
+
+
+def content_hash(text: str) -> str:
+    """Hash identifying a page's text."""
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def _read_all(collection_path: Path) -> dict[str, Any]:
+    path = collection_path / PAGES_FILE
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text())
+
+
+def read_page_records(collection_path: Path, docs_url: str) -> dict[str, PageRecord]:
+    """
+    Records of the pages of one documentation site.
+
+    Args:
+        collection_path: Directory of the collection
+        docs_url: Sitemap URL the site was ingested from
+
+    Returns:
+        Records by page URL (empty if the site was never ingested)
+    """
+    site = _read_all(collection_path).get(docs_url, {})
+    return {url: PageRecord(**record) for url, record in site.items()}
+
+
+def write_page_records(
+    collection_path: Path,
+    docs_url: str,
+    records: dict[str, PageRecord],
+) -> None:
+    """
+    Replace the records of one documentation site atomically.
+
+    Args:
+        collection_path: Directory of the collection
+        docs_url: Sitemap URL the site was ingested from
+        records: Records by page URL
+    """
+    sites = _read_all(collection_path)
+    sites[docs_url] = {url: asdict(record) for url, record in sorted(records.items())}
+    tmp = collection_path / f"{PAGES_FILE}.tmp"
+    tmp.write_text(json.dumps(sites))
+    os.replace(tmp, collection_path / PAGES_FILE)
+
+
+def pages_to_fetch(
+    entries: list[dict[str, str]],
+    records: dict[str, PageRecord],
+) -> list[dict[str, str]]:
+    """
+    Sitemap entries whose page may have changed since it was stored.
+
+    A page is fetched if it is new, or if its `lastmod` differs from the
+    stored one or is missing (so the content hash has to decide).
+
+    Args:
+        entries: Sitemap entries from `list_pages`
+        records: Records of the previous ingest
+
+    Returns:
+        Entries to fetch, in sitemap order
+    """
+    changed: list[dict[str, str]] = []
+    for entry in entries:
+        record = records.get(entry["loc"])
+        lastmod = entry.get("lastmod")
+        if record is None or lastmod is None or lastmod != record.lastmod:
+            changed.append(entry)
+    return changed
@@ -0,0 +1,465 @@
+"""
+End-to-end ingestion pipeline shared by the CLI commands.
+
+Fetches a repository (and optionally its documentation site), chunks and
+embeds it into a collection, and builds the directory summaries and the
+summary tier used for two-stage search. Every run writes a new version of the
+collection that is published only once it completes, so searches never see a
+half-ingested collection. Progress is checkpointed in an `IngestJournal` so a
+run interrupted part way can be resumed into the same version.
+"""
+from __future__ import annotations
+
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from pathlib import Path
+
+from langchain_core.documents import Document
+
+from config import DEFAULT_COLLECTION_NAME, DOCS_MAX_REMOVED_FRACTION
+from ingestion.docs_scraper import list_pages, scrape_docs
+from ingestion.journal import IngestJournal
+from ingestion.page_records import (
+    PageRecord,
+    content_hash,
+    pages_to_fetch,
+    read_page_records,
+    write_page_records,
+)
+from ingestion.repo_ingestor import ingest_repo
+from processing.chunker import chunk_documents
+from summaries.dir_summarizer import build_directory_summaries, summarise_directories
+from vectordb.blob_store import forget_files, forget_pages, store_documents
+from vectordb.summary_tier import build_summary_tier
+from vectordb.vector_store import (
+    add_documents_to_store,
+    collection_path,
+    delete_chunks,
+    get_embedder,
+    load_vector_store,
+    staging_collection,
+    stored_chunk_ids,
+)
+
+
+@dataclass
+class IngestReport:
+    """What one ingestion run processed."""
+
+    repo: str
+    collection: str
+    documents: int = 0
+    chunks: int = 0
+    embeddings: int = 0
+    seconds: float = 0.0
+    error: str | None = None
+    # Documentation failures do not stop the run, but are reported
+    docs_error: str | None = None
+    # Live progress: current stage and chunks written so far
+    stage: str = ""
+    stored: int = 0
+
+    @property
+    def failed(self) -> bool:
+        """Whether any part of the run failed."""
+        return bool(self.error or self.docs_error)
+
+
+class IngestCancelled(Exception):
+    """Raised by a progress callback to stop a run at the next checkpoint."""
+
+
+def _embedded_so_far() -> int:
+    """Texts embedded by this process so far (0 if the model is not metered)."""
+    return int(getattr(get_embedder(), "texts_embedded", 0))
+
+
+class _Progress:
+    """
+    Keeps a report's counters current and hands it to a progress callback.
+
+    Counting continues from the report's existing embeddings and time, so a
+    documentation ingest nested in a repository run adds to the run's totals.
+
+    Args:
+        report: Report to update
+        callback: Called with the report at every stage and chunk batch
+    """
+
+    def __init__(
+        self,
+        report: IngestReport,
+        callback: Callable[[IngestReport], None] | None,
+    ) -> None:
+        self.report = report
+        self.callback = callback
+        self._embedded_before = _embedded_so_far() - report.embeddings
+        self._started = time.perf_counter() - report.seconds
+
+    def refresh(self) -> None:
+        """Bring the embedding count and elapsed time up to date."""
+        self.report.embeddings = _embedded_so_far() - self._embedded_before
+        self.report.seconds = time.perf_counter() - self._started
+
+    def update(self, stage: str | None = None, stored: int = 0) -> None:
+        """Record a new stage and/or chunks written, then notify the callback."""
+        if stage is not None:
+            self.report.stage = stage
+        self.report.stored += stored
+        self.refresh()
+        if self.callback is not None:
+            self.callback(self.report)
+
+
+def _store_chunks(
+    journal: IngestJournal,
+    chunks: list[Document],
+    collection: str,
+    shards: int | None,
+    shard_strategy: str,
+    log: Callable[[str], None],
+    progress: _Progress,
+) -> None:
+    """Write chunks to the collection, skipping batches already committed."""
+    skip = journal.committed_batches("embed", chunks, load_vector_store(collection))
+    if skip:
+        log(f"⏭️ Skipping {len(skip)} batches already stored")
+
+    def on_batch(start: int, end: int) -> None:
+        journal.commit_batch("embed", start, end)
+        progress.update(stored=end - start)
+
+    add_documents_to_store(
+        chunks,
+        collection,
+        shards=shards,
+        shard_strategy=shard_strategy,
+        skip=skip,
+        on_batch=on_batch,
+    )
+    journal.mark_done("embed")
+
+
+def _stale_chunks(
+    records: dict[str, PageRecord],
+    changed: list[Document],
+    chunks: list[Document],
+    removed: list[str],
+) -> list[str]:
+    """IDs of chunks that removed pages had, or that changed pages no longer have."""
+    current = {c.id for c in chunks}
+    stale = [i for url in removed for i in records[url].chunk_ids]
+    for doc in changed:
+        record = records.get(doc.metadata["source"])
+        if record is not None:
+            stale += [i for i in record.chunk_ids if i not in current]
+    return stale
+
+
+def _check_sitemap(
+    docs_url: str,
+    entries: list[dict[str, str]],
+    records: dict[str, PageRecord],
+    full: bool,
+) -> None:
+    """
+    Refuse a sitemap that would delete most of the stored documentation.
+
+    The sitemap loader does not check the HTTP status, so an unreachable or
+    broken sitemap parses as an empty one; trusting it would remove every
+    stored page.
+
+    Raises:
+        ValueError: If the sitemap lists no pages, or (unless `full`) leaves
+            out more than `DOCS_MAX_REMOVED_FRACTION` of the stored pages
+    """
+    if not entries:
+        raise ValueError(
+            f"Sitemap {docs_url} lists no pages; leaving the stored documentation unchanged"
+        )
+    listed = {entry["loc"] for entry in entries}
+    missing = sum(1 for url in records if url not in listed)
+    if not full and records and missing > len(records) * DOCS_MAX_REMOVED_FRACTION:
+        raise ValueError(
+            f"{missing} of {len(records)} stored pages are missing from the sitemap "
+            f"{docs_url}; rerun with --full to remove them"
+        )
+
+
+def ingest_docs(
+    docs_url: str,
+    collection: str,
+    *,
+    shards: int | None = None,
+    shard_strategy: str = "hash",
+    log: Callable[[str], None] = print,
+    resume: bool = False,
+    full: bool = False,
+    progress: Callable[[IngestReport], None] | None = None,
+    report: IngestReport | None = None,
+) -> tuple[int, int]:
+    """
+    Scrape a documentation site and add it to a collection, or refresh it.
+
+    Only pages that are new or whose sitemap `lastmod` changed (or is missing)
+    are fetched, and only pages whose text changed are re-embedded. Chunks of
+    pages that left the sitemap, and chunks a changed page no longer has, are
+    deleted.
+
+    Args:
+        docs_url: Documentation website URL
+        collection: Collection to add the pages to
+        shards: Shard count used if the collection has to be created
+        shard_strategy: Shard routing used if the collection has to be created
+        log: Progress message sink
+        resume: Continue an interrupted run from its journal
+        full: Fetch and re-embed every page, ignoring the stored page records,
+            and allow a sitemap that drops most of the stored pages
+        progress: Called with the live report at every stage and chunk batch;
+            it may raise `IngestCancelled` to stop the run
+        report: Report to add the counts to, e.g. of an enclosing repository
+            run (a new one if None)
+
+    Returns:
+        Tuple of (pages re-embedded, chunks stored)
+    """
+    if report is None:
+        report = IngestReport(repo=docs_url, collection=collection)
+    tracker = _Progress(report, progress)
+    journal = IngestJournal.open(collection, docs_url, resume=resume)
+    with staging_collection(collection, version=journal.version) as version:
+        journal.version = version
+        tracker.update("docs-fetch")
+        # Records of the previous ingest, carried over into the new version
+        records = read_page_records(collection_path(collection), docs_url)
+
+        docs = journal.load_documents() if journal.done("fetch") else None
+        sitemap: dict[str, str | None] | None = journal.load_value("sitemap")
+        if docs is None or sitemap is None:
+            log(f"🔄 Reading sitemap: {docs_url}")
+            entries = list_pages(docs_url)
+            _check_sitemap(docs_url, entries, records, full)
+            fetch = entries if full else pages_to_fetch(entries, records)
+            log(
+                f"📖 Found {len(entries)} documentation pages, "
+                f"fetching {len(fetch)} new or modified"
+            )
+            docs = scrape_docs(docs_url, pages=fetch)
+            sitemap = {entry["loc"]: entry.get("lastmod") for entry in entries}
+            journal.save_documents(docs)
+            journal.save_value("sitemap", sitemap)
+            journal.mark_done("fetch")
+        else:
+            log(f"⏯️ Resuming with {len(docs)} documentation pages from the journal")
+
+        # Fetched pages whose text is unchanged only get their new lastmod
+        changed = [
+            d for d in docs
+            if full
+            or d.metadata["source"] not in records
+            or records[d.metadata["source"]].content_hash != content_hash(d.page_content)
+        ]
+        removed = [url for url in records if url not in sitemap]
+        report.documents += len(changed)
+        log(f"✏️ {len(changed)} pages changed, {len(removed)} removed from the sitemap")
+
+        # Keep the original pages for full-page reads
+        if not journal.done("blobs"):
+            new_blobs = store_documents(collection, changed)
+            forget_pages(collection, removed)
+            journal.mark_done("blobs")
+            log(f"🗄️ Stored {new_blobs} new page contents in the blob store")
+
+        # Chunk documentation
+        doc_chunks = chunk_documents(changed)
+        report.chunks += len(doc_chunks)
+        log(f"🔧 Created {len(doc_chunks)} documentation chunks")
+
+        # Add to vector store
+        tracker.update("docs-embed")
+        if not journal.done("embed"):
+            _store_chunks(
+                journal, doc_chunks, collection, shards, shard_strategy, log, tracker
+            )
+        log(f"💾 Stored documentation chunks in collection '{collection}'")
+
+        tracker.update("docs-cleanup")
+        deleted = delete_chunks(
+            collection, _stale_chunks(records, changed, doc_chunks, removed)
+        )
+        if deleted:
+            log(f"🗑️ Deleted {deleted} outdated documentation chunks")
+
+        # Record what is now stored for every page in the sitemap. Writing
+        # this last keeps a resumed run from skipping pages not yet stored.
+        chunk_ids: dict[str, list[str]] = {}
+        for chunk in doc_chunks:
+            chunk_ids.setdefault(chunk.metadata["source"], []).append(chunk.id or "")
+        changed_pages = {d.metadata["source"]: d for d in changed}
+        updated: dict[str, PageRecord] = {}
+        for url, lastmod in sitemap.items():
+            if url in changed_pages:
+                text = changed_pages[url].page_content
+                updated[url] = PageRecord(lastmod, content_hash(text), chunk_ids.get(url, []))
+            elif url in records:
+                updated[url] = PageRecord(
+                    lastmod, records[url].content_hash, records[url].chunk_ids
+                )
+        write_page_records(collection_path(collection), docs_url, updated)
+
+    journal.clear()
+    tracker.refresh()
+    return len(changed), len(doc_chunks)
+
+
+def run_ingest(
+    repo: str,
+    *,
+    docs_url: str | None = None,
+    token: str | None = None,
+    collection: str = DEFAULT_COLLECTION_NAME,
+    shards: int | None = None,
+    shard_strategy: str = "hash",
+    summary_file: Path | None = None,
+    log: Callable[[str], None] = print,
+    resume: bool = False,
+    rebuild: bool = False,
+    progress: Callable[[IngestReport], None] | None = None,
+) -> IngestReport:
+    """
+    Ingest a repository and its optional documentation into a collection.
+
+    A documentation failure is logged and does not fail the run; any other
+    error propagates to the caller. With `resume`, stages and chunk batches
+    completed by an earlier, interrupted run are skipped. Chunks and stored
+    contents of files the repository no longer has (in that form) are
+    removed. The new collection version is published when the run, including
+    the documentation, is done.
+
+    Args:
+        repo: GitHub repository URL or local path
+        docs_url: Documentation website URL (optional)
+        token: GitHub token for private repositories
+        collection: Vector store collection name
+        shards: Split a new collection over this many shards
+        shard_strategy: Shard routing for a new collection
+        summary_file: Where to write the directory summary markdown
+        log: Progress message sink
+        resume: Continue an interrupted run from its journal
+        rebuild: Build the new collection version from scratch instead of
+            from a copy of the current one
+        progress: Called with the live report at every stage and chunk batch;
+            it may raise `IngestCancelled` to stop the run
+
+    Returns:
+        Counts and timing of the run
+    """
+    report = IngestReport(repo=repo, collection=collection)
+    tracker = _Progress(report, progress)
+    journal = IngestJournal.open(collection, repo, resume=resume)
+    with staging_collection(
+        collection, version=journal.version, rebuild=rebuild
+    ) as version:
+        journal.version = version
+
+        # Ingest repository
+        tracker.update("fetch")
+        repo_docs = journal.load_documents() if journal.done("fetch") else None
+        if repo_docs is None:
+            log(f"🔄 Ingesting repository: {repo}")
+            repo_docs = ingest_repo(repo, token=token)
+            journal.save_documents(repo_docs)
+            journal.mark_done("fetch")
+            log(f"📁 Found {len(repo_docs)} repository files")
+        else:
+            log(f"⏯️ Resuming with {len(repo_docs)} repository files from the journal")
+        report.documents += len(repo_docs)
+
+        # Keep the original files for full-file reads
+        tracker.update("blobs")
+        if not journal.done("blobs"):
+            new_blobs = store_documents(collection, repo_docs)
+            journal.mark_done("blobs")
+            log(f"🗄️ Stored {new_blobs} new file contents in the blob store")
+
+        # Chunk repository documents
+        repo_chunks = chunk_documents(repo_docs)
+        report.chunks += len(repo_chunks)
+        log(f"🔧 Created {len(repo_chunks)} repository chunks")
+
+        # Add to vector store
+        tracker.update("embed")
+        if not journal.done("embed"):
+            _store_chunks(
+                journal, repo_chunks, collection, shards, shard_strategy, log, tracker
+            )
+        log(f"💾 Stored repository chunks in collection '{collection}'")
+
+        # The new version starts as a copy of the live one, so chunks and
+        # files that the repository no longer has are still in it
+        tracker.update("cleanup")
+        current = {chunk.id for chunk in repo_chunks}
+        stale = [
+            chunk_id
+            for chunk_id in stored_chunk_ids(
+                collection, {"$and": [{"source_type": "repo"}, {"repo": repo}]}
+            )
+            if chunk_id not in current
+        ]
+        deleted = delete_chunks(collection, stale)
+        forgotten = forget_files(
+            collection, repo, {str(d.metadata["path"]) for d in repo_docs}
+        )
+        if deleted or forgotten:
+            log(f"🗑️ Deleted {deleted} outdated repository chunks and {forgotten} removed files")
+
+        tracker.update("summaries")
+        if not (journal.done("summaries") and journal.done("summary_tier")):
+            # Unchanged directories come from the summary cache, so rebuilding
+            # this on resume costs no LLM calls
+            summaries = build_directory_summaries(repo_docs, repo)
+            failed = [node.display_path for node in summaries.values() if node.error]
+            if failed:
+                log(
+                    f"⚠️ {len(failed)} directory summaries failed and will be "
+                    f"retried next run: {', '.join(sorted(failed)[:5])}"
+                )
+
+            # Generate directory summaries
+            if not journal.done("summaries"):
+                summary_path = summarise_directories(
+                    repo_docs, repo, summary_file, summaries=summaries
+                )
+                journal.mark_done("summaries")
+                log(f"📝 Generated directory summary: {summary_path}")
+
+            # Store summaries as the coarse tier for two-stage search
+            if not journal.done("summary_tier"):
+                tier_entries = build_summary_tier(collection, repo, summaries, repo_docs)
+                journal.mark_done("summary_tier")
+                log(f"🗂️ Stored {tier_entries} directory/file summaries for two-stage search")
+
+        # Ingest documentation if provided
+        if docs_url:
+            try:
+                ingest_docs(
+                    docs_url,
+                    collection,
+                    log=log,
+                    resume=resume,
+                    progress=progress,
+                    report=report,
+                )
+            except IngestCancelled:
+                raise
+            except Exception as e:
+                report.docs_error = f"{type(e).__name__}: {e}"
+                log(f"⚠️ Failed to scrape documentation: {e}")
+                # The version it wrote to is published below; a resumed
+                # documentation run must not continue it in place
+                IngestJournal.open(collection, docs_url, resume=True).release_version()
+
+    journal.clear()
+    tracker.refresh()
+    return report
@@ -4,10 +4,45 @@ Each repo file becomes one LangChain `Document` with metadata describing origin.
 """
 from __future__ import annotations
 
+import re
+
 # Type imports handled by __future__ annotations
 from gitingest import ingest
 from langchain_core.documents import Document
 
+from processing.languages import path_metadata
+
+# gitingest separates files with a header block:
+#   ================================================
+#   FILE: src/app.py
+#   ================================================
+_FILE_HEADER_RE = re.compile(
+    r"^={16,}\n(?:FILE|SYMLINK): (?P<path>[^\n]+)\n={16,}\n", re.MULTILINE
+)
+
+
+def split_repo_content(content: str) -> list[tuple[str, str]]:
+    """
+    Split gitingest's consolidated output into individual files.
+
+    Args:
+        content: Consolidated repository content returned by gitingest
+
+    Returns:
+        List of (relative path, file content) pairs in gitingest order
+    """
+    headers = list(_FILE_HEADER_RE.finditer(content))
+    files: list[tuple[str, str]] = []
+    for i, header in enumerate(headers):
+        end = headers[i + 1].start() if i + 1 < len(headers) else len(content)
+        path = header.group("path").split(" -> ")[0].strip().lstrip("/")
+        text = content[header.end():end]
+        # gitingest appends a blank line after every file
+        if text.endswith("\n\n"):
+            text = text[:-2]
+        files.append((path, text))
+    return files
+
 
 def ingest_repo(repo: str, *, token: str | None = None) -> list[Document]:
     """
@@ -22,19 +57,35 @@ def ingest_repo(repo: str, *, token: str | None = None) -> list[Document]:
     """
     summary, tree, content = ingest(repo, token=token)
 
-    # GitIngest returns consolidated content as a single string
-    # We'll create one document for the entire repository
     docs: list[Document] = [
         Document(
-            page_content=content,
+            page_content=text,
             metadata={
                 "source_type": "repo",
                 "repo": repo,
-                "path": "/",  # Root path for entire repo
-                "summary": summary,
-                "tree": tree,
+                "path": path,
+                **path_metadata(path),
             },
         )
+        for path, text in split_repo_content(content)
+        if text.strip()
     ]
 
+    if not docs and content.strip():
+        # Unrecognised output format: keep the consolidated content as one
+        # document for the entire repository
+        docs.append(
+            Document(
+                page_content=content,
+                metadata={
+                    "source_type": "repo",
+                    "repo": repo,
+                    "path": "/",  # Root path for entire repo
+                    **path_metadata("/"),
+                    "summary": summary,
+                    "tree": tree,
+                },
+            )
+        )
+
     return docs
@@ -4,16 +4,19 @@ Orchestrates repository ingestion, documentation scraping, and MCP server.
 """
 from __future__ import annotations
 
+from pathlib import Path
+
 # Type imports handled by __future__ annotations
 import click
 from dotenv import load_dotenv
 
-from ingestion.docs_scraper import scrape_docs
-from ingestion.repo_ingestor import ingest_repo
-from processing.chunker import chunk_documents
+from config import BATCH_INGEST_WORKERS, EMBED_TOKENS_PER_MINUTE
+from ingestion.batch import format_report_table, load_manifest, run_batch
+from ingestion.pipeline import ingest_docs, run_ingest
 from server.mcp_server import run_server
-from summaries.dir_summarizer import summarise_directories
-from vectordb.vector_store import add_documents_to_store
+from vectordb.sharding import SHARD_STRATEGIES
+from vectordb.stats import format_stats
+from vectordb.vector_store import get_collection_stats, reshard_collection
 
 # Load environment variables
 load_dotenv()
@@ -44,48 +47,49 @@ def cli() -> None:
     default="project",
     help="Vector store collection name"
 )
+@click.option(
+    "--shards",
+    type=int,
+    help="Split a new collection over this many shards"
+)
+@click.option(
+    "--shard-strategy",
+    type=click.Choice(SHARD_STRATEGIES),
+    default="hash",
+    help="Route chunks to shards by chunk hash or by source file/page"
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    help="Continue an interrupted run, skipping work already stored"
+)
+@click.option(
+    "--rebuild",
+    is_flag=True,
+    help="Build the new collection version from scratch instead of a copy of the current one"
+)
 def ingest(
     repo: str,
     docs_url: str | None,
     token: str | None,
-    collection: str
+    collection: str,
+    shards: int | None,
+    shard_strategy: str,
+    resume: bool,
+    rebuild: bool,
 ) -> None:
     """Ingest repository and documentation into vector database."""
-    click.echo(f"🔄 Ingesting repository: {repo}")
-
-    # Ingest repository
-    repo_docs = ingest_repo(repo, token=token)
-    click.echo(f"📁 Found {len(repo_docs)} repository files")
-
-    # Chunk repository documents
-    repo_chunks = chunk_documents(repo_docs)
-    click.echo(f"🔧 Created {len(repo_chunks)} repository chunks")
-
-    # Add to vector store
-    add_documents_to_store(repo_chunks, collection)
-    click.echo(f"💾 Stored repository chunks in collection '{collection}'")
-
-    # Generate directory summaries
-    summary_file = summarise_directories(repo_docs, repo)
-    click.echo(f"📝 Generated directory summary: {summary_file}")
-
-    # Ingest documentation if provided
-    if docs_url:
-        click.echo(f"🔄 Scraping documentation: {docs_url}")
-        try:
-            docs = scrape_docs(docs_url)
-            click.echo(f"📖 Found {len(docs)} documentation pages")
-
-            # Chunk documentation
-            doc_chunks = chunk_documents(docs)
-            click.echo(f"🔧 Created {len(doc_chunks)} documentation chunks")
-
-            # Add to vector store
-            add_documents_to_store(doc_chunks, collection)
-            click.echo(f"💾 Stored documentation chunks in collection '{collection}'")
-        except Exception as e:
-            click.echo(f"⚠️ Failed to scrape documentation: {e}")
-
+    run_ingest(
+        repo,
+        docs_url=docs_url,
+        token=token,
+        collection=collection,
+        shards=shards,
+        shard_strategy=shard_strategy,
+        log=click.echo,
+        resume=resume,
+        rebuild=rebuild,
+    )
     click.echo("✅ Ingestion complete!")
 
 
@@ -100,22 +104,46 @@ def ingest(
     default="project",
     help="Vector store collection name"
 )
-def docs(docs_url: str, collection: str) -> None:
-    """Ingest documentation only into existing vector database."""
-    click.echo(f"🔄 Scraping documentation: {docs_url}")
-    
+@click.option(
+    "--shards",
+    type=int,
+    help="Split a new collection over this many shards"
+)
+@click.option(
+    "--shard-strategy",
+    type=click.Choice(SHARD_STRATEGIES),
+    default="hash",
+    help="Route chunks to shards by chunk hash or by source file/page"
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    help="Continue an interrupted run, skipping work already stored"
+)
+@click.option(
+    "--full",
+    is_flag=True,
+    help="Re-scrape and re-embed every page instead of only changed ones"
+)
+def docs(
+    docs_url: str,
+    collection: str,
+    shards: int | None,
+    shard_strategy: str,
+    resume: bool,
+    full: bool,
+) -> None:
+    """Ingest or refresh documentation in the vector database."""
     try:
-        docs_list = scrape_docs(docs_url)
-        click.echo(f"📖 Found {len(docs_list)} documentation pages")
-
-        # Chunk documentation
-        doc_chunks = chunk_documents(docs_list)
-        click.echo(f"🔧 Created {len(doc_chunks)} documentation chunks")
-
-        # Add to vector store
-        add_documents_to_store(doc_chunks, collection)
-        click.echo(f"💾 Stored documentation chunks in collection '{collection}'")
-        
+        ingest_docs(
+            docs_url,
+            collection,
+            shards=shards,
+            shard_strategy=shard_strategy,
+            log=click.echo,
+            resume=resume,
+            full=full,
+        )
     except Exception as e:
         click.echo(f"⚠️ Failed to scrape documentation: {e}")
         return
@@ -123,6 +151,113 @@ def docs(docs_url: str, collection: str) -> None:
     click.echo("✅ Documentation ingestion complete!")
 
 
+@cli.command("ingest-batch")
+@click.option(
+    "--manifest",
+    required=True,
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    help="JSON manifest of repositories (repo, docs_url, collection, token_env)"
+)
+@click.option(
+    "--workers",
+    default=BATCH_INGEST_WORKERS,
+    show_default=True,
+    help="Number of worker processes"
+)
+@click.option(
+    "--embed-tokens-per-minute",
+    default=EMBED_TOKENS_PER_MINUTE,
+    show_default=True,
+    help="Embedding token budget shared by all workers"
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    help="Continue an interrupted run, skipping work already stored"
+)
+def ingest_batch(
+    manifest: Path,
+    workers: int,
+    embed_tokens_per_minute: int,
+    resume: bool,
+) -> None:
+    """Ingest many repositories from a manifest in parallel."""
+    try:
+        entries = load_manifest(manifest)
+    except ValueError as e:
+        click.echo(f"❌ {e}")
+        return
+
+    click.echo(f"🔄 Ingesting {len(entries)} repositories with {workers} workers")
+    reports = run_batch(
+        entries,
+        workers=workers,
+        tokens_per_minute=embed_tokens_per_minute,
+        resume=resume,
+    )
+    click.echo("")
+    click.echo(format_report_table(reports))
+
+    failures = sum(1 for report in reports if report.failed)
+    if failures:
+        click.echo(f"⚠️ {failures} of {len(reports)} repositories failed")
+        raise SystemExit(1)
+    click.echo("✅ Batch ingestion complete!")
+
+
+@cli.command()
+@click.option(
+    "--collection",
+    default="project",
+    help="Vector store collection name"
+)
+@click.option(
+    "--shards",
+    type=int,
+    required=True,
+    help="Desired number of shards"
+)
+@click.option(
+    "--shard-strategy",
+    type=click.Choice(SHARD_STRATEGIES),
+    help="New routing strategy (defaults to the current one)"
+)
+def reshard(collection: str, shards: int, shard_strategy: str | None) -> None:
+    """Add, remove or rebalance shards without re-embedding."""
+    click.echo(f"🔀 Resharding collection '{collection}' into {shards} shards")
+    try:
+        moved = reshard_collection(collection, shards, shard_strategy)
+    except ValueError as e:
+        click.echo(f"❌ {e}")
+        return
+    click.echo(f"✅ Moved {moved} chunks between shards")
+
+
+@cli.command()
+@click.option(
+    "--collection",
+    default="project",
+    help="Vector store collection name"
+)
+@click.option(
+    "--top",
+    default=10,
+    help="Entries listed per category"
+)
+@click.option(
+    "--refresh",
+    is_flag=True,
+    help="Rebuild the statistics by scanning every stored chunk (writes a new collection version)"
+)
+def stats(collection: str, top: int, refresh: bool) -> None:
+    """Show exact statistics of a collection."""
+    collection_stats = get_collection_stats(collection, refresh=refresh, top=top)
+    if collection_stats is None:
+        click.echo(f"❌ Collection '{collection}' not found")
+        return
+    click.echo(format_stats(collection, collection_stats, top))
+
+
 @cli.command()
 @click.option(
     "--host",
@@ -178,20 +313,19 @@ def run(
     port: int,
 ) -> None:
     """Run the full pipeline: ingest and serve."""
-    # First ingest
-    from click.testing import CliRunner
-    runner = CliRunner()
-
-    ingest_args = ["ingest", "--repo", repo, "--collection", collection]
-    if docs_url:
-        ingest_args.extend(["--docs-url", docs_url])
-    if token:
-        ingest_args.extend(["--token", token])
-
-    result = runner.invoke(cli, ingest_args)
-    if result.exit_code != 0:
-        click.echo(f"❌ Ingestion failed: {result.output}")
+    # First ingest, in-process
+    try:
+        run_ingest(
+            repo,
+            docs_url=docs_url,
+            token=token,
+            collection=collection,
+            log=click.echo,
+        )
+    except Exception as e:
+        click.echo(f"❌ Ingestion failed: {e}")
         return
+    click.echo("✅ Ingestion complete!")
 
     # Then serve
     click.echo(f"🚀 Starting MCP server on {host}:{port}")
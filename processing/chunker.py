@@ -3,6 +3,8 @@ Semantically-friendly chunking (recursive on paragraphs/lines).
 """
 from __future__ import annotations
 
+import hashlib
+
 # Type imports handled by __future__ annotations
 from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
@@ -10,6 +12,46 @@ from langchain_text_splitters import RecursiveCharacterTextSplitter
 from config import DEFAULT_CHUNK_OVERLAP, DEFAULT_CHUNK_SIZE
 
 
+def document_id(doc: Document) -> str:
+    """
+    Stable identifier of the file or page a document came from.
+
+    Args:
+        doc: Repository file or documentation page
+
+    Returns:
+        "repo:path" for repository files, the page URL for documentation, or
+        a hash of the content when the origin is unknown
+    """
+    meta = doc.metadata
+    if meta.get("path") is not None and meta.get("repo"):
+        return f"{meta['repo']}:{meta['path']}"
+    if meta.get("source"):
+        return str(meta["source"])
+    return hashlib.sha1(doc.page_content.encode()).hexdigest()
+
+
+def chunk_id(doc_id: str, text: str, occurrence: int = 0) -> str:
+    """
+    Deterministic chunk ID from its document and content.
+
+    Re-ingesting unchanged content yields the same IDs, so stores upsert
+    instead of accumulating duplicates.
+
+    Args:
+        doc_id: Identifier returned by `document_id`
+        text: Chunk content
+        occurrence: How many identical chunks precede this one in the document
+
+    Returns:
+        Hex chunk ID
+    """
+    doc_hash = hashlib.sha1(doc_id.encode()).hexdigest()[:16]
+    content_hash = hashlib.sha1(text.encode()).hexdigest()[:16]
+    suffix = f"-{occurrence}" if occurrence else ""
+    return f"{doc_hash}-{content_hash}{suffix}"
+
+
 def chunk_documents(
     docs: list[Document],
     *,
@@ -25,7 +67,7 @@ def chunk_documents(
         chunk_overlap: Overlap between consecutive chunks
 
     Returns:
-        List of chunked documents with preserved metadata
+        List of chunked documents with preserved metadata and stable IDs
     """
     splitter = RecursiveCharacterTextSplitter(
         chunk_size=chunk_size,
@@ -36,10 +78,28 @@ def chunk_documents(
     out: list[Document] = []
     for d in docs:
         chunks = splitter.split_text(d.page_content)
+        doc_id = document_id(d)
+        seen: dict[str, int] = {}
+        index = 0
+        previous_len = 0
         for i, chunk in enumerate(chunks):
+            # Offset of the chunk in the original document, so that snippets
+            # from neighbouring chunks of the same file can be merged later
+            offset = index + previous_len - chunk_overlap
+            index = d.page_content.find(chunk, max(0, offset))
+            previous_len = len(chunk)
+
             meta = d.metadata.copy()
             meta["chunk_index"] = i
             meta["total_chunks"] = len(chunks)
-            out.append(Document(page_content=chunk, metadata=meta))
+            meta["start_index"] = index
+            meta["document_id"] = doc_id
+            occurrence = seen.get(chunk, 0)
+            seen[chunk] = occurrence + 1
+            out.append(Document(
+                page_content=chunk,
+                metadata=meta,
+                id=chunk_id(doc_id, chunk, occurrence),
+            ))
 
     return out
@@ -0,0 +1,98 @@
+"""
+Map repository file paths to programming languages and the metadata fields
+that search filters use.
+"""
+from __future__ import annotations
+
+from pathlib import PurePosixPath
+
+# File extension (lower case, with dot) to language name
+EXTENSION_LANGUAGES: dict[str, str] = {
+    ".py": "python",
+    ".pyi": "python",
+    ".ipynb": "jupyter",
+    ".js": "javascript",
+    ".jsx": "javascript",
+    ".mjs": "javascript",
+    ".cjs": "javascript",
+    ".ts": "typescript",
+    ".tsx": "typescript",
+    ".go": "go",
+    ".rs": "rust",
+    ".java": "java",
+    ".kt": "kotlin",
+    ".scala": "scala",
+    ".c": "c",
+    ".h": "c",
+    ".cc": "cpp",
+    ".cpp": "cpp",
+    ".hpp": "cpp",
+    ".cs": "csharp",
+    ".rb": "ruby",
+    ".php": "php",
+    ".swift": "swift",
+    ".sh": "shell",
+    ".bash": "shell",
+    ".sql": "sql",
+    ".html": "html",
+    ".css": "css",
+    ".scss": "css",
+    ".md": "markdown",
+    ".mdx": "markdown",
+    ".rst": "restructuredtext",
+    ".txt": "text",
+    ".json": "json",
+    ".yaml": "yaml",
+    ".yml": "yaml",
+    ".toml": "toml",
+    ".ini": "ini",
+    ".cfg": "ini",
+    ".xml": "xml",
+}
+
+# Files identified by their whole name rather than their extension
+FILENAME_LANGUAGES: dict[str, str] = {
+    "dockerfile": "dockerfile",
+    "makefile": "makefile",
+}
+
+
+def language_for_path(path: str) -> str:
+    """
+    Guess the language of a repository file from its name.
+
+    Args:
+        path: Repository-relative file path
+
+    Returns:
+        Language name, or "other" if the file type is not recognised
+    """
+    name = PurePosixPath(path).name.lower()
+    if name in FILENAME_LANGUAGES:
+        return FILENAME_LANGUAGES[name]
+    return EXTENSION_LANGUAGES.get(PurePosixPath(name).suffix, "other")
+
+
+def normalise_extension(extension: str) -> str:
+    """Lower-case an extension and make sure it starts with a dot."""
+    extension = extension.strip().lower()
+    return extension if extension.startswith(".") else f".{extension}"
+
+
+def path_metadata(path: str) -> dict[str, str]:
+    """
+    Filterable metadata derived from a repository file path.
+
+    Args:
+        path: Repository-relative file path
+
+    Returns:
+        "extension" (lower case with dot, or ""), "language" and
+        "top_level_dir" ("." for files at the repository root)
+    """
+    parts = PurePosixPath(path.strip("/")).parts
+    return {
+        "extension": PurePosixPath(path).suffix.lower(),
+        "language": language_for_path(path),
+        "top_level_dir": parts[0] if len(parts) > 1 else ".",
+    }
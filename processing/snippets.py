@@ -0,0 +1,344 @@
+"""
+Query-focused snippet extraction packed into a per-response token budget.
+
+Approach
+--------
+1. Score every line of every hit by the query terms it contains.
+2. Keep the best-scoring windows (a matching line plus surrounding context)
+   of each hit, or the head of the hit when nothing matches.
+3. Merge overlapping windows that come from the same source file, using the
+   chunk `start_index` recorded by the chunker to line chunks up.
+4. Fill the token budget with the merged snippets in order of relevance.
+"""
+from __future__ import annotations
+
+import math
+import re
+from dataclasses import dataclass, field
+
+from langchain_core.documents import Document
+
+from config import (
+    DEFAULT_RESULT_TOKEN_BUDGET,
+    SNIPPET_CONTEXT_LINES,
+    SNIPPET_MAX_WINDOWS,
+)
+
+# Rough characters-per-token ratio for English text and source code
+CHARS_PER_TOKEN = 4
+
+# Smallest remainder of the budget still worth filling with a truncated snippet
+MIN_SNIPPET_TOKENS = 24
+
+_TERM_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]+")
+_CAMEL_RE = re.compile(r"[a-z0-9]+|[A-Z][a-z0-9]*")
+
+_STOPWORDS = frozenset({
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does",
+    "for", "from", "how", "i", "in", "is", "it", "of", "on", "or", "the",
+    "to", "use", "what", "when", "where", "which", "who", "why", "with",
+})
+
+
+@dataclass
+class Snippet:
+    """A contiguous excerpt of one source, ready to be returned to a client."""
+
+    source: str
+    text: str
+    score: float
+    title: str = ""
+    metadata: dict = field(default_factory=dict)
+
+    @property
+    def tokens(self) -> int:
+        """Estimated token count of the snippet text."""
+        return estimate_tokens(self.text)
+
+
+@dataclass
+class _Window:
+    """A scored character range inside one hit, in file coordinates."""
+
+    start: int
+    end: int
+    score: float
+    rank: int
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of tokens in a piece of text.
+
+    Args:
+        text: Text to measure
+
+    Returns:
+        Approximate token count (at least 1 for non-empty text)
+    """
+    if not text:
+        return 0
+    return max(1, math.ceil(len(text) / CHARS_PER_TOKEN))
+
+
+def query_terms(query: str) -> set[str]:
+    """
+    Extract lower-cased search terms from a query.
+
+    Identifiers are also split on snake_case and camelCase boundaries so that
+    `load_vector_store` matches a question about "vector store".
+
+    Args:
+        query: Natural language or keyword query
+
+    Returns:
+        Set of terms without stopwords
+    """
+    terms: set[str] = set()
+    for word in _TERM_RE.findall(query):
+        parts = [word]
+        for piece in word.split("_"):
+            parts.extend(_CAMEL_RE.findall(piece))
+        for part in parts:
+            part = part.lower()
+            if len(part) > 1 and part not in _STOPWORDS:
+                terms.add(part)
+    return terms
+
+
+def _source_key(doc: Document) -> str:
+    """Identify the file or page a chunk was cut from."""
+    meta = doc.metadata
+    source = str(meta.get("source") or meta.get("path") or "Unknown")
+    # The same path can exist in several collections searched together
+    return f"{meta.get('collection', '')}\0{source}"
+
+
+def _display_source(doc: Document) -> str:
+    """Human-readable origin of a chunk."""
+    meta = doc.metadata
+    return str(meta.get("source") or meta.get("path") or "Unknown")
+
+
+def _line_scores(lines: list[str], weights: dict[str, float]) -> list[float]:
+    """Score each line by the weighted query terms it contains."""
+    scores: list[float] = []
+    for line in lines:
+        lowered = line.lower()
+        scores.append(sum(w for term, w in weights.items() if term in lowered))
+    return scores
+
+
+def _hit_windows(
+    doc: Document,
+    rank: int,
+    base: int,
+    weights: dict[str, float],
+    context_lines: int,
+    max_windows: int,
+    whole: bool = False,
+) -> list[_Window]:
+    """Pick the best-matching line windows of one hit (or all of it)."""
+    text = doc.page_content
+    lines = text.splitlines(keepends=True)
+    if not lines:
+        return []
+
+    total_weight = sum(weights.values()) or 1.0
+    if whole:
+        lowered = text.lower()
+        covered = sum(w for term, w in weights.items() if term in lowered)
+        return [_Window(base, base + len(text), covered / total_weight, rank)]
+
+    offsets = [0]
+    for line in lines:
+        offsets.append(offsets[-1] + len(line))
+
+    scores = _line_scores(lines, weights)
+
+    candidates: list[tuple[float, int, int]] = []
+    for i, score in enumerate(scores):
+        if score <= 0:
+            continue
+        lo = max(0, i - context_lines)
+        hi = min(len(lines), i + context_lines + 1)
+        # Windows are ranked by the distinct term weight they cover, so that
+        # a window hitting several query terms beats one repeating a single term
+        covered = "".join(lines[lo:hi]).lower()
+        window_score = sum(w for term, w in weights.items() if term in covered)
+        candidates.append((window_score / total_weight, lo, hi))
+
+    if not candidates:
+        # Nothing matched lexically; fall back to the head of the hit so the
+        # semantic match is still represented
+        hi = min(len(lines), 2 * context_lines + 1)
+        return [_Window(base, base + offsets[hi], 0.0, rank)]
+
+    candidates.sort(key=lambda c: (-c[0], c[1]))
+    chosen: list[tuple[float, int, int]] = []
+    for cand in candidates:
+        if len(chosen) >= max_windows:
+            break
+        if any(cand[1] < hi and lo < cand[2] for _, lo, hi in chosen):
+            continue
+        chosen.append(cand)
+
+    return [
+        _Window(base + offsets[lo], base + offsets[hi], score, rank)
+        for score, lo, hi in chosen
+    ]
+
+
+def _merge_windows(windows: list[_Window]) -> list[_Window]:
+    """Merge overlapping or touching windows of the same source."""
+    merged: list[_Window] = []
+    for w in sorted(windows, key=lambda w: w.start):
+        if merged and w.start <= merged[-1].end:
+            last = merged[-1]
+            last.end = max(last.end, w.end)
+            last.score = max(last.score, w.score)
+            last.rank = min(last.rank, w.rank)
+        else:
+            merged.append(_Window(w.start, w.end, w.score, w.rank))
+    return merged
+
+
+def _extract(segments: list[tuple[int, str]], start: int, end: int) -> str:
+    """Reassemble the text of `[start, end)` from overlapping chunk segments."""
+    parts: list[str] = []
+    pos = start
+    for seg_start, seg_text in sorted(segments):
+        seg_end = seg_start + len(seg_text)
+        if seg_end <= pos or seg_start > pos:
+            continue
+        take_to = min(end, seg_end)
+        parts.append(seg_text[pos - seg_start:take_to - seg_start])
+        pos = take_to
+        if pos >= end:
+            break
+    return "".join(parts)
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    """Cut a snippet down to whole lines that fit in `max_tokens`."""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind("\n", 0, max_chars)
+    if cut <= 0:
+        return text[:max_chars]
+    return text[:cut + 1]
+
+
+def pack_results(
+    docs: list[Document],
+    query: str,
+    token_budget: int = DEFAULT_RESULT_TOKEN_BUDGET,
+    *,
+    context_lines: int = SNIPPET_CONTEXT_LINES,
+    max_windows: int = SNIPPET_MAX_WINDOWS,
+    whole_hits: bool = False,
+) -> list[Snippet]:
+    """
+    Turn ranked search hits into query-focused snippets within a token budget.
+
+    Args:
+        docs: Search hits, most relevant first
+        query: The query that produced the hits
+        token_budget: Total tokens allowed across all returned snippets
+        context_lines: Lines of context kept around each matching line
+        max_windows: Maximum number of windows taken from a single hit
+        whole_hits: Keep every hit whole instead of cutting query-focused
+            windows from it, e.g. for hits already widened with their
+            neighbouring chunks
+
+    Returns:
+        Snippets in order of relevance whose combined size fits the budget
+    """
+    if not docs or token_budget <= 0:
+        return []
+
+    terms = query_terms(query)
+    # Terms that appear in fewer hits are more discriminating
+    weights: dict[str, float] = {}
+    lowered_docs = [d.page_content.lower() for d in docs]
+    for term in terms:
+        df = sum(1 for text in lowered_docs if term in text)
+        weights[term] = math.log(1 + len(docs) / (1 + df)) + 1.0
+
+    windows: dict[str, list[_Window]] = {}
+    segments: dict[str, list[tuple[int, str]]] = {}
+    first_doc: dict[str, Document] = {}
+
+    for rank, doc in enumerate(docs):
+        key = _source_key(doc)
+        start_index = doc.metadata.get("start_index")
+        if not isinstance(start_index, int) or start_index < 0:
+            # Chunks stored without offsets cannot be lined up with their
+            # neighbours, so each one is treated as a source of its own
+            key = f"{key}#{doc.metadata.get('chunk_index', rank)}"
+            start_index = 0
+
+        segments.setdefault(key, []).append((start_index, doc.page_content))
+        first_doc.setdefault(key, doc)
+        windows.setdefault(key, []).extend(
+            _hit_windows(
+                doc, rank, start_index, weights, context_lines, max_windows, whole_hits
+            )
+        )
+
+    snippets: list[Snippet] = []
+    for key, source_windows in windows.items():
+        doc = first_doc[key]
+        for w in _merge_windows(source_windows):
+            text = _extract(segments[key], w.start, w.end).strip("\n")
+            if not text.strip():
+                continue
+            snippets.append(Snippet(
+                source=_display_source(doc),
+                text=text,
+                # Blend of query-term coverage (0-1) and vector rank, so a
+                # lower-ranked hit that covers the query can outrank one that
+                # matched on meaning alone
+                score=w.score + 1.0 / (1 + w.rank),
+                title=str(doc.metadata.get("title", "")),
+                metadata=doc.metadata,
+            ))
+
+    snippets.sort(key=lambda s: -s.score)
+
+    packed: list[Snippet] = []
+    remaining = token_budget
+    for snippet in snippets:
+        cost = snippet.tokens + estimate_tokens(snippet.source)
+        if cost <= remaining:
+            packed.append(snippet)
+            remaining -= cost
+            continue
+        room = remaining - estimate_tokens(snippet.source)
+        if room >= MIN_SNIPPET_TOKENS:
+            snippet.text = _truncate(snippet.text, room)
+            packed.append(snippet)
+            remaining -= snippet.tokens + estimate_tokens(snippet.source)
+
+    return packed
+
+
+def format_snippet(snippet: Snippet, index: int) -> str:
+    """
+    Render a snippet as a tool-result text block.
+
+    Args:
+        snippet: Snippet to render
+        index: 1-based position in the result list
+
+    Returns:
+        Text block with a short header and the snippet text
+    """
+    header = f"Result {index}"
+    if snippet.title:
+        header += f" - {snippet.title}"
+    header += f" from {snippet.source}"
+    if snippet.metadata.get("collection"):
+        header += f" ({snippet.metadata['collection']})"
+    return f"{header}:\n{snippet.text}\n"
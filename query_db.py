@@ -8,6 +8,9 @@ from __future__ import annotations
 from dotenv import load_dotenv
 
 from config import VECTOR_STORE_DIR
+from vectordb.stats import format_stats
+from vectordb.vector_store import get_collection_stats
+from vectordb.vector_store import list_collections as list_store_collections
 from vectordb.vector_store import load_vector_store
 
 # Load environment variables
@@ -20,8 +23,7 @@ def list_collections() -> list[str]:
         print("❌ Vector store directory not found. Run ingestion first.")
         return []
 
-    collections = [d.name for d in VECTOR_STORE_DIR.iterdir() if d.is_dir()]
-    return collections
+    return list_store_collections()
 
 
 def query_collection(collection: str, query: str, k: int = 5) -> None:
@@ -59,34 +61,12 @@ def query_collection(collection: str, query: str, k: int = 5) -> None:
 def show_collection_stats(collection: str) -> None:
     """Show statistics about a collection."""
     try:
-        vectorstore = load_vector_store(collection)
-        if vectorstore is None:
+        stats = get_collection_stats(collection)
+        if stats is None:
             print(f"❌ Collection '{collection}' not found.")
             return
 
-        # Get a sample of documents to analyze
-        sample_docs = vectorstore.similarity_search("", k=100)
-
-        print(f"📊 Collection '{collection}' Statistics:")
-        print(f"Total documents (sample): {len(sample_docs)}")
-
-        # Count by source type
-        source_types: dict[str, int] = {}
-        paths: set[str] = set()
-
-        for doc in sample_docs:
-            source_type = doc.metadata.get('source_type', 'unknown')
-            source_types[source_type] = source_types.get(source_type, 0) + 1
-
-            if doc.metadata.get('path'):
-                paths.add(doc.metadata['path'])
-
-        print("Source types:")
-        for source_type, count in source_types.items():
-            print(f"  - {source_type}: {count} documents")
-
-        if paths:
-            print(f"Unique file paths: {len(paths)}")
+        print(format_stats(collection, stats))
 
     except Exception as e:
         print(f"❌ Error getting collection stats: {e}")
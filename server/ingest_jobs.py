@@ -0,0 +1,465 @@
+"""
+Background ingestion jobs for the HTTP server.
+
+Jobs run `run_ingest` in a dedicated pool of worker processes, so embedding
+and index writes never compete with request handling in the server process.
+Workers report progress over a queue; a listener thread applies it to the job
+table and pushes it to clients following a job's event stream.
+
+At most `INGEST_JOB_WORKERS` jobs run at once and up to
+`INGEST_JOB_MAX_QUEUED` more wait for a free worker. A collection has at most
+one active job, because a collection must not be written by two processes at
+once. All workers share one embedding token budget, as in batch ingestion.
+Cancelled jobs stop at their next checkpoint and leave their journal behind,
+so they can be resumed later.
+"""
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import threading
+import time
+import uuid
+from collections.abc import AsyncIterator
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import asdict, dataclass, field
+from typing import Any
+
+from config import (
+    EMBED_TOKENS_PER_MINUTE,
+    INGEST_JOB_HISTORY,
+    INGEST_JOB_MAX_QUEUED,
+    INGEST_JOB_WORKERS,
+)
+from ingestion.batch import EmbeddingRateBudget
+from ingestion.pipeline import IngestCancelled, IngestReport, run_ingest
+from vectordb.vector_store import set_embedding_throttle
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINAL_STATES = frozenset({SUCCEEDED, FAILED, CANCELLED})
+
+# Queues and cancellation flags shared with the current worker process,
+# installed by `_init_worker`
+_events: Any = None
+_cancelled: Any = None
+
+
+class JobConflict(Exception):
+    """The collection already has an active job."""
+
+
+class JobQueueFull(Exception):
+    """Too many jobs are waiting for a worker."""
+
+
+@dataclass
+class IngestJobSpec:
+    """What a job ingests."""
+
+    repo: str
+    collection: str
+    docs_url: str | None = None
+    token: str | None = None
+    resume: bool = False
+    rebuild: bool = False
+
+
+@dataclass
+class IngestJob:
+    """State of one ingestion job, as reported to clients."""
+
+    id: str
+    repo: str
+    collection: str
+    docs_url: str | None
+    status: str = QUEUED
+    stage: str = ""
+    documents: int = 0
+    chunks: int = 0
+    stored: int = 0
+    embeddings: int = 0
+    embeddings_per_second: float = 0.0
+    seconds: float = 0.0
+    # Latest progress message of the run
+    message: str = ""
+    error: str | None = None
+    # Documentation failures do not fail the job
+    docs_error: str | None = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: float | None = None
+
+    @property
+    def finished(self) -> bool:
+        """Whether the job has reached a final state."""
+        return self.status in FINAL_STATES
+
+    def apply(self, report: dict[str, Any]) -> None:
+        """Take over the counters of an `IngestReport` (as a dict)."""
+        for name in (
+            "stage", "documents", "chunks", "stored", "embeddings", "seconds", "docs_error"
+        ):
+            setattr(self, name, report[name])
+        if self.seconds > 0:
+            self.embeddings_per_second = round(self.embeddings / self.seconds, 1)
+
+    def to_dict(self) -> dict[str, Any]:
+        """JSON-serialisable form returned by the API."""
+        return asdict(self)
+
+
+def _init_worker(
+    events: Any,
+    cancelled: Any,
+    tokens_per_minute: int,
+    next_slot: Any,
+    lock: Any,
+) -> None:
+    """Connect a freshly started worker to the job queues and shared budget."""
+    global _events, _cancelled
+    _events = events
+    _cancelled = cancelled
+    set_embedding_throttle(EmbeddingRateBudget(tokens_per_minute, next_slot, lock))
+
+
+def _run_job(job_id: str, spec: IngestJobSpec) -> IngestReport:
+    """Run one job (in a worker process), reporting progress as it goes."""
+    if job_id in _cancelled:
+        raise IngestCancelled(f"Job {job_id} was cancelled before it started")
+    _events.put((job_id, RUNNING, None))
+
+    def progress(report: IngestReport) -> None:
+        _events.put((job_id, "progress", asdict(report)))
+        if job_id in _cancelled:
+            raise IngestCancelled(f"Job {job_id} was cancelled")
+
+    def log(message: str) -> None:
+        _events.put((job_id, "log", message))
+
+    return run_ingest(
+        spec.repo,
+        docs_url=spec.docs_url,
+        token=spec.token,
+        collection=spec.collection,
+        log=log,
+        resume=spec.resume,
+        rebuild=spec.rebuild,
+        progress=progress,
+    )
+
+
+class IngestJobManager:
+    """
+    Run ingestion jobs in a worker process pool and track their progress.
+
+    The pool is started with the first job. If a worker dies (e.g. killed
+    for running out of memory) the pool is broken: its jobs fail and the next
+    job starts a new pool.
+
+    Args:
+        workers: Jobs running at once
+        max_queued: Jobs allowed to wait for a free worker
+        history: Finished jobs kept for status queries
+    """
+
+    def __init__(
+        self,
+        workers: int = INGEST_JOB_WORKERS,
+        max_queued: int = INGEST_JOB_MAX_QUEUED,
+        history: int = INGEST_JOB_HISTORY,
+    ) -> None:
+        self.workers = workers
+        self.max_queued = max_queued
+        self.history = history
+        self._jobs: dict[str, IngestJob] = {}
+        self._futures: dict[str, Future] = {}
+        self._subscribers: dict[str, list[tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+        self._lock = threading.Lock()
+        self._pool: ProcessPoolExecutor | None = None
+        self._sync: Any = None
+        self._events: Any = None
+        self._cancelled: Any = None
+
+    def _start(self) -> None:
+        """Start the worker pool and the progress listener (under the lock)."""
+        if self._pool is not None:
+            return
+        # Spawned workers start clean instead of inheriting the server's
+        # open Chroma clients and threads
+        ctx = multiprocessing.get_context("spawn")
+        self._sync = ctx.Manager()
+        self._events = self._sync.Queue()
+        self._cancelled = self._sync.dict()
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=ctx,
+            initializer=_init_worker,
+            initargs=(
+                self._events,
+                self._cancelled,
+                EMBED_TOKENS_PER_MINUTE,
+                ctx.Value("d", 0.0, lock=False),
+                ctx.Lock(),
+            ),
+        )
+        threading.Thread(
+            target=self._listen,
+            args=(self._events,),
+            name="ingest-job-events",
+            daemon=True,
+        ).start()
+
+    def submit(self, spec: IngestJobSpec) -> IngestJob:
+        """
+        Queue an ingestion job.
+
+        Args:
+            spec: What to ingest
+
+        Returns:
+            The new job
+
+        Raises:
+            JobConflict: The collection already has an active job
+            JobQueueFull: Too many jobs are waiting for a worker
+        """
+        with self._lock:
+            active = [job for job in self._jobs.values() if not job.finished]
+            if any(job.collection == spec.collection for job in active):
+                raise JobConflict(
+                    f"Collection '{spec.collection}' already has an active ingestion job"
+                )
+            if sum(1 for job in active if job.status == QUEUED) >= self.max_queued:
+                raise JobQueueFull("Too many ingestion jobs are waiting; try again later")
+
+            job = IngestJob(
+                id=uuid.uuid4().hex[:12],
+                repo=spec.repo,
+                collection=spec.collection,
+                docs_url=spec.docs_url,
+            )
+            self._start()
+            assert self._pool is not None
+            broken: tuple[Any, Any, Any] | None = None
+            failed: list[dict[str, Any]] = []
+            try:
+                future = self._pool.submit(_run_job, job.id, spec)
+            except BrokenProcessPool as e:
+                broken, failed = self._drop_pool(e)
+                self._start()
+                future = self._pool.submit(_run_job, job.id, spec)
+            # Registered only once the pool has accepted the job, so a failed
+            # submit never leaves a job queued forever
+            self._jobs[job.id] = job
+            self._futures[job.id] = future
+            self._prune()
+        future.add_done_callback(lambda f, job_id=job.id: self._finish(job_id, f))
+        if broken is not None:
+            self._stop_pool(*broken, wait=False)
+        for snapshot in failed:
+            self._publish(snapshot["id"], snapshot)
+        return job
+
+    def get(self, job_id: str) -> IngestJob:
+        """
+        Look up a job.
+
+        Args:
+            job_id: ID returned by `submit`
+
+        Returns:
+            The job
+
+        Raises:
+            LookupError: No such job (or it was pruned from the history)
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            raise LookupError(f"Ingestion job '{job_id}' not found")
+        return job
+
+    def list(self) -> list[IngestJob]:
+        """All known jobs, oldest first."""
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancel(self, job_id: str) -> IngestJob:
+        """
+        Cancel a job.
+
+        A queued job is dropped at once; a running job stops at its next
+        checkpoint and is then reported as cancelled.
+
+        Args:
+            job_id: ID returned by `submit`
+
+        Returns:
+            The job
+        """
+        job = self.get(job_id)
+        with self._lock:
+            future = self._futures.get(job_id)
+        if future is None or future.cancel():
+            return job
+        self._cancelled[job_id] = True
+        return job
+
+    async def follow(self, job_id: str) -> AsyncIterator[dict[str, Any]]:
+        """
+        Yield a job's state now and after every change until it finishes.
+
+        Args:
+            job_id: ID returned by `submit`
+
+        Yields:
+            Job snapshots (see `IngestJob.to_dict`)
+        """
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue())
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                raise LookupError(f"Ingestion job '{job_id}' not found")
+            snapshot = job.to_dict()
+            if not job.finished:
+                self._subscribers.setdefault(job_id, []).append(subscriber)
+        try:
+            while True:
+                yield snapshot
+                if snapshot["status"] in FINAL_STATES:
+                    return
+                snapshot = await subscriber[1].get()
+        finally:
+            with self._lock:
+                subscribers = self._subscribers.get(job_id, [])
+                if subscriber in subscribers:
+                    subscribers.remove(subscriber)
+
+    def _publish(self, job_id: str, snapshot: dict[str, Any]) -> None:
+        """Hand a snapshot to every client following the job."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(job_id, []))
+            if snapshot["status"] in FINAL_STATES:
+                self._subscribers.pop(job_id, None)
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, snapshot)
+            except RuntimeError:
+                # The client's event loop is gone
+                pass
+
+    def _listen(self, events: Any) -> None:
+        """Apply progress events from the workers (listener thread)."""
+        while True:
+            try:
+                job_id, kind, payload = events.get()
+            except (EOFError, OSError):
+                return
+            if job_id is None:
+                return
+            with self._lock:
+                job = self._jobs.get(job_id)
+                # Late events of a job that already finished are dropped
+                if job is None or job.finished:
+                    continue
+                if kind == RUNNING:
+                    job.status = RUNNING
+                elif kind == "log":
+                    job.message = payload
+                else:
+                    job.status = RUNNING
+                    job.apply(payload)
+                snapshot = job.to_dict()
+            self._publish(job_id, snapshot)
+
+    def _finish(self, job_id: str, future: Future) -> None:
+        """Record the outcome of a job (runs when its future completes)."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            self._futures.pop(job_id, None)
+            # Jobs of a broken pool may already have been failed by `_drop_pool`
+            if job is None or job.finished:
+                return
+            if future.cancelled():
+                job.status = CANCELLED
+            else:
+                try:
+                    report = future.result()
+                except IngestCancelled:
+                    job.status = CANCELLED
+                except Exception as e:
+                    job.status = FAILED
+                    job.error = f"{type(e).__name__}: {e}"
+                else:
+                    job.status = SUCCEEDED
+                    job.apply(asdict(report))
+            job.finished_at = time.time()
+            snapshot = job.to_dict()
+            cancelled = self._cancelled
+        try:
+            cancelled.pop(job_id, None)
+        except (EOFError, OSError):
+            pass
+        self._publish(job_id, snapshot)
+
+    def _prune(self) -> None:
+        """Forget the oldest finished jobs beyond the history limit (under the lock)."""
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self._jobs[job_id]
+
+    def _drop_pool(
+        self, error: BrokenProcessPool
+    ) -> tuple[tuple[Any, Any, Any], list[dict[str, Any]]]:
+        """
+        Fail the unfinished jobs of a broken pool and forget it (under the lock).
+
+        Args:
+            error: Why the pool is broken
+
+        Returns:
+            Tuple of (the pool, manager and event queue, to be passed to
+            `_stop_pool` once the lock is released; snapshots of the failed
+            jobs, to be published)
+        """
+        failed = []
+        for job in self._jobs.values():
+            if not job.finished:
+                job.status = FAILED
+                job.error = f"{type(error).__name__}: {error}"
+                job.finished_at = time.time()
+                failed.append(job.to_dict())
+        self._futures.clear()
+        broken = (self._pool, self._sync, self._events)
+        self._pool = None
+        return broken, failed
+
+    @staticmethod
+    def _stop_pool(pool: ProcessPoolExecutor, sync: Any, events: Any, wait: bool) -> None:
+        """Stop a worker pool, its progress listener and its manager process."""
+        pool.shutdown(wait=wait, cancel_futures=True)
+        try:
+            events.put((None, "", None))
+            sync.shutdown()
+        except (EOFError, OSError):
+            # The manager process is already gone
+            pass
+
+    def shutdown(self) -> None:
+        """Cancel all jobs and stop the workers, waiting for running jobs to stop."""
+        with self._lock:
+            pool, sync, events = self._pool, self._sync, self._events
+            active = [job_id for job_id, job in self._jobs.items() if not job.finished]
+            self._pool = None
+        if pool is None:
+            return
+        for job_id in active:
+            try:
+                self._cancelled[job_id] = True
+            except (EOFError, OSError):
+                break
+        self._stop_pool(pool, sync, events, wait=True)
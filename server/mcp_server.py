@@ -3,35 +3,115 @@ Expose the agent via Model Context Protocol so any MCP‑aware client can connec
 """
 from __future__ import annotations
 
-from typing import Any
+import asyncio
+import json
+import threading
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from typing import Any, Literal
 
 from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 
 from agent.agent_builder import build_agent
-from config import DEFAULT_HOST, DEFAULT_PORT
+from agent.answer_cache import SemanticAnswerCache
+from config import (
+    DEFAULT_COLLECTION_NAME,
+    DEFAULT_HOST,
+    DEFAULT_PORT,
+    MAX_NEIGHBOUR_CHUNKS,
+)
+from server.ingest_jobs import (
+    FINAL_STATES,
+    IngestJobManager,
+    IngestJobSpec,
+    JobConflict,
+    JobQueueFull,
+)
+from server.search_batcher import SearchBatcher
+from vectordb.filters import build_filter
+from vectordb.vector_store import collections_version, list_collections
 
-app = FastAPI(title="GitRepo+Docs MCP Server")
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """Stop the ingestion workers when the server shuts down."""
+    yield
+    await asyncio.to_thread(_ingest_jobs.shutdown)
+
+
+app = FastAPI(title="GitRepo+Docs MCP Server", lifespan=_lifespan)
 
 # Global agent instance
 _agent_executor = None
+_agent_lock = threading.Lock()
+
+# Answers to previous questions, reused for paraphrases
+_answer_cache = SemanticAnswerCache()
+
+# Groups concurrent /search requests into batched queries
+_search_batcher = SearchBatcher()
+
+# Background ingestion jobs, run in their own worker processes
+_ingest_jobs = IngestJobManager()
 
 
 class QueryRequest(BaseModel):
     """Request model for queries."""
     query: str
+    bypass_cache: bool = False
 
 
 class QueryResponse(BaseModel):
     """Response model for queries."""
     result: str
+    cached: bool = False
+
+
+class SearchRequest(BaseModel):
+    """Request model for direct vector search."""
+    query: str
+    source_type: Literal["repo", "docs"] | None = None
+    paths: list[str] | None = None
+    languages: list[str] | None = None
+    extensions: list[str] | None = None
+    top_level_dirs: list[str] | None = None
+    k: int = Field(default=5, ge=1, le=50)
+    neighbours: int = Field(default=0, ge=0, le=MAX_NEIGHBOUR_CHUNKS)
+    collection: str = DEFAULT_COLLECTION_NAME
+
+
+class IngestJobRequest(BaseModel):
+    """Request model for a background ingestion job."""
+    repo: str
+    docs_url: str | None = None
+    token: str | None = None
+    collection: str = DEFAULT_COLLECTION_NAME
+    resume: bool = False
+    rebuild: bool = False
+
+
+class SearchHit(BaseModel):
+    """A single ranked chunk."""
+    content: str
+    score: float
+    metadata: dict[str, Any]
+
+
+class SearchResponse(BaseModel):
+    """Response model for direct vector search."""
+    results: list[SearchHit]
+    took_ms: float
 
 
 def get_agent() -> Any:
     """Get or create the agent executor."""
     global _agent_executor
-    if _agent_executor is None:
-        _agent_executor = build_agent()
+    with _agent_lock:
+        if _agent_executor is None:
+            _agent_executor = build_agent()
     return _agent_executor
 
 
@@ -47,12 +127,162 @@ async def ask(request: QueryRequest) -> QueryResponse:
         Query response with the answer
     """
     try:
-        agent = get_agent()
-        result = agent.invoke({"input": request.query})
-        return QueryResponse(result=result.get("output", "No response"))
+        # Cache lookup (an embedding call) and the agent block, so they run
+        # off the event loop that serves /search batches and job streams
+        output, cached = await asyncio.to_thread(_answer, request)
+        return QueryResponse(result=output, cached=cached)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e)) from e
+
+
+def _answer(request: QueryRequest) -> tuple[Any, bool]:
+    """Answer a question from the cache or the agent (blocking)."""
+    # The agent's tools can search any collection, so an answer is only
+    # valid while none of them changes
+    version = collections_version(list_collections())
+    cached, embedding = _answer_cache.lookup(
+        request.query,
+        DEFAULT_COLLECTION_NAME,
+        version,
+        bypass=request.bypass_cache,
+    )
+    if cached is not None:
+        return cached, True
+
+    agent = get_agent()
+    result = agent.invoke({"input": request.query})
+    output = result.get("output", "No response")
+    if isinstance(output, str):
+        _answer_cache.store(
+            request.query, output, DEFAULT_COLLECTION_NAME, version, embedding
+        )
+    return output, False
+
+
+@app.post("/search", response_model=SearchResponse)
+async def search(request: SearchRequest) -> SearchResponse:
+    """
+    Return ranked chunks for a query without going through the agent.
+
+    Args:
+        request: Search request with query, filters, result count and
+            neighbouring chunks to attach
+
+    Returns:
+        Ranked chunks with relevance scores
+    """
+    started = time.perf_counter()
+    try:
+        hits = await _search_batcher.search(
+            request.collection,
+            request.query,
+            request.k,
+            build_filter(
+                request.source_type,
+                request.paths,
+                languages=request.languages,
+                extensions=request.extensions,
+                top_level_dirs=request.top_level_dirs,
+            ),
+            request.neighbours,
+        )
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e)) from e
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e)) from e
 
+    return SearchResponse(
+        results=[
+            SearchHit(content=doc.page_content, score=score, metadata=doc.metadata)
+            for doc, score in hits
+        ],
+        took_ms=round((time.perf_counter() - started) * 1000, 2),
+    )
+
+
+@app.post("/ingest", status_code=202)
+async def start_ingest(request: IngestJobRequest) -> dict[str, Any]:
+    """
+    Start ingesting a repository (and its documentation) in the background.
+
+    Args:
+        request: What to ingest and into which collection
+
+    Returns:
+        The queued job; follow it with GET /ingest/{job_id}/events
+    """
+    spec = IngestJobSpec(**request.model_dump())
+    try:
+        # The first job starts the worker pool, which blocks for a moment
+        job = await asyncio.to_thread(_ingest_jobs.submit, spec)
+    except JobConflict as e:
+        raise HTTPException(status_code=409, detail=str(e)) from e
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e)) from e
+    return job.to_dict()
+
+
+@app.get("/ingest")
+async def list_ingest_jobs() -> dict[str, Any]:
+    """Recent and active ingestion jobs, oldest first."""
+    return {"jobs": [job.to_dict() for job in _ingest_jobs.list()]}
+
+
+@app.get("/ingest/{job_id}")
+async def ingest_job(job_id: str) -> dict[str, Any]:
+    """State and progress of an ingestion job."""
+    try:
+        return _ingest_jobs.get(job_id).to_dict()
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e)) from e
+
+
+@app.get("/ingest/{job_id}/events")
+async def ingest_job_events(job_id: str) -> StreamingResponse:
+    """
+    Stream an ingestion job's progress as server-sent events.
+
+    Every change is sent as a "progress" event with the job's state; the
+    stream ends with a "done" event once the job has finished.
+
+    Args:
+        job_id: ID returned by POST /ingest
+
+    Returns:
+        An event stream
+    """
+    try:
+        _ingest_jobs.get(job_id)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e)) from e
+
+    async def stream() -> AsyncIterator[str]:
+        async for snapshot in _ingest_jobs.follow(job_id):
+            event = "done" if snapshot["status"] in FINAL_STATES else "progress"
+            yield f"event: {event}\ndata: {json.dumps(snapshot)}\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+@app.delete("/ingest/{job_id}")
+async def cancel_ingest_job(job_id: str) -> dict[str, Any]:
+    """
+    Cancel an ingestion job.
+
+    A queued job is dropped at once; a running job stops at its next chunk
+    batch or stage and keeps its journal, so it can be resumed.
+    """
+    try:
+        return _ingest_jobs.cancel(job_id).to_dict()
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e)) from e
+
+
+@app.get("/cache/stats")
+async def cache_stats() -> dict[str, Any]:
+    """Answer cache size and hit-rate metrics."""
+    return _answer_cache.metrics()
+
 
 @app.get("/health")
 async def health() -> dict[str, str]:
@@ -67,6 +297,12 @@ async def root() -> dict[str, Any]:
         "service": "GitRepo+Docs MCP Server",
         "endpoints": {
             "ask": "POST /ask - Ask questions about the repository",
+            "search": "POST /search - Ranked chunks without the agent",
+            "ingest": "POST /ingest - Start a background ingestion job",
+            "ingest_jobs": "GET /ingest, GET /ingest/{job_id} - Ingestion job status",
+            "ingest_events": "GET /ingest/{job_id}/events - Job progress stream (SSE)",
+            "ingest_cancel": "DELETE /ingest/{job_id} - Cancel an ingestion job",
+            "cache_stats": "GET /cache/stats - Answer cache metrics",
             "health": "GET /health - Health check",
         }
     }
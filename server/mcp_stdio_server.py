@@ -5,16 +5,72 @@ Provides search tools for repository and documentation content.
 from __future__ import annotations
 
 import asyncio
+import json
 import sys
 from typing import Any
+from urllib.parse import parse_qs, unquote, urlsplit
 
 from mcp.server import Server
+from mcp.server.lowlevel.helper_types import ReadResourceContents
 from mcp.server.stdio import stdio_server
-from mcp.types import Resource, Tool
+from mcp.types import Resource, ResourceTemplate, Tool
+from pydantic import AnyUrl
 
-from agent.agent_builder import get_vector_store
+from config import (
+    DEFAULT_COLLECTION_NAME,
+    DEFAULT_RESULT_TOKEN_BUDGET,
+    MAX_NEIGHBOUR_CHUNKS,
+    STATS_TOP_ENTRIES,
+)
+from processing.snippets import format_snippet, pack_results
+from vectordb.blob_store import get_blob_store
+from vectordb.federated import FederatedResult, federated_search
+from vectordb.filters import build_filter, split_values
+from vectordb.vector_store import get_collection_stats, list_collections, resolve_collections
 
-DEFAULT_COLLECTION_NAME = "project"
+# Hits fetched per search before they are packed into the token budget
+SEARCH_K = 8
+
+# Collections may be given as a list or a comma-separated string of names
+# and globs, e.g. ["org-*", "docs-site"] or "org-*,docs-site"
+COLLECTIONS_SCHEMA: dict[str, Any] = {
+    "description": "Collection names or glob patterns to search together",
+    "anyOf": [
+        {"type": "array", "items": {"type": "string"}},
+        {"type": "string"}
+    ],
+    "default": DEFAULT_COLLECTION_NAME
+}
+
+# Context expansion: hits are returned together with the chunks around them
+NEIGHBOURS_SCHEMA: dict[str, Any] = {
+    "type": "integer",
+    "description": "Attach this many neighbouring chunks before and after each hit (overlapping hits are merged)",
+    "default": 0,
+    "minimum": 0,
+    "maximum": MAX_NEIGHBOUR_CHUNKS
+}
+
+def _values_schema(description: str) -> dict[str, Any]:
+    """Schema of a filter given as a list or a comma-separated string."""
+    return {
+        "description": description,
+        "anyOf": [
+            {"type": "array", "items": {"type": "string"}},
+            {"type": "string"}
+        ]
+    }
+
+# Optional metadata filters, applied inside the vector query
+REPO_FILTER_PROPERTIES: dict[str, Any] = {
+    "paths": _values_schema("Only search these exact file paths"),
+    "languages": _values_schema("Only search files in these languages, e.g. [\"python\"]"),
+    "extensions": _values_schema("Only search files with these extensions, e.g. [\".py\"]"),
+    "top_level_dirs": _values_schema("Only search files under these top-level directories (\".\" for the repository root)")
+}
+DOCS_FILTER_PROPERTIES: dict[str, Any] = {
+    "paths": _values_schema("Only search pages with these URL paths, e.g. [\"/guide/install\"]")
+}
 
 # Create MCP server instance
 server = Server("maiar-mcp")
@@ -32,7 +88,20 @@ async def list_tools() -> list[Tool]:
                     "query": {
                         "type": "string",
                         "description": "Search query for repository content"
-                    }
+                    },
+                    "token_budget": {
+                        "type": "integer",
+                        "description": "Maximum tokens of snippets to return",
+                        "default": DEFAULT_RESULT_TOKEN_BUDGET
+                    },
+                    "collections": COLLECTIONS_SCHEMA,
+                    "coarse_to_fine": {
+                        "type": "boolean",
+                        "description": "First pick relevant directories/files from their summaries, then search only within them",
+                        "default": False
+                    },
+                    "neighbours": NEIGHBOURS_SCHEMA,
+                    **REPO_FILTER_PROPERTIES
                 },
                 "required": ["query"]
             }
@@ -46,7 +115,15 @@ async def list_tools() -> list[Tool]:
                     "query": {
                         "type": "string",
                         "description": "Search query for documentation content"
-                    }
+                    },
+                    "token_budget": {
+                        "type": "integer",
+                        "description": "Maximum tokens of snippets to return",
+                        "default": DEFAULT_RESULT_TOKEN_BUDGET
+                    },
+                    "collections": COLLECTIONS_SCHEMA,
+                    "neighbours": NEIGHBOURS_SCHEMA,
+                    **DOCS_FILTER_PROPERTIES
                 },
                 "required": ["query"]
             }
@@ -56,75 +133,197 @@ async def list_tools() -> list[Tool]:
 @server.call_tool()
 async def call_tool(name: str, arguments: dict[str, Any]) -> list[dict[str, Any]]:
     """Handle tool calls."""
+    try:
+        token_budget = int(arguments.get("token_budget", DEFAULT_RESULT_TOKEN_BUDGET))
+        neighbours = min(max(int(arguments.get("neighbours", 0)), 0), MAX_NEIGHBOUR_CHUNKS)
+        paths = split_values(arguments.get("paths"))
+        if name == "search_repo":
+            where = build_filter(
+                "repo",
+                paths,
+                languages=split_values(arguments.get("languages")),
+                extensions=split_values(arguments.get("extensions")),
+                top_level_dirs=split_values(arguments.get("top_level_dirs"))
+            )
+        else:
+            where = build_filter("docs", paths)
+    except (TypeError, ValueError) as e:
+        return [{"type": "text", "text": f"Invalid arguments for {name}: {str(e)}"}]
+    collections = arguments.get("collections", DEFAULT_COLLECTION_NAME)
     if name == "search_repo":
-        return await search_repository(arguments["query"])
+        return await search_repository(
+            arguments["query"],
+            token_budget,
+            collections,
+            bool(arguments.get("coarse_to_fine", False)),
+            where,
+            neighbours
+        )
     elif name == "search_docs":
-        return await search_documentation(arguments["query"])
+        return await search_documentation(
+            arguments["query"], token_budget, collections, where, neighbours
+        )
     else:
         raise ValueError(f"Unknown tool: {name}")
 
-async def search_repository(query: str) -> list[dict[str, Any]]:
-    """Search repository content."""
+@server.list_resources()
+async def list_resources() -> list[Resource]:
+    """List the statistics resource of every collection."""
+    return [
+        Resource(
+            uri=AnyUrl(f"stats://{name}"),
+            name=f"{name} statistics",
+            description=f"Chunk counts, chunk sizes and index size of collection '{name}'",
+            mimeType="application/json"
+        )
+        for name in list_collections()
+    ]
+
+@server.list_resource_templates()
+async def list_resource_templates() -> list[ResourceTemplate]:
+    """List the templates for reading stored files and pages."""
+    return [
+        ResourceTemplate(
+            uriTemplate="repo://{collection}/{path}",
+            name="Repository file",
+            description="Full content of an ingested repository file. Append ?start=N&end=M for a byte range",
+            mimeType="text/plain"
+        ),
+        ResourceTemplate(
+            uriTemplate="docs://{collection}/{url}",
+            name="Documentation page",
+            description="Full text of an ingested documentation page (URL percent-encoded). Append ?start=N&end=M for a byte range",
+            mimeType="text/plain"
+        )
+    ]
+
+def _read_stats(collection: str) -> list[ReadResourceContents]:
+    """Statistics of a collection as JSON."""
+    stats = get_collection_stats(collection)
+    if stats is None:
+        raise ValueError(f"Collection '{collection}' not found")
+
+    data = {
+        "collection": collection,
+        "index_bytes": stats.index_bytes,
+        "chunk_size_summary": stats.size_summary(),
+        # Only the largest per-path and per-document counts
+        **stats.to_dict(top=STATS_TOP_ENTRIES)
+    }
+    return [ReadResourceContents(content=json.dumps(data), mime_type="application/json")]
+
+def _read_blob(collection: str, key: str, query: str) -> list[ReadResourceContents]:
+    """A stored file or page, or a byte range of it."""
+    params = parse_qs(query)
+    start = int(params["start"][0]) if "start" in params else 0
+    end = int(params["end"][0]) if "end" in params else None
+
+    content = get_blob_store(collection).read(key, start, end)
+    if content is None:
+        raise ValueError(f"'{key}' is not stored in collection '{collection}'")
+    # A range may cut a multi-byte character at either edge
+    text = content.decode("utf-8", errors="ignore" if start or end else "strict")
+    return [ReadResourceContents(content=text, mime_type="text/plain")]
+
+@server.read_resource()
+async def read_resource(uri: AnyUrl) -> list[ReadResourceContents]:
+    """Read stats://<collection>, repo://<collection>/<path> or docs://<collection>/<url>."""
+    parts = urlsplit(str(uri))
+    collection = parts.netloc
+    target = unquote(parts.path.lstrip("/"))
+
+    if parts.scheme == "stats":
+        return await asyncio.to_thread(_read_stats, collection)
+    if parts.scheme in ("repo", "docs") and target:
+        key = f"{parts.scheme}/{target}"
+        return await asyncio.to_thread(_read_blob, collection, key, parts.query)
+    raise ValueError(f"Unknown resource: {uri}")
+
+def _format_results(
+    result: FederatedResult,
+    query: str,
+    token_budget: int,
+    neighbours: int = 0
+) -> list[dict[str, Any]]:
+    """Pack federated hits into snippets and note any skipped collections."""
+    # Hits widened with their neighbours are returned whole
+    snippets = pack_results(
+        result.documents, query, token_budget, whole_hits=neighbours > 0
+    )
+    items = [
+        {"type": "text", "text": format_snippet(snippet, i)}
+        for i, snippet in enumerate(snippets, 1)
+    ]
+    skipped = result.timed_out + list(result.failed)
+    if skipped:
+        items.append({
+            "type": "text",
+            "text": f"Note: no results from collections: {', '.join(skipped)}"
+        })
+    return items
+
+async def search_repository(
+    query: str,
+    token_budget: int = DEFAULT_RESULT_TOKEN_BUDGET,
+    collections: str | list[str] = DEFAULT_COLLECTION_NAME,
+    coarse_to_fine: bool = False,
+    where: dict[str, Any] | None = None,
+    neighbours: int = 0
+) -> list[dict[str, Any]]:
+    """Search repository content, optionally restricted by a metadata filter."""
     try:
-        vs = get_vector_store(DEFAULT_COLLECTION_NAME)
-        if vs is None:
+        names = resolve_collections(collections)
+        if not names:
             return [{"type": "text", "text": "No repository data found. Please run ingestion first."}]
         
-        # Search for relevant documents
-        docs = vs.similarity_search(query, k=5)
+        # Search all requested collections concurrently
+        result = await asyncio.to_thread(
+            federated_search,
+            query,
+            names,
+            SEARCH_K,
+            where or {"source_type": "repo"},
+            coarse_to_fine=coarse_to_fine,
+            neighbours=neighbours
+        )
         
-        if not docs:
+        if not result.hits:
             return [{"type": "text", "text": f"No repository content found for query: {query}"}]
         
-        # Format results
-        results = []
-        for i, doc in enumerate(docs, 1):
-            source = doc.metadata.get("source", "Unknown")
-            content = doc.page_content[:500] + "..." if len(doc.page_content) > 500 else doc.page_content
-            results.append({
-                "type": "text",
-                "text": f"Result {i} from {source}:\n{content}\n"
-            })
-        
-        return results
+        # Pack query-focused snippets into the token budget
+        return _format_results(result, query, token_budget, neighbours)
         
     except Exception as e:
         return [{"type": "text", "text": f"Error searching repository: {str(e)}"}]
 
-async def search_documentation(query: str) -> list[dict[str, Any]]:
-    """Search documentation content."""
+async def search_documentation(
+    query: str,
+    token_budget: int = DEFAULT_RESULT_TOKEN_BUDGET,
+    collections: str | list[str] = DEFAULT_COLLECTION_NAME,
+    where: dict[str, Any] | None = None,
+    neighbours: int = 0
+) -> list[dict[str, Any]]:
+    """Search documentation content, optionally restricted by a metadata filter."""
     try:
-        vs = get_vector_store(DEFAULT_COLLECTION_NAME)
-        if vs is None:
+        names = resolve_collections(collections)
+        if not names:
             return [{"type": "text", "text": "No documentation data found. Please run documentation ingestion first."}]
         
-        # Search for relevant documents with documentation filter
-        docs = vs.similarity_search(query, k=5, filter={"type": "documentation"})
-        
-        if not docs:
-            # Fallback to general search if no docs-specific content
-            docs = vs.similarity_search(query, k=5)
-            if not docs:
-                return [{"type": "text", "text": f"No documentation content found for query: {query}"}]
+        # One pre-filtered search over documentation chunks
+        result = await asyncio.to_thread(
+            federated_search,
+            query,
+            names,
+            SEARCH_K,
+            where or {"source_type": "docs"},
+            neighbours=neighbours
+        )
         
-        # Format results
-        results = []
-        for i, doc in enumerate(docs, 1):
-            source = doc.metadata.get("source", "Unknown")
-            title = doc.metadata.get("title", "")
-            content = doc.page_content[:500] + "..." if len(doc.page_content) > 500 else doc.page_content
-            
-            result_text = f"Result {i}"
-            if title:
-                result_text += f" - {title}"
-            result_text += f" from {source}:\n{content}\n"
-            
-            results.append({
-                "type": "text", 
-                "text": result_text
-            })
+        if not result.hits:
+            return [{"type": "text", "text": f"No documentation content found for query: {query}"}]
         
-        return results
+        # Pack query-focused snippets into the token budget
+        return _format_results(result, query, token_budget, neighbours)
         
     except Exception as e:
         return [{"type": "text", "text": f"Error searching documentation: {str(e)}"}]
@@ -0,0 +1,180 @@
+"""
+Dynamic micro-batching for LLM-free vector search.
+
+Concurrent search requests are collected for a short window and then served
+with one batched embedding call for all queries and one vector query per
+distinct (collection, filter) group, instead of one round trip each.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+from dataclasses import dataclass, field
+from typing import Any
+
+from langchain_core.documents import Document
+
+from config import SEARCH_BATCH_MAX_SIZE, SEARCH_BATCH_WINDOW_MS
+from vectordb.adjacency import expand_hits
+from vectordb.vector_store import (
+    get_embedder,
+    query_by_vectors,
+    reading_collection,
+    store_directory,
+)
+
+
+@dataclass
+class _PendingSearch:
+    """A search request waiting for its batch to be flushed."""
+
+    collection: str
+    query: str
+    k: int
+    where: dict[str, Any] | None
+    neighbours: int
+    future: asyncio.Future = field(repr=False)
+
+
+class SearchBatcher:
+    """
+    Group concurrent searches into batched embedding and vector queries.
+
+    Args:
+        window_ms: How long the first request of a batch waits for company
+        max_batch: Batch size that triggers an immediate flush
+    """
+
+    def __init__(
+        self,
+        window_ms: float = SEARCH_BATCH_WINDOW_MS,
+        max_batch: int = SEARCH_BATCH_MAX_SIZE,
+    ) -> None:
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._pending: list[_PendingSearch] = []
+        self._flush_handle: asyncio.TimerHandle | None = None
+        # In-flight batches; the event loop only keeps weak references
+        self._dispatching: set[asyncio.Task] = set()
+        self.batches = 0
+        self.requests = 0
+
+    async def search(
+        self,
+        collection: str,
+        query: str,
+        k: int,
+        where: dict[str, Any] | None = None,
+        neighbours: int = 0,
+    ) -> list[tuple[Document, float]]:
+        """
+        Queue a search and wait for the batch it lands in.
+
+        Args:
+            collection: Collection to search
+            query: Query text
+            k: Number of results
+            where: Optional Chroma metadata filter
+            neighbours: Neighbouring chunks to attach on each side of a hit
+
+        Returns:
+            List of (document, relevance score) pairs, best first
+        """
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future = loop.create_future()
+        self._pending.append(
+            _PendingSearch(collection, query, k, where, neighbours, future)
+        )
+
+        if len(self._pending) >= self.max_batch:
+            self._flush_now()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush_now)
+
+        result: list[tuple[Document, float]] = await future
+        return result
+
+    def _flush_now(self) -> None:
+        """Hand the pending requests to a worker thread as one batch."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        self.batches += 1
+        self.requests += len(batch)
+        task = asyncio.get_running_loop().create_task(self._dispatch(batch))
+        self._dispatching.add(task)
+        task.add_done_callback(self._dispatching.discard)
+
+    async def _dispatch(self, batch: list[_PendingSearch]) -> None:
+        """Run a batch off the event loop and resolve its futures."""
+        try:
+            results = await asyncio.to_thread(self._run_batch, batch)
+        except Exception as e:
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_exception(e)
+            return
+
+        for item, result in zip(batch, results, strict=True):
+            if item.future.done():
+                continue
+            if isinstance(result, Exception):
+                item.future.set_exception(result)
+            else:
+                item.future.set_result(result)
+
+    def _run_batch(
+        self,
+        batch: list[_PendingSearch],
+    ) -> list[list[tuple[Document, float]] | Exception]:
+        """Embed all queries at once, then query each filter group once."""
+        unique_queries = list(dict.fromkeys(item.query for item in batch))
+        vectors = dict(zip(
+            unique_queries,
+            get_embedder().embed_documents(unique_queries),
+            strict=True,
+        ))
+
+        groups: dict[tuple[str, str], list[int]] = {}
+        for i, item in enumerate(batch):
+            key = (item.collection, json.dumps(item.where, sort_keys=True))
+            groups.setdefault(key, []).append(i)
+
+        results: list[list[tuple[Document, float]] | Exception] = [[] for _ in batch]
+        for (collection, _), indices in groups.items():
+            # Hold the collection version until its hits are converted
+            with reading_collection(collection) as vs:
+                if vs is None:
+                    for i in indices:
+                        results[i] = LookupError(f"Collection '{collection}' not found")
+                    continue
+
+                n_results = max(batch[i].k for i in indices)
+                try:
+                    responses = query_by_vectors(
+                        vs,
+                        [vectors[batch[i].query] for i in indices],
+                        n_results,
+                        batch[indices[0]].where,
+                    )
+                except Exception as e:
+                    for i in indices:
+                        results[i] = e
+                    continue
+
+                relevance = vs._select_relevance_score_fn()
+                for hits, i in zip(responses, indices, strict=True):
+                    scored = [
+                        (doc, relevance(dist)) for doc, dist in hits
+                    ][:batch[i].k]
+                    # Neighbours are fetched by ID, not with another vector query
+                    results[i] = expand_hits(
+                        vs, store_directory(vs), scored, batch[i].neighbours
+                    )
+
+        return results
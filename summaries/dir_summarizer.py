@@ -4,32 +4,320 @@ Generate a Markdown README-like overview summarizing each directory in the repo.
 Approach
 --------
 1. Group repo `Document`s by their directory path.
-2. Use an LLM to craft a 1–2 sentence summary for each directory, given sample
-   file contents as context.
-3. Append a bullet‑list of files with clickable GitHub links.
+2. Summarise directories map-reduce style, deepest first: a leaf directory is
+   summarised from excerpts of its files, a parent from its files plus the
+   summaries of its subdirectories. Directories of the same depth are
+   summarised concurrently, within a concurrency and request-rate limit.
+3. Cache each summary under a hash of the directory's content (its files and
+   the hashes of its subdirectories), so a re-run only re-summarises the
+   directories that changed and their ancestors. The cache is written after
+   every level; a directory whose summary failed is left out of it (and so
+   are its ancestors, which were summarised without it), so a re-run
+   retries exactly those.
+4. Append a bullet‑list of files with clickable GitHub links.
 """
 from __future__ import annotations
 
-from pathlib import Path
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from pathlib import Path, PurePosixPath
 
+from langchain_anthropic import ChatAnthropic
 from langchain_core.documents import Document
-from langchain_openai import ChatOpenAI
 
-from config import LLM_MODEL_NAME, README_OUTPUT_DIR
+from config import (
+    LLM_MODEL_NAME,
+    README_OUTPUT_DIR,
+    SUMMARY_CACHE_DIR,
+    SUMMARY_DIR_CONTEXT_CHARS,
+    SUMMARY_FILE_EXCERPT_CHARS,
+    SUMMARY_MAX_CONCURRENCY,
+    SUMMARY_REQUESTS_PER_MINUTE,
+)
+from ingestion.repo_ingestor import split_repo_content
+
+# Bump when the prompts change so cached summaries are regenerated
+_PROMPT_VERSION = "1"
+
+
+@dataclass
+class DirectorySummary:
+    """Summary of one directory and what it was generated from."""
+
+    path: str
+    content_hash: str
+    summary: str = ""
+    files: list[str] = field(default_factory=list)
+    subdirs: list[str] = field(default_factory=list)
+    # Why the summary could not be generated in this run
+    error: str | None = None
+
+    @property
+    def depth(self) -> int:
+        """Number of path components (0 for the repository root)."""
+        return len(PurePosixPath(self.path).parts) if self.path else 0
+
+    @property
+    def display_path(self) -> str:
+        """Path shown to readers, with the root rendered as `/`."""
+        return f"{self.path}/" if self.path else "/"
+
+
+class _RateLimiter:
+    """Space out calls so no more than `per_minute` start in any minute."""
+
+    def __init__(self, per_minute: int) -> None:
+        self._interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self._interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def _repo_files(repo_docs: list[Document]) -> dict[str, str]:
+    """Map repository file paths to their contents."""
+    files: dict[str, str] = {}
+    for doc in repo_docs:
+        path = str(doc.metadata.get("path", "")).strip("/")
+        if path:
+            files[path] = doc.page_content
+        else:
+            # Consolidated gitingest document covering the whole repository
+            files.update(split_repo_content(doc.page_content))
+    return files
+
+
+def _parent_dir(path: str) -> str:
+    """Directory containing `path`, with "" for the repository root."""
+    parent = str(PurePosixPath(path).parent)
+    return "" if parent == "." else parent
+
+
+def _build_tree(files: dict[str, str]) -> dict[str, DirectorySummary]:
+    """Create the directory tree with Merkle-style content hashes."""
+    dirs: dict[str, DirectorySummary] = {"": DirectorySummary("", "")}
+    for path in sorted(files):
+        parent = _parent_dir(path)
+        dirs.setdefault(parent, DirectorySummary(parent, "")).files.append(path)
+        # Register every ancestor so empty intermediate directories link up
+        child = parent
+        while child:
+            up = _parent_dir(child)
+            node = dirs.setdefault(up, DirectorySummary(up, ""))
+            if child not in node.subdirs:
+                node.subdirs.append(child)
+            dirs.setdefault(child, DirectorySummary(child, ""))
+            child = up
+
+    for node in sorted(dirs.values(), key=lambda d: -d.depth):
+        node.subdirs.sort()
+        digest = hashlib.sha256(_PROMPT_VERSION.encode())
+        for path in node.files:
+            file_hash = hashlib.sha256(files[path].encode()).hexdigest()
+            digest.update(f"f:{path}:{file_hash}\n".encode())
+        for sub in node.subdirs:
+            digest.update(f"d:{sub}:{dirs[sub].content_hash}\n".encode())
+        node.content_hash = digest.hexdigest()
+
+    return dirs
+
+
+def _cache_file(repo_url: str) -> Path:
+    """Per-repository cache file for directory summaries."""
+    slug = re.sub(r"[^A-Za-z0-9._-]+", "_", repo_url).strip("_")[-80:]
+    digest = hashlib.sha256(repo_url.encode()).hexdigest()[:8]
+    return SUMMARY_CACHE_DIR / f"{slug}-{digest}.json"
+
+
+def _load_cache(cache_file: Path) -> dict[str, dict[str, str]]:
+    try:
+        data: dict[str, dict[str, str]] = json.loads(cache_file.read_text())
+        return data
+    except (OSError, ValueError):
+        return {}
+
+
+def _directory_prompt(
+    node: DirectorySummary,
+    files: dict[str, str],
+    dirs: dict[str, DirectorySummary],
+) -> str:
+    """Build the prompt summarising one directory."""
+    budget = SUMMARY_DIR_CONTEXT_CHARS
+    parts = [
+        "You are generating documentation for an open-source repository. "
+        f"Summarise the directory `{node.display_path}` in 1-3 sentences: what "
+        "it contains and its role in the project. Reply with the summary only.\n"
+    ]
+
+    if node.subdirs:
+        parts.append("Subdirectories:")
+        for sub in node.subdirs:
+            line = f"- {dirs[sub].display_path}: {dirs[sub].summary}"
+            parts.append(line[:max(budget, len(dirs[sub].display_path) + 2)])
+            budget -= len(line)
+        parts.append("")
+
+    listed_only: list[str] = []
+    for path in node.files:
+        excerpt = files[path][:min(SUMMARY_FILE_EXCERPT_CHARS, max(budget, 0))]
+        if not excerpt:
+            listed_only.append(path)
+            continue
+        parts.extend([f"File {path}:", "-----", excerpt, "-----"])
+        budget -= len(excerpt)
+
+    if listed_only:
+        parts.append("Other files: " + ", ".join(listed_only))
+
+    return "\n".join(parts)
+
+
+async def _summarise_tree(
+    dirs: dict[str, DirectorySummary],
+    files: dict[str, str],
+    pending: set[str],
+    max_concurrency: int,
+    requests_per_minute: int,
+    on_level: Callable[[], None],
+) -> None:
+    """Summarise the pending directories level by level, deepest first."""
+    llm = ChatAnthropic(
+        model_name=LLM_MODEL_NAME, temperature=0.2, timeout=60, stop=None
+    )
+    semaphore = asyncio.Semaphore(max_concurrency)
+    limiter = _RateLimiter(requests_per_minute)
+
+    async def summarise(node: DirectorySummary) -> None:
+        prompt = _directory_prompt(node, files, dirs)
+        try:
+            async with semaphore:
+                await limiter.wait()
+                response = await llm.ainvoke(prompt)
+        except Exception as e:
+            node.error = f"{type(e).__name__}: {e}"
+            return
+        node.summary = (
+            response.content.strip()
+            if isinstance(response.content, str)
+            else str(response.content)
+        )
+
+    depths = sorted({dirs[path].depth for path in pending}, reverse=True)
+    for depth in depths:
+        level = [dirs[p] for p in pending if dirs[p].depth == depth]
+        await asyncio.gather(*(summarise(node) for node in level))
+        on_level()
+
+
+def _complete(path: str, dirs: dict[str, DirectorySummary]) -> bool:
+    """Whether a directory and all its subdirectories were summarised."""
+    node = dirs[path]
+    return node.error is None and all(_complete(sub, dirs) for sub in node.subdirs)
+
+
+def _save_cache(cache_file: Path, dirs: dict[str, DirectorySummary]) -> None:
+    """Write the summaries that are complete so far to the cache, atomically."""
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp = cache_file.with_name(f"{cache_file.name}.tmp")
+    tmp.write_text(json.dumps(
+        {
+            path: {"hash": node.content_hash, "summary": node.summary}
+            for path, node in dirs.items()
+            if node.summary and _complete(path, dirs)
+        },
+        indent=2,
+    ))
+    os.replace(tmp, cache_file)
+
+
+def build_directory_summaries(
+    repo_docs: list[Document],
+    repo_url: str,
+    *,
+    cache_file: Path | None = None,
+    max_concurrency: int = SUMMARY_MAX_CONCURRENCY,
+    requests_per_minute: int = SUMMARY_REQUESTS_PER_MINUTE,
+) -> dict[str, DirectorySummary]:
+    """
+    Summarise every directory of a repository, reusing cached summaries.
+
+    Args:
+        repo_docs: Repository documents, one per file
+        repo_url: URL of the repository (identifies the cache)
+        cache_file: Optional custom cache location
+        max_concurrency: Maximum LLM calls in flight
+        requests_per_minute: Maximum LLM calls started per minute
+
+    Returns:
+        Directory summaries keyed by directory path ("" is the root); a
+        directory whose LLM call failed has an empty summary and `error` set
+    """
+    files = _repo_files(repo_docs)
+    if not files:
+        return {}
+
+    dirs = _build_tree(files)
+    cache_file = cache_file or _cache_file(repo_url)
+    cache = _load_cache(cache_file)
+
+    pending: set[str] = set()
+    for path, node in dirs.items():
+        cached = cache.get(path)
+        if cached and cached.get("hash") == node.content_hash:
+            node.summary = cached["summary"]
+        else:
+            pending.add(path)
+
+    if pending:
+        asyncio.run(_summarise_tree(
+            dirs,
+            files,
+            pending,
+            max_concurrency,
+            requests_per_minute,
+            lambda: _save_cache(cache_file, dirs),
+        ))
+    else:
+        _save_cache(cache_file, dirs)
+    return dirs
+
+
+def _file_link(repo_url: str, path: str) -> str:
+    """Markdown link to a file, clickable for GitHub repositories."""
+    if repo_url.startswith(("https://github.com/", "http://github.com/")):
+        base = repo_url.rstrip("/").removesuffix(".git")
+        return f"[{path}]({base}/blob/HEAD/{path})"
+    return f"`{path}`"
 
 
 def summarise_directories(
     repo_docs: list[Document],
     repo_url: str,
-    output_file: Path | None = None
+    output_file: Path | None = None,
+    *,
+    summaries: dict[str, DirectorySummary] | None = None,
 ) -> Path:
     """
     Generate directory summaries for a repository.
 
     Args:
-        repo_docs: List of documents from the repository (single consolidated doc from gitingest)
+        repo_docs: List of documents from the repository (one per file)
         repo_url: URL of the repository for generating links
         output_file: Optional custom output file path
+        summaries: Summaries already built by `build_directory_summaries`
 
     Returns:
         Path to the generated summary file
@@ -40,8 +328,10 @@ def summarise_directories(
     # Ensure output directory exists
     output_file.parent.mkdir(parents=True, exist_ok=True)
 
-    # With gitingest, we get a single consolidated document
-    if not repo_docs:
+    dirs = summaries if summaries is not None else build_directory_summaries(
+        repo_docs, repo_url
+    )
+    if not dirs:
         # Create minimal summary if no docs
         lines = [
             "# Repository Overview",
@@ -51,51 +341,19 @@ def summarise_directories(
         output_file.write_text("\n".join(lines))
         return output_file
 
-    # Get the first (and likely only) document
-    repo_doc = repo_docs[0]
-
-    llm = ChatOpenAI(model=LLM_MODEL_NAME, temperature=0.2)
-
-    # Extract directory structure from tree metadata if available
-    tree_structure = repo_doc.metadata.get("tree", "")
-
-    # Create a high-level summary using the consolidated content and tree structure
-    prompt = (
-        "You are generating documentation for an open-source repository. "
-        "Based on the repository content and file tree provided, write a comprehensive "
-        "overview of the project structure and main components (max 200 words).\n\n"
-        "Repository file tree:\n"
-        "-----\n"
-        f"{tree_structure[:1500]}...\n"  # Limit tree size
-        "-----\n\n"
-        "Repository content sample:\n"
-        "-----\n"
-        f"{repo_doc.page_content[:2000]}...\n"  # First 2000 chars
-        "-----"
-    )
-
-    response = llm.invoke(prompt)
-    summary_text = str(response.content).strip() if isinstance(response.content, str) else str(response.content)
-
     lines = [
         "# Repository Overview",
         f"_Auto-generated summary for {repo_url}_\n",
-        summary_text,
-        "\n## Project Structure",
+        dirs[""].summary,
+        "\n## Directories",
     ]
 
-    # Add tree structure if available
-    if tree_structure:
-        lines.append("```")
-        lines.append(tree_structure[:2000])  # Limit tree output
-        lines.append("```")
-
-    # Add repository summary from metadata
-    if repo_doc.metadata.get("summary"):
-        lines.extend([
-            "\n## Repository Summary",
-            repo_doc.metadata["summary"]
-        ])
+    for path in sorted(dirs):
+        node = dirs[path]
+        lines.extend([f"\n### {node.display_path}", node.summary])
+        if node.files:
+            lines.append("")
+            lines.extend(f"- {_file_link(repo_url, f)}" for f in node.files)
 
     output_file.write_text("\n".join(lines))
     return output_file
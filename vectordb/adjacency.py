@@ -0,0 +1,299 @@
+"""
+Adjacency index: which chunk comes before and after which.
+
+Every write records (document ID, chunk index) -> chunk ID in a small SQLite
+sidecar next to the collection's index. A search hit can then be widened to
+the chunks around it by looking their IDs up here and fetching them by ID,
+without another vector query. Hits from the same document whose widened
+ranges overlap are merged into one.
+"""
+from __future__ import annotations
+
+import sqlite3
+import threading
+from collections.abc import Iterator
+from contextlib import closing, contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+from config import STATS_SCAN_PAGE_SIZE
+from vectordb.sharding import chroma_stores
+
+# Not *.sqlite3, so it is not mistaken for part of a Chroma index
+ADJACENCY_FILE = "adjacency.db"
+
+# Serialises writers of the sidecar within a process
+_adjacency_lock = threading.Lock()
+
+_INSERT = "INSERT OR REPLACE INTO chunks (document_id, chunk_index, chunk_id) VALUES (?, ?, ?)"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    document_id TEXT NOT NULL,
+    chunk_index INTEGER NOT NULL,
+    chunk_id TEXT NOT NULL,
+    PRIMARY KEY (document_id, chunk_index)
+) WITHOUT ROWID
+"""
+
+
+@contextmanager
+def _connect(collection_path: Path) -> Iterator[sqlite3.Connection]:
+    """Open the sidecar, committing on success."""
+    with closing(sqlite3.connect(collection_path / ADJACENCY_FILE)) as conn:
+        with conn:
+            yield conn
+
+
+def _rows(chunks: list[tuple[str, dict[str, Any]]]) -> list[tuple[str, int, str]]:
+    """(document ID, chunk index, chunk ID) of chunks that carry positions."""
+    rows: list[tuple[str, int, str]] = []
+    for chunk_id, meta in chunks:
+        document_id = meta.get("document_id")
+        index = meta.get("chunk_index")
+        if document_id and isinstance(index, int):
+            rows.append((str(document_id), index, chunk_id))
+    return rows
+
+
+def has_adjacency(collection_path: Path) -> bool:
+    """Whether a collection directory has an adjacency index."""
+    return (collection_path / ADJACENCY_FILE).exists()
+
+
+def _write_rows(
+    conn: sqlite3.Connection,
+    chunks: list[tuple[str, dict[str, Any]]],
+) -> None:
+    """Upsert the positions of (chunk ID, metadata) pairs."""
+    conn.execute(_SCHEMA)
+    # A document that now has fewer chunks loses its trailing positions
+    totals = {
+        str(meta["document_id"]): meta["total_chunks"]
+        for _, meta in chunks
+        if meta.get("document_id") and isinstance(meta.get("total_chunks"), int)
+    }
+    conn.executemany(
+        "DELETE FROM chunks WHERE document_id = ? AND chunk_index >= ?",
+        totals.items(),
+    )
+    conn.executemany(_INSERT, _rows(chunks))
+
+
+def rebuild_adjacency(collection_path: Path, vs: VectorStore) -> None:
+    """
+    Build a collection's adjacency index from the stored chunk metadata.
+
+    Args:
+        collection_path: Directory of the collection
+        vs: The collection
+    """
+    with _adjacency_lock:
+        (collection_path / ADJACENCY_FILE).unlink(missing_ok=True)
+        with _connect(collection_path) as conn:
+            conn.execute(_SCHEMA)
+            for store in chroma_stores(vs):
+                offset = 0
+                while True:
+                    page = store.get(
+                        limit=STATS_SCAN_PAGE_SIZE, offset=offset, include=["metadatas"]
+                    )
+                    if not page["ids"]:
+                        break
+                    metas = [m or {} for m in page["metadatas"]]
+                    conn.executemany(
+                        _INSERT, _rows(list(zip(page["ids"], metas, strict=True)))
+                    )
+                    offset += len(page["ids"])
+
+
+def update_adjacency(collection_path: Path, vs: VectorStore, added: list[Document]) -> None:
+    """
+    Record the positions of chunks that were just written.
+
+    If the collection has no index yet (e.g. it predates adjacency indexes),
+    it is built with a full scan instead.
+
+    Args:
+        collection_path: Directory of the collection
+        vs: The collection, after the write
+        added: Chunks that were written
+    """
+    if not has_adjacency(collection_path):
+        rebuild_adjacency(collection_path, vs)
+        return
+    with _adjacency_lock, _connect(collection_path) as conn:
+        _write_rows(conn, [(d.id, d.metadata) for d in added if d.id])
+
+
+def remove_from_adjacency(collection_path: Path, chunk_ids: list[str]) -> None:
+    """Forget the positions of deleted chunks."""
+    if not chunk_ids or not has_adjacency(collection_path):
+        return
+    placeholders = ",".join("?" * len(chunk_ids))
+    with _adjacency_lock, _connect(collection_path) as conn:
+        conn.execute(f"DELETE FROM chunks WHERE chunk_id IN ({placeholders})", chunk_ids)
+
+
+def _lookup(
+    collection_path: Path,
+    ranges: list[tuple[str, int, int]],
+) -> dict[tuple[str, int], str]:
+    """Chunk IDs at the positions covered by (document ID, first, last) ranges."""
+    found: dict[tuple[str, int], str] = {}
+    if not has_adjacency(collection_path):
+        return found
+    with _connect(collection_path) as conn:
+        for document_id, first, last in ranges:
+            for index, chunk_id in conn.execute(
+                "SELECT chunk_index, chunk_id FROM chunks"
+                " WHERE document_id = ? AND chunk_index BETWEEN ? AND ?",
+                (document_id, first, last),
+            ):
+                found[(document_id, index)] = chunk_id
+    return found
+
+
+def _stitch(chunks: list[Document]) -> str:
+    """Join consecutive chunks, dropping the overlap between neighbours."""
+    parts: list[str] = []
+    end = -1
+    for chunk in chunks:
+        content = chunk.page_content
+        start = chunk.metadata.get("start_index")
+        known = isinstance(start, int) and start >= 0
+        if not parts:
+            parts.append(content)
+        elif known and end >= 0 and start <= end:
+            parts.append(content[end - start:])
+        else:
+            # Offsets unknown: keep the chunk whole rather than guess the overlap
+            parts.append("\n" + content)
+        end = start + len(content) if known else -1
+    return "".join(parts)
+
+
+@dataclass
+class _Span:
+    """Chunk range of one document covering one or more widened hits."""
+
+    document_id: str
+    first: int
+    last: int
+    # Ranks of the hits inside the range, and the hit chunks by chunk index
+    ranks: list[int]
+    hits: dict[int, Document]
+
+
+def _merged_spans(hits: list[tuple[Document, float]], neighbours: int) -> list[_Span]:
+    """Widen every positioned hit and merge ranges that overlap or touch."""
+    by_document: dict[str, list[_Span]] = {}
+    for rank, (doc, _) in enumerate(hits):
+        document_id = doc.metadata.get("document_id")
+        index = doc.metadata.get("chunk_index")
+        if not document_id or not isinstance(index, int):
+            continue
+        last = index + neighbours
+        total = doc.metadata.get("total_chunks")
+        if isinstance(total, int):
+            last = min(last, total - 1)
+        by_document.setdefault(str(document_id), []).append(
+            _Span(str(document_id), max(0, index - neighbours), last, [rank], {index: doc})
+        )
+
+    merged: list[_Span] = []
+    for spans in by_document.values():
+        spans.sort(key=lambda s: s.first)
+        current = spans[0]
+        for span in spans[1:]:
+            if span.first <= current.last + 1:
+                current.last = max(current.last, span.last)
+                current.ranks += span.ranks
+                current.hits.update(span.hits)
+            else:
+                merged.append(current)
+                current = span
+        merged.append(current)
+    return merged
+
+
+def expand_hits(
+    vs: VectorStore,
+    collection_path: Path,
+    hits: list[tuple[Document, float]],
+    neighbours: int,
+) -> list[tuple[Document, float]]:
+    """
+    Attach up to `neighbours` chunks on each side of every hit.
+
+    Hits of the same document whose widened ranges overlap or touch become
+    one hit, placed at the rank of the best of them. Chunks without position
+    metadata, or in collections without an adjacency index, are returned
+    unchanged.
+
+    Args:
+        vs: Collection the hits came from
+        collection_path: Directory of the collection version that was searched
+        hits: (document, relevance score) pairs, best first
+        neighbours: Chunks to add before and after each hit
+
+    Returns:
+        Widened hits, best first
+    """
+    if neighbours <= 0 or not hits or not has_adjacency(collection_path):
+        return hits
+
+    spans = _merged_spans(hits, neighbours)
+    positions = _lookup(collection_path, [(s.document_id, s.first, s.last) for s in spans])
+    wanted = [
+        chunk_id for (document_id, index), chunk_id in positions.items()
+        if not any(s.document_id == document_id and index in s.hits for s in spans)
+    ]
+
+    # One fetch by ID for every neighbour of every hit
+    fetched: dict[str, Document] = {}
+    if wanted:
+        found = vs.get(ids=wanted, include=["metadatas", "documents"])
+        for chunk_id, meta, text in zip(
+            found["ids"], found["metadatas"], found["documents"], strict=True
+        ):
+            fetched[chunk_id] = Document(page_content=text or "", metadata=meta or {})
+
+    widened: dict[int, tuple[Document, float] | None] = {}
+    for span in spans:
+        chunks: list[Document] = []
+        for index in range(span.first, span.last + 1):
+            chunk = span.hits.get(index)
+            if chunk is None:
+                chunk = fetched.get(positions.get((span.document_id, index), ""))
+            if chunk is not None:
+                chunks.append(chunk)
+        best = min(span.ranks)
+        doc, score = hits[best]
+        metadata = {
+            **doc.metadata,
+            "start_index": chunks[0].metadata.get("start_index", -1),
+            "chunk_range": [
+                chunks[0].metadata.get("chunk_index"),
+                chunks[-1].metadata.get("chunk_index"),
+            ],
+        }
+        widened[best] = (
+            Document(page_content=_stitch(chunks), metadata=metadata, id=doc.id),
+            score,
+        )
+        for rank in span.ranks:
+            if rank != best:
+                # Absorbed into the better-ranked hit
+                widened[rank] = None
+
+    result: list[tuple[Document, float]] = []
+    for rank, hit in enumerate(hits):
+        replacement = widened.get(rank, hit)
+        if replacement is not None:
+            result.append(replacement)
+    return result
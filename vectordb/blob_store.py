@@ -0,0 +1,374 @@
+"""
+Compressed, content-addressed store of the original files and pages.
+
+Ingest keeps a copy of every repository file and documentation page next to
+the collection, so a whole file can be served with a local read instead of
+being reassembled from search hits. The store has three parts:
+
+- `blobs.dat`: append-only data file. Each blob is split into frames of
+  `BLOB_FRAME_SIZE` raw bytes that are zlib-compressed independently, preceded
+  by a table of the compressed frame lengths. A range read only decompresses
+  the frames it overlaps.
+- `blobs.idx`: fixed-width records (SHA-256 digest, offset, stored length,
+  raw length) sorted by digest. It is memory-mapped and binary-searched.
+- `catalog.json`: maps repository paths and documentation URLs to digests.
+
+Identical content is stored once. A collection is written by one process at a
+time, so the store has a single writer.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from langchain_core.documents import Document
+
+from config import BLOB_FRAME_SIZE
+from vectordb.vector_store import collection_path, on_version_retired
+
+# Directory (inside the collection directory) holding the blob store
+BLOB_STORE_DIR = "blobs"
+
+# digest, offset in blobs.dat, stored length (frame table + frames), raw length
+_RECORD = struct.Struct("<32sQQQ")
+_COUNT = struct.Struct("<I")
+
+# Open stores, per collection
+_stores: dict[str, BlobStore] = {}
+_stores_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class BlobLocation:
+    """Where a blob lives in the data file."""
+
+    offset: int
+    stored_length: int
+    raw_length: int
+
+
+def blob_key(doc: Document) -> str | None:
+    """
+    Catalog key of an ingested repository file or documentation page.
+
+    Args:
+        doc: Document as returned by the repository ingestor or docs scraper
+
+    Returns:
+        "repo/<path>" or "docs/<url>", or None for documents of neither kind
+    """
+    meta = doc.metadata
+    if meta.get("source_type") == "repo" and meta.get("path"):
+        return f"repo/{meta['path']}"
+    if meta.get("source_type") == "docs" and meta.get("source"):
+        return f"docs/{meta['source']}"
+    return None
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+class BlobStore:
+    """
+    Blob store of one collection.
+
+    Args:
+        root: Directory holding the store's files
+    """
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        self.data_path = root / "blobs.dat"
+        self.index_path = root / "blobs.idx"
+        self.catalog_path = root / "catalog.json"
+        self._lock = threading.Lock()
+        # Index mapping and catalog, reloaded when a writer replaces them
+        self._index: mmap.mmap | bytes = b""
+        self._index_stamp: tuple[int, int] | None = None
+        self._catalog: dict[str, dict[str, Any]] = {}
+        self._catalog_stamp: tuple[int, int] | None = None
+
+    @staticmethod
+    def _stamp(path: Path) -> tuple[int, int] | None:
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _refresh(self) -> None:
+        """Pick up an index or catalog replaced since the last read."""
+        stamp = self._stamp(self.index_path)
+        if stamp != self._index_stamp:
+            if isinstance(self._index, mmap.mmap):
+                self._index.close()
+            self._index = b""
+            if stamp is not None and self.index_path.stat().st_size:
+                with open(self.index_path, "rb") as f:
+                    self._index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._index_stamp = stamp
+
+        stamp = self._stamp(self.catalog_path)
+        if stamp != self._catalog_stamp:
+            self._catalog = (
+                json.loads(self.catalog_path.read_text()) if stamp is not None else {}
+            )
+            self._catalog_stamp = stamp
+
+    def _find(self, digest: bytes) -> BlobLocation | None:
+        """Binary-search the index for a digest."""
+        index = self._index
+        lo, hi = 0, len(index) // _RECORD.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            record = _RECORD.unpack_from(index, mid * _RECORD.size)
+            if record[0] < digest:
+                lo = mid + 1
+            elif record[0] > digest:
+                hi = mid
+            else:
+                return BlobLocation(record[1], record[2], record[3])
+        return None
+
+    def catalog(self) -> dict[str, dict[str, Any]]:
+        """All catalog entries by key."""
+        with self._lock:
+            self._refresh()
+            return self._catalog
+
+    def put(self, entries: list[tuple[str, dict[str, Any], str]]) -> int:
+        """
+        Store contents and point catalog keys at them.
+
+        Args:
+            entries: (catalog key, extra catalog fields, content) triples
+
+        Returns:
+            Number of blobs that were not stored yet
+        """
+        with self._lock:
+            self._refresh()
+            self.root.mkdir(parents=True, exist_ok=True)
+
+            records = {r[0]: r[1:] for r in _RECORD.iter_unpack(self._index)}
+            catalog = dict(self._catalog)
+            added = 0
+
+            with open(self.data_path, "ab") as data:
+                for key, fields, content in entries:
+                    raw = content.encode()
+                    digest = hashlib.sha256(raw).digest()
+                    if digest not in records:
+                        frames = [
+                            zlib.compress(raw[i:i + BLOB_FRAME_SIZE])
+                            for i in range(0, len(raw), BLOB_FRAME_SIZE)
+                        ]
+                        table = _COUNT.pack(len(frames)) + b"".join(
+                            _COUNT.pack(len(frame)) for frame in frames
+                        )
+                        offset = data.tell()
+                        data.write(table)
+                        data.writelines(frames)
+                        records[digest] = (
+                            offset,
+                            len(table) + sum(len(f) for f in frames),
+                            len(raw),
+                        )
+                        added += 1
+                    catalog[key] = {**fields, "digest": digest.hex(), "size": len(raw)}
+                data.flush()
+                os.fsync(data.fileno())
+
+            # Data first, then the index, then the catalog that refers to it
+            index = b"".join(
+                _RECORD.pack(digest, *records[digest]) for digest in sorted(records)
+            )
+            _write_atomic(self.index_path, index)
+            _write_atomic(self.catalog_path, json.dumps(catalog).encode())
+            return added
+
+    def forget(self, keys: list[str]) -> int:
+        """
+        Drop catalog entries, e.g. of pages that no longer exist.
+
+        The content stays in the data file, where other keys may share it.
+
+        Args:
+            keys: Catalog keys to drop
+
+        Returns:
+            Number of entries dropped
+        """
+        with self._lock:
+            self._refresh()
+            drop = set(keys)
+            catalog = {k: v for k, v in self._catalog.items() if k not in drop}
+            removed = len(self._catalog) - len(catalog)
+            if removed:
+                _write_atomic(self.catalog_path, json.dumps(catalog).encode())
+            return removed
+
+    def close(self) -> None:
+        """Unmap the index; the store reopens it if it is read again."""
+        with self._lock:
+            if isinstance(self._index, mmap.mmap):
+                self._index.close()
+            self._index = b""
+            self._index_stamp = None
+
+    def read(self, key: str, start: int = 0, end: int | None = None) -> bytes | None:
+        """
+        Read all or part of a stored file or page.
+
+        Args:
+            key: Catalog key (see `blob_key`)
+            start: First byte to return
+            end: Byte after the last one to return (end of content if None)
+
+        Returns:
+            The requested bytes, or None if the key is not in the catalog
+        """
+        with self._lock:
+            self._refresh()
+            entry = self._catalog.get(key)
+            if entry is None:
+                return None
+            location = self._find(bytes.fromhex(entry["digest"]))
+        if location is None:
+            return None
+
+        end = location.raw_length if end is None else min(end, location.raw_length)
+        start = max(0, start)
+        if start >= end:
+            return b""
+
+        first = start // BLOB_FRAME_SIZE
+        last = (end - 1) // BLOB_FRAME_SIZE
+        with open(self.data_path, "rb") as data:
+            (count,) = _COUNT.unpack(os.pread(data.fileno(), _COUNT.size, location.offset))
+            table = os.pread(data.fileno(), _COUNT.size * count, location.offset + _COUNT.size)
+            lengths = [n for (n,) in _COUNT.iter_unpack(table)]
+
+            # Frames are laid out back to back after the table
+            position = location.offset + _COUNT.size * (count + 1) + sum(lengths[:first])
+            compressed = os.pread(data.fileno(), sum(lengths[first:last + 1]), position)
+
+        parts: list[bytes] = []
+        for length in lengths[first:last + 1]:
+            parts.append(zlib.decompress(compressed[:length]))
+            compressed = compressed[length:]
+        raw = b"".join(parts)
+        offset = first * BLOB_FRAME_SIZE
+        return raw[start - offset:end - offset]
+
+
+def get_blob_store(collection_name: str) -> BlobStore:
+    """
+    Open a collection's blob store once per process.
+
+    Args:
+        collection_name: Name of the collection
+
+    Returns:
+        The store (empty if nothing was stored yet)
+    """
+    root = collection_path(collection_name) / BLOB_STORE_DIR
+    with _stores_lock:
+        store = _stores.get(collection_name)
+        # A new collection version has its own store
+        if store is None or store.root != root:
+            if store is not None:
+                store.close()
+            store = BlobStore(root)
+            _stores[collection_name] = store
+        return store
+
+
+def _close_stores(version_dir: Path) -> None:
+    """Close the store of a version that is no longer read."""
+    with _stores_lock:
+        for name, store in list(_stores.items()):
+            if store.root.parent == version_dir:
+                store.close()
+                del _stores[name]
+
+
+on_version_retired(_close_stores)
+
+
+def store_documents(collection_name: str, docs: list[Document]) -> int:
+    """
+    Keep the original contents of ingested files and pages.
+
+    Args:
+        collection_name: Collection the documents were ingested into
+        docs: Repository files and/or documentation pages
+
+    Returns:
+        Number of new blobs written (unchanged content is not stored again)
+    """
+    entries: list[tuple[str, dict[str, Any], str]] = []
+    for doc in docs:
+        key = blob_key(doc)
+        if key is None:
+            continue
+        fields = {
+            name: doc.metadata[name]
+            for name in ("source_type", "repo", "path", "source", "title")
+            if doc.metadata.get(name) is not None
+        }
+        entries.append((key, fields, doc.page_content))
+    if not entries:
+        return 0
+    return get_blob_store(collection_name).put(entries)
+
+
+def forget_pages(collection_name: str, urls: list[str]) -> int:
+    """
+    Stop serving documentation pages that were removed from their site.
+
+    Args:
+        collection_name: Collection the pages were ingested into
+        urls: Page URLs
+
+    Returns:
+        Number of catalog entries dropped
+    """
+    if not urls:
+        return 0
+    return get_blob_store(collection_name).forget([f"docs/{url}" for url in urls])
+
+
+def forget_files(collection_name: str, repo: str, paths: set[str]) -> int:
+    """
+    Stop serving files that were deleted from a repository.
+
+    Args:
+        collection_name: Collection the repository was ingested into
+        repo: Repository URL or path, as stored in the catalog
+        paths: Paths of the files the repository has now
+
+    Returns:
+        Number of catalog entries dropped
+    """
+    store = get_blob_store(collection_name)
+    stale = [
+        key for key, entry in store.catalog().items()
+        if key.startswith("repo/")
+        and entry.get("repo") == repo
+        and entry.get("path") not in paths
+    ]
+    if not stale:
+        return 0
+    return store.forget(stale)
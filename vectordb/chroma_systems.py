@@ -0,0 +1,69 @@
+"""
+Release of the Chroma systems cached for persist directories.
+
+chromadb keeps one `System` per persist directory (holding its SQLite
+connection and loaded HNSW indexes) in a process-wide cache for the life of
+the process. Its public API cannot drop a single one: `clear_system_cache`
+forgets all of them, which breaks every open client, and `reset` deletes the
+data. Retired collection versions are therefore released through the private
+cache, and this module is the only place that touches it. It does so only for
+chromadb versions it was checked against; with any other version the systems
+stay cached, which costs memory but never correctness.
+"""
+from __future__ import annotations
+
+from collections.abc import Callable
+from typing import Any
+
+import chromadb
+
+# chromadb releases (major, minor) whose system cache layout is known: from
+# the first with `chromadb.api.shared_system_client` up to the locked 1.0.x
+_SUPPORTED_VERSIONS = ((0, 5), (1, 0))
+
+
+def _major_minor(version: str) -> tuple[int, int] | None:
+    try:
+        major, minor = version.split(".")[:2]
+        return int(major), int(minor)
+    except ValueError:
+        return None
+
+
+def _system_cache() -> dict[str, Any] | None:
+    """chromadb's systems by persist directory, if this version is supported."""
+    release = _major_minor(chromadb.__version__)
+    low, high = _SUPPORTED_VERSIONS
+    if release is None or not low <= release <= high:
+        return None
+    try:
+        from chromadb.api.shared_system_client import SharedSystemClient
+    except ImportError:
+        return None
+    cache = getattr(SharedSystemClient, "_identifier_to_system", None)
+    return cache if isinstance(cache, dict) else None
+
+
+def release_systems(matches: Callable[[str], bool]) -> int:
+    """
+    Stop and forget the cached Chroma systems of some persist directories.
+
+    Clients of a released directory must not be used afterwards; a new client
+    for it starts a fresh system.
+
+    Args:
+        matches: Called with each cached persist directory; True releases it
+
+    Returns:
+        Number of systems released (0 if the chromadb version is unsupported)
+    """
+    cache = _system_cache()
+    if cache is None:
+        return 0
+    released = 0
+    for identifier in [i for i in list(cache) if matches(i)]:
+        system = cache.pop(identifier, None)
+        if system is not None:
+            system.stop()
+            released += 1
+    return released
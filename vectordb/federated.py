@@ -0,0 +1,225 @@
+"""
+Federated search across many collections.
+
+The query is embedded once and sent to every collection concurrently. Each
+collection's distances are converted to relevance scores in [0, 1] with the
+normalisation matching its distance metric, so hits from different
+collections can be merged into one global top-k. Collections that do not
+answer within the timeout are left out of the response instead of holding
+it up.
+
+Searches run on a pool of `FEDERATED_MAX_WORKERS` threads shared by all
+searches. A collection waits at most the timeout for a free thread, and its
+timeout to answer starts when its search starts. A search that times out
+cannot be interrupted; it is abandoned and finishes in the background. A
+collection with `FEDERATED_MAX_ABANDONED` abandoned searches still running is
+skipped until one of them finishes, so a consistently slow collection cannot
+take over the pool.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any
+
+from langchain_core.documents import Document
+
+from config import (
+    COARSE_TOP_N,
+    FEDERATED_COLLECTION_TIMEOUT,
+    FEDERATED_MAX_ABANDONED,
+    FEDERATED_MAX_WORKERS,
+)
+from vectordb.adjacency import expand_hits
+from vectordb.filters import and_filters
+from vectordb.summary_tier import path_scope_filter
+from vectordb.vector_store import get_embedder, reading_collection, store_directory
+
+_executor = ThreadPoolExecutor(
+    max_workers=FEDERATED_MAX_WORKERS, thread_name_prefix="federated-search"
+)
+
+# Timed-out searches still running, per collection
+_abandoned: Counter[str] = Counter()
+_abandoned_lock = threading.Lock()
+
+
+@dataclass
+class FederatedResult:
+    """Merged hits plus the collections that could not contribute."""
+
+    hits: list[tuple[Document, float]] = field(default_factory=list)
+    timed_out: list[str] = field(default_factory=list)
+    failed: dict[str, str] = field(default_factory=dict)
+
+    @property
+    def documents(self) -> list[Document]:
+        """Hit documents, best first."""
+        return [doc for doc, _ in self.hits]
+
+
+def _search_collection(
+    collection: str,
+    embedding: list[float],
+    k: int,
+    where: dict[str, Any] | None,
+    coarse_to_fine: bool = False,
+    neighbours: int = 0,
+) -> list[tuple[Document, float]]:
+    """Search one collection and return normalised relevance scores."""
+    with reading_collection(collection) as vs:
+        if vs is None:
+            raise LookupError(f"Collection '{collection}' not found")
+
+        relevance = vs._select_relevance_score_fn()
+        hits: list[tuple[Document, float]] = []
+        scope = None
+        if coarse_to_fine:
+            # The tier of the version held here, not of the live one
+            scope = path_scope_filter(
+                collection, store_directory(vs), embedding, COARSE_TOP_N
+            )
+        if scope is not None:
+            # Fine search only within the paths picked from the summary tier
+            hits = vs.similarity_search_by_vector_with_relevance_scores(
+                embedding, k=k, filter=and_filters(where, scope)
+            )
+        if not hits:
+            # No summary tier, or nothing relevant inside the scoped paths
+            hits = vs.similarity_search_by_vector_with_relevance_scores(
+                embedding, k=k, filter=where
+            )
+
+        scored: list[tuple[Document, float]] = []
+        for doc, distance in hits:
+            doc.metadata["collection"] = collection
+            scored.append((doc, min(1.0, max(0.0, relevance(distance)))))
+        # Neighbours come from the same version as the hits
+        return expand_hits(vs, store_directory(vs), scored, neighbours)
+
+
+@dataclass
+class _Search:
+    """One collection's search within a federated search."""
+
+    name: str
+    queued_at: float
+    future: Future | None = None
+    started_at: float | None = None
+
+    def deadline(self, timeout: float) -> float:
+        """When to give up: `timeout` after the search started, or was queued."""
+        start = self.started_at if self.started_at is not None else self.queued_at
+        return start + timeout
+
+
+def _start_search(
+    search: _Search,
+    embedding: list[float],
+    k: int,
+    where: dict[str, Any] | None,
+    coarse_to_fine: bool,
+    neighbours: int,
+) -> None:
+    """Queue one collection's search on the shared pool."""
+
+    def run() -> list[tuple[Document, float]]:
+        search.started_at = time.monotonic()
+        return _search_collection(
+            search.name, embedding, k, where, coarse_to_fine, neighbours
+        )
+
+    search.future = _executor.submit(run)
+
+
+def _abandon(search: _Search) -> None:
+    """Leave a timed-out search running, counted until it finishes."""
+    with _abandoned_lock:
+        _abandoned[search.name] += 1
+
+    def finished(_: Future) -> None:
+        with _abandoned_lock:
+            _abandoned[search.name] -= 1
+            if _abandoned[search.name] <= 0:
+                del _abandoned[search.name]
+
+    assert search.future is not None
+    search.future.add_done_callback(finished)
+
+
+def federated_search(
+    query: str,
+    collections: list[str],
+    k: int = 6,
+    where: dict[str, Any] | None = None,
+    timeout: float = FEDERATED_COLLECTION_TIMEOUT,
+    coarse_to_fine: bool = False,
+    neighbours: int = 0,
+) -> FederatedResult:
+    """
+    Search several collections concurrently and merge the hits.
+
+    Args:
+        query: Query text
+        collections: Collections to search
+        k: Number of merged results to return
+        where: Optional Chroma metadata filter applied in every collection
+        timeout: Seconds each collection may wait for a free thread, and
+            then to answer once its search starts, before it is left out
+        coarse_to_fine: Scope each collection's search to the directories and
+            files its summary tier ranks highest
+        neighbours: Attach this many neighbouring chunks on each side of
+            every hit, merging hits whose context overlaps
+
+    Returns:
+        Global top-k hits with relevance scores, plus skipped collections
+    """
+    result = FederatedResult()
+    if not collections:
+        return result
+
+    embedding = get_embedder().embed_query(query)
+
+    now = time.monotonic()
+    searches: dict[Future, _Search] = {}
+    for name in collections:
+        with _abandoned_lock:
+            busy = _abandoned[name] >= FEDERATED_MAX_ABANDONED
+        if busy:
+            result.failed[name] = "Still running earlier searches that timed out"
+            continue
+        search = _Search(name, now)
+        _start_search(search, embedding, k, where, coarse_to_fine, neighbours)
+        assert search.future is not None
+        searches[search.future] = search
+
+    merged: list[tuple[Document, float]] = []
+    while searches:
+        next_deadline = min(search.deadline(timeout) for search in searches.values())
+        done, _ = wait(
+            searches,
+            timeout=max(0.0, next_deadline - time.monotonic()),
+            return_when=FIRST_COMPLETED,
+        )
+        for future in done:
+            search = searches.pop(future)
+            try:
+                merged.extend(future.result())
+            except Exception as e:
+                result.failed[search.name] = str(e)
+
+        now = time.monotonic()
+        for future, search in list(searches.items()):
+            if search.deadline(timeout) <= now:
+                del searches[future]
+                result.timed_out.append(search.name)
+                # Still queued: drop it; otherwise let it finish in the background
+                if not future.cancel():
+                    _abandon(search)
+
+    merged.sort(key=lambda hit: -hit[1])
+    result.hits = merged[:k]
+    return result
@@ -0,0 +1,86 @@
+"""
+Build Chroma metadata filters (`where` clauses) from search options.
+"""
+from __future__ import annotations
+
+from typing import Any
+
+from processing.languages import normalise_extension
+
+
+def split_values(value: str | list[str] | None) -> list[str] | None:
+    """
+    Normalise a filter argument given as a list or comma-separated string.
+
+    Args:
+        value: e.g. ["src", "tests"] or "src,tests"
+
+    Returns:
+        Non-empty stripped values, or None if there are none
+    """
+    if value is None:
+        return None
+    items = value.split(",") if isinstance(value, str) else value
+    values = [str(v).strip() for v in items if str(v).strip()]
+    return values or None
+
+
+def build_filter(
+    source_type: str | None = None,
+    paths: list[str] | None = None,
+    *,
+    languages: list[str] | None = None,
+    extensions: list[str] | None = None,
+    top_level_dirs: list[str] | None = None,
+) -> dict[str, Any] | None:
+    """
+    Combine optional search restrictions into a single Chroma `where` clause.
+
+    The clause is applied inside the vector query, so restricted searches
+    return the top-k among matching chunks rather than filtering afterwards.
+
+    Args:
+        source_type: Restrict to "repo" or "docs" chunks
+        paths: Restrict to chunks of these exact file paths (URL paths for docs)
+        languages: Restrict to these languages (e.g. "python", "docs")
+        extensions: Restrict to these file extensions (with or without dot)
+        top_level_dirs: Restrict to files under these top-level directories
+            ("." for files at the repository root)
+
+    Returns:
+        Chroma filter dictionary, or None when nothing is restricted
+    """
+    clauses: list[dict[str, Any] | None] = []
+    if source_type:
+        clauses.append({"source_type": source_type})
+    if paths:
+        clauses.append({"path": {"$in": list(paths)}})
+    if languages:
+        clauses.append({"language": {"$in": [lang.lower() for lang in languages]}})
+    if extensions:
+        clauses.append(
+            {"extension": {"$in": [normalise_extension(e) for e in extensions]}}
+        )
+    if top_level_dirs:
+        dirs = [d.strip("/") or "." for d in top_level_dirs]
+        clauses.append({"top_level_dir": {"$in": dirs}})
+
+    return and_filters(*clauses)
+
+
+def and_filters(*clauses: dict[str, Any] | None) -> dict[str, Any] | None:
+    """
+    Combine Chroma `where` clauses so that all of them must match.
+
+    Args:
+        clauses: Filters to combine; None entries are ignored
+
+    Returns:
+        Combined filter, or None when no clause is given
+    """
+    present = [c for c in clauses if c]
+    if not present:
+        return None
+    if len(present) == 1:
+        return present[0]
+    return {"$and": present}
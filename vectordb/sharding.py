@@ -0,0 +1,521 @@
+"""
+Sharded Chroma collections for corpora too large for a single index.
+
+A sharded collection keeps a `shards.json` manifest in its directory under
+`VECTOR_STORE_DIR` and one Chroma persist directory per shard next to it:
+
+    <collection>/shards.json
+    <collection>/shard-000/
+    <collection>/shard-001/
+    ...
+
+Chunks are routed to a shard either by a hash of the chunk ID ("hash", the
+most even spread) or by a hash of the file path / page URL they came from
+("source", which keeps all chunks of a document together). Queries run on
+every shard in parallel and the hits are merged into a global top-k.
+Rebalancing copies stored embeddings between shards, so changing the shard
+count never re-embeds anything.
+"""
+from __future__ import annotations
+
+import json
+import os
+import re
+import shutil
+import uuid
+import zlib
+from collections.abc import Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+
+from langchain_community.vectorstores import Chroma
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+MANIFEST_NAME = "shards.json"
+SHARD_STRATEGIES = ("hash", "source")
+
+# Chroma names its on-disk segment directories after UUIDs
+_SEGMENT_DIR_RE = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
+
+# Page size used when copying stored vectors between shards
+_REBALANCE_PAGE_SIZE = 500
+
+# Shared across sharded stores so parallel shard queries reuse threads
+_executor = ThreadPoolExecutor(thread_name_prefix="shard-query")
+
+
+def _shard_dir_name(index: int) -> str:
+    return f"shard-{index:03d}"
+
+
+def is_sharded(collection_path: Path) -> bool:
+    """
+    Check whether a collection directory holds a sharded collection.
+
+    Args:
+        collection_path: Directory of the collection
+
+    Returns:
+        True if a shard manifest is present
+    """
+    return (collection_path / MANIFEST_NAME).exists()
+
+
+def read_manifest(collection_path: Path) -> dict[str, Any]:
+    """
+    Read the shard manifest of a collection.
+
+    Args:
+        collection_path: Directory of the collection
+
+    Returns:
+        Manifest with `strategy` and the list of `shards` directory names
+    """
+    manifest: dict[str, Any] = json.loads(
+        (collection_path / MANIFEST_NAME).read_text()
+    )
+    return manifest
+
+
+def write_manifest(collection_path: Path, manifest: dict[str, Any]) -> None:
+    """
+    Atomically replace the shard manifest of a collection.
+
+    Args:
+        collection_path: Directory of the collection
+        manifest: Manifest to write
+    """
+    collection_path.mkdir(parents=True, exist_ok=True)
+    tmp = collection_path / f"{MANIFEST_NAME}.tmp"
+    tmp.write_text(json.dumps(manifest, indent=2))
+    os.replace(tmp, collection_path / MANIFEST_NAME)
+
+
+def shard_for(
+    chunk_id: str,
+    metadata: dict[str, Any] | None,
+    num_shards: int,
+    strategy: str,
+) -> int:
+    """
+    Pick the shard a chunk belongs to.
+
+    Args:
+        chunk_id: ID the chunk is stored under
+        metadata: Chunk metadata (used by the "source" strategy)
+        num_shards: Number of shards in the collection
+        strategy: "hash" or "source"
+
+    Returns:
+        Index of the target shard
+    """
+    key = chunk_id
+    if strategy == "source" and metadata:
+        # Docs pages also carry a URL path; their full URL is the source
+        key = str(metadata.get("source") or metadata.get("path") or chunk_id)
+    return zlib.crc32(key.encode()) % num_shards
+
+
+class ShardedVectorStore(VectorStore):
+    """
+    A vector store spread over several Chroma persist directories.
+
+    Args:
+        collection_name: Name of the collection (shared by all shards)
+        collection_path: Directory holding the manifest and shard directories
+        embedding_function: Embedding model used for queries and new texts
+    """
+
+    def __init__(
+        self,
+        collection_name: str,
+        collection_path: Path,
+        embedding_function: Embeddings,
+    ) -> None:
+        self.collection_name = collection_name
+        self.collection_path = collection_path
+        self._embedding_function = embedding_function
+
+        manifest = read_manifest(collection_path)
+        self.strategy: str = manifest["strategy"]
+        self.shards: list[Chroma] = [
+            Chroma(
+                collection_name=collection_name,
+                embedding_function=embedding_function,
+                persist_directory=str(collection_path / name),
+            )
+            for name in manifest["shards"]
+        ]
+
+    @classmethod
+    def create(
+        cls,
+        collection_name: str,
+        collection_path: Path,
+        embedding_function: Embeddings,
+        num_shards: int,
+        strategy: str = "hash",
+    ) -> ShardedVectorStore:
+        """
+        Create an empty sharded collection.
+
+        Args:
+            collection_name: Name of the collection
+            collection_path: Directory to create the shards in
+            embedding_function: Embedding model for the collection
+            num_shards: Number of shards
+            strategy: Routing strategy, "hash" or "source"
+
+        Returns:
+            The new sharded store
+        """
+        if num_shards < 1:
+            raise ValueError("A sharded collection needs at least one shard")
+        if strategy not in SHARD_STRATEGIES:
+            raise ValueError(f"Unknown shard strategy: {strategy}")
+
+        write_manifest(collection_path, {
+            "strategy": strategy,
+            "shards": [_shard_dir_name(i) for i in range(num_shards)],
+        })
+        return cls(collection_name, collection_path, embedding_function)
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding_function
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: list[str],
+        embedding: Embeddings,
+        metadatas: list[dict] | None = None,
+        *,
+        collection_name: str,
+        collection_path: Path,
+        num_shards: int,
+        strategy: str = "hash",
+        ids: list[str] | None = None,
+        **kwargs: Any,
+    ) -> ShardedVectorStore:
+        """
+        Create a sharded collection and add texts to it.
+
+        Args:
+            texts: Texts to add
+            embedding: Embedding model for the collection
+            metadatas: Optional metadata per text
+            collection_name: Name of the collection
+            collection_path: Directory to create the shards in
+            num_shards: Number of shards
+            strategy: Routing strategy, "hash" or "source"
+            ids: Optional chunk IDs per text
+
+        Returns:
+            The new sharded store
+        """
+        store = cls.create(
+            collection_name, collection_path, embedding, num_shards, strategy
+        )
+        store.add_texts(texts, metadatas, ids=ids)
+        return store
+
+    def _route(self, ids: list[str], metadatas: list[dict]) -> dict[int, list[int]]:
+        """Group item positions by target shard."""
+        groups: dict[int, list[int]] = {}
+        for i, (chunk_id, meta) in enumerate(zip(ids, metadatas, strict=True)):
+            shard = shard_for(chunk_id, meta, len(self.shards), self.strategy)
+            groups.setdefault(shard, []).append(i)
+        return groups
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: list[dict] | None = None,
+        *,
+        ids: list[str] | None = None,
+        **kwargs: Any,
+    ) -> list[str]:
+        """Embed texts once and upsert each one into its shard."""
+        texts = list(texts)
+        if ids is None:
+            ids = [str(uuid.uuid4()) for _ in texts]
+        ids = [chunk_id or str(uuid.uuid4()) for chunk_id in ids]
+        metas = list(metadatas) if metadatas else [{} for _ in texts]
+        embeddings = self._embedding_function.embed_documents(texts)
+
+        for shard, positions in self._route(ids, metas).items():
+            self.shards[shard]._collection.upsert(
+                ids=[ids[i] for i in positions],
+                embeddings=[embeddings[i] for i in positions],
+                documents=[texts[i] for i in positions],
+                metadatas=[metas[i] or None for i in positions],  # type: ignore[misc]
+            )
+        return ids
+
+    def delete(self, ids: list[str] | None = None, **kwargs: Any) -> None:
+        """Delete chunks by ID (and/or `where` filter) from every shard."""
+        for shard in self.shards:
+            shard._collection.delete(ids=ids, where=kwargs.get("where"))
+
+    def get(self, **kwargs: Any) -> dict[str, Any]:
+        """Concatenate the `Collection.get` results of every shard."""
+        merged: dict[str, Any] = {}
+        for shard in self.shards:
+            result = shard.get(**kwargs)
+            for key, value in result.items():
+                if isinstance(value, list):
+                    merged.setdefault(key, []).extend(value)
+                else:
+                    merged.setdefault(key, value)
+        return merged
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        return self.shards[0]._select_relevance_score_fn()
+
+    def query_by_vectors(
+        self,
+        embeddings: list[list[float]],
+        k: int,
+        where: dict[str, Any] | None = None,
+    ) -> list[list[tuple[Document, float]]]:
+        """
+        Run several vector queries on all shards and merge per query.
+
+        Args:
+            embeddings: Query vectors
+            k: Results per query
+            where: Optional Chroma metadata filter
+
+        Returns:
+            For each query, the global top-k (document, distance) pairs
+        """
+        def query_shard(shard: Chroma) -> dict[str, Any]:
+            return dict(shard._collection.query(
+                query_embeddings=embeddings,  # type: ignore[arg-type]
+                n_results=k,
+                where=where,
+                include=["documents", "metadatas", "distances"],  # type: ignore[list-item]
+            ))
+
+        responses = list(_executor.map(query_shard, self.shards))
+
+        merged: list[list[tuple[Document, float]]] = [[] for _ in embeddings]
+        for response in responses:
+            for row in range(len(embeddings)):
+                for chunk_id, text, meta, dist in zip(
+                    response["ids"][row],
+                    response["documents"][row],
+                    response["metadatas"][row],
+                    response["distances"][row],
+                    strict=True,
+                ):
+                    doc = Document(page_content=text, metadata=meta or {}, id=chunk_id)
+                    merged[row].append((doc, dist))
+
+        return [sorted(hits, key=lambda hit: hit[1])[:k] for hits in merged]
+
+    def similarity_search_by_vector_with_relevance_scores(
+        self,
+        embedding: list[float],
+        k: int = 4,
+        filter: dict[str, Any] | None = None,
+        **kwargs: Any,
+    ) -> list[tuple[Document, float]]:
+        """Return the global top-k across shards with distances."""
+        return self.query_by_vectors([embedding], k, filter)[0]
+
+    def similarity_search_with_score(
+        self,
+        query: str,
+        k: int = 4,
+        filter: dict[str, Any] | None = None,
+        **kwargs: Any,
+    ) -> list[tuple[Document, float]]:
+        """Embed the query once and search all shards in parallel."""
+        embedding = self._embedding_function.embed_query(query)
+        return self.query_by_vectors([embedding], k, filter)[0]
+
+    def similarity_search(
+        self,
+        query: str,
+        k: int = 4,
+        filter: dict[str, Any] | None = None,
+        **kwargs: Any,
+    ) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def similarity_search_by_vector(
+        self,
+        embedding: list[float],
+        k: int = 4,
+        filter: dict[str, Any] | None = None,
+        **kwargs: Any,
+    ) -> list[Document]:
+        hits = self.query_by_vectors([embedding], k, filter)[0]
+        return [doc for doc, _ in hits]
+
+    def _similarity_search_with_relevance_scores(
+        self,
+        query: str,
+        k: int = 4,
+        **kwargs: Any,
+    ) -> list[tuple[Document, float]]:
+        relevance = self._select_relevance_score_fn()
+        hits = self.similarity_search_with_score(query, k, kwargs.get("filter"))
+        return [(doc, relevance(dist)) for doc, dist in hits]
+
+    def __len__(self) -> int:
+        return sum(shard._collection.count() for shard in self.shards)
+
+
+def chroma_stores(vs: VectorStore) -> list[Chroma]:
+    """
+    The Chroma indexes making up a collection.
+
+    Paged scans must go through these one by one: `ShardedVectorStore.get`
+    applies `limit` and `offset` to every shard.
+    """
+    if isinstance(vs, ShardedVectorStore):
+        return vs.shards
+    return [vs]  # type: ignore[list-item]
+
+
+def _move_entries(
+    source: Chroma,
+    targets: list[Chroma],
+    strategy: str,
+    keep_index: int | None,
+) -> int:
+    """
+    Copy the entries of one shard to the shards they now belong to.
+
+    Args:
+        source: Store to move entries out of
+        targets: Shards of the new layout
+        strategy: Routing strategy of the new layout
+        keep_index: Index of `source` in `targets`, if it remains a shard
+
+    Returns:
+        Number of entries moved
+    """
+    moved = 0
+    offset = 0
+    while True:
+        page = source._collection.get(
+            include=["embeddings", "documents", "metadatas"],  # type: ignore[list-item]
+            limit=_REBALANCE_PAGE_SIZE,
+            offset=offset,
+        )
+        ids = page["ids"]
+        if not ids:
+            break
+
+        groups: dict[int, list[int]] = {}
+        for i, chunk_id in enumerate(ids):
+            meta = page["metadatas"][i] if page["metadatas"] else None
+            shard = shard_for(chunk_id, dict(meta or {}), len(targets), strategy)
+            if shard != keep_index:
+                groups.setdefault(shard, []).append(i)
+
+        embeddings = page["embeddings"]
+        for shard, positions in groups.items():
+            targets[shard]._collection.upsert(
+                ids=[ids[i] for i in positions],
+                embeddings=[embeddings[i] for i in positions],  # type: ignore[index]
+                documents=[page["documents"][i] for i in positions],  # type: ignore[index]
+                metadatas=[page["metadatas"][i] for i in positions],  # type: ignore[index]
+            )
+
+        leaving = [ids[i] for positions in groups.values() for i in positions]
+        if leaving:
+            source._collection.delete(ids=leaving)
+            moved += len(leaving)
+        # Entries that stayed keep their place; the ones that left shift the page
+        offset += len(ids) - len(leaving)
+
+    return moved
+
+
+def rebalance(
+    collection_name: str,
+    collection_path: Path,
+    embedding_function: Embeddings,
+    num_shards: int,
+    strategy: str | None = None,
+) -> int:
+    """
+    Change the shard count or routing strategy without re-embedding.
+
+    An unsharded collection is converted in place: its entries are moved into
+    the new shards and the original index files are removed.
+
+    Args:
+        collection_name: Name of the collection
+        collection_path: Directory of the collection
+        embedding_function: Embedding model of the collection
+        num_shards: Desired number of shards
+        strategy: New routing strategy (defaults to the current one)
+
+    Returns:
+        Number of entries that moved to a different shard
+    """
+    if num_shards < 1:
+        raise ValueError("A sharded collection needs at least one shard")
+
+    sharded = is_sharded(collection_path)
+    old_names: list[str] = []
+    if sharded:
+        manifest = read_manifest(collection_path)
+        old_names = manifest["shards"]
+        strategy = strategy or manifest["strategy"]
+    strategy = strategy or "hash"
+    if strategy not in SHARD_STRATEGIES:
+        raise ValueError(f"Unknown shard strategy: {strategy}")
+
+    new_names = [_shard_dir_name(i) for i in range(num_shards)]
+    targets = [
+        Chroma(
+            collection_name=collection_name,
+            embedding_function=embedding_function,
+            persist_directory=str(collection_path / name),
+        )
+        for name in new_names
+    ]
+
+    moved = 0
+    if sharded:
+        for name in old_names:
+            keep = new_names.index(name) if name in new_names else None
+            source = targets[keep] if keep is not None else Chroma(
+                collection_name=collection_name,
+                embedding_function=embedding_function,
+                persist_directory=str(collection_path / name),
+            )
+            moved += _move_entries(source, targets, strategy, keep)
+    else:
+        legacy = Chroma(
+            collection_name=collection_name,
+            embedding_function=embedding_function,
+            persist_directory=str(collection_path),
+        )
+        moved += _move_entries(legacy, targets, strategy, None)
+
+    write_manifest(collection_path, {"strategy": strategy, "shards": new_names})
+
+    # Remove what is no longer part of the layout: dropped shards, or the
+    # index files of a collection that has just been converted
+    for entry in collection_path.iterdir():
+        if entry.name in new_names:
+            continue
+        if entry.is_dir() and entry.name in old_names:
+            shutil.rmtree(entry, ignore_errors=True)
+        elif not sharded and entry.is_dir() and _SEGMENT_DIR_RE.match(entry.name):
+            shutil.rmtree(entry, ignore_errors=True)
+        elif not sharded and entry.name == "chroma.sqlite3":
+            entry.unlink(missing_ok=True)
+
+    return moved
@@ -0,0 +1,465 @@
+"""
+Exact statistics of a collection, kept in a sidecar next to its index.
+
+Statistics are built once by paging through the stored metadata and text
+(never the embeddings) and then updated incrementally on every write. The
+counters live in a small SQLite database, so a write only touches the
+counters of the chunks it adds or removes, however large the collection is.
+Totals are kept in a single row and reads load only the largest per-path and
+per-document counts, so reading the statistics does not grow with the
+collection either.
+"""
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+from collections import Counter
+from collections.abc import Iterator
+from contextlib import closing, contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+from config import STATS_SCAN_PAGE_SIZE
+from processing.languages import language_for_path
+from vectordb.sharding import chroma_stores
+from vectordb.versions import is_control_entry
+
+# Not *.sqlite3, so it is not mistaken for part of a Chroma index
+STATS_FILE = "stats.db"
+# Sidecar of collections written before the counters moved to SQLite
+LEGACY_STATS_FILE = "stats.json"
+
+# Serialises writers of the sidecar within a process
+_stats_lock = threading.Lock()
+
+# One row per counter entry, indexed by size for top-N reads, and a single
+# row of totals (including the number of distinct documents and paths)
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS counts (
+    category TEXT NOT NULL,
+    key TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (category, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS counts_by_count ON counts (category, count);
+CREATE TABLE IF NOT EXISTS totals (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    chunks INTEGER NOT NULL,
+    characters INTEGER NOT NULL,
+    documents INTEGER NOT NULL,
+    paths INTEGER NOT NULL
+);
+"""
+
+_UPSERT = """
+INSERT INTO counts (category, key, count) VALUES (?, ?, ?)
+ON CONFLICT (category, key) DO UPDATE SET count = count + excluded.count
+"""
+
+_COUNTERS = ("source_types", "languages", "paths", "documents", "chunk_sizes")
+
+# Counters that can grow with the collection, and the field counting their keys
+_LARGE_COUNTERS = {"paths": "unique_paths", "documents": "unique_documents"}
+
+
+def _percentile(sizes: Counter[int], fraction: float) -> int:
+    """Chunk size below which `fraction` of the chunks fall."""
+    target = fraction * sum(sizes.values())
+    seen = 0
+    for size in sorted(sizes):
+        seen += sizes[size]
+        if seen >= target:
+            return size
+    return 0
+
+
+def _bump(counter: Counter[Any], key: Any, count: int) -> None:
+    """Adjust a count, dropping the key once its last chunk is removed."""
+    counter[key] += count
+    if counter[key] <= 0:
+        del counter[key]
+
+
+def _categories(metadata: dict[str, Any], text: str) -> list[tuple[str, Any]]:
+    """(counter, key) pairs a chunk is counted under."""
+    path = metadata.get("path")
+    source_type = metadata.get("source_type") or "unknown"
+    language = metadata.get("language") or (
+        language_for_path(path) if path and source_type == "repo" else source_type
+    )
+    document = (
+        metadata.get("document_id")
+        or metadata.get("source")
+        or path
+        or "unknown"
+    )
+    categories: list[tuple[str, Any]] = [
+        ("source_types", source_type),
+        ("languages", language),
+        ("documents", document),
+        ("chunk_sizes", len(text)),
+    ]
+    if path is not None and source_type == "repo":
+        categories.append(("paths", path))
+    return categories
+
+
+@dataclass
+class CollectionStats:
+    """Chunk counts by category and the distribution of chunk sizes."""
+
+    chunks: int = 0
+    characters: int = 0
+    source_types: Counter[str] = field(default_factory=Counter)
+    languages: Counter[str] = field(default_factory=Counter)
+    paths: Counter[str] = field(default_factory=Counter)
+    documents: Counter[str] = field(default_factory=Counter)
+    # Exact chunk length (characters) -> number of chunks with that length
+    chunk_sizes: Counter[int] = field(default_factory=Counter)
+    # Distinct paths and documents; `paths` and `documents` may hold only the
+    # largest entries (see `read_stats`)
+    unique_paths: int = 0
+    unique_documents: int = 0
+    # Bytes on disk; measured when read, not stored in the sidecar
+    index_bytes: int = 0
+
+    def add(self, metadata: dict[str, Any], text: str, count: int = 1) -> None:
+        """
+        Count one chunk in (or, with `count=-1`, out of) the statistics.
+
+        Args:
+            metadata: Chunk metadata
+            text: Chunk content
+            count: +1 to add the chunk, -1 to remove it
+        """
+        self.chunks += count
+        self.characters += count * len(text)
+        for name, key in _categories(metadata, text):
+            counter = getattr(self, name)
+            had = key in counter
+            _bump(counter, key, count)
+            if name in _LARGE_COUNTERS:
+                unique = _LARGE_COUNTERS[name]
+                setattr(self, unique, getattr(self, unique) + (key in counter) - had)
+
+    def size_summary(self) -> dict[str, float]:
+        """Minimum, maximum, mean and percentiles of the chunk sizes."""
+        if not self.chunks:
+            return {"min": 0, "max": 0, "mean": 0, "p50": 0, "p90": 0, "p99": 0}
+        return {
+            "min": min(self.chunk_sizes),
+            "max": max(self.chunk_sizes),
+            "mean": round(self.characters / self.chunks, 1),
+            "p50": _percentile(self.chunk_sizes, 0.5),
+            "p90": _percentile(self.chunk_sizes, 0.9),
+            "p99": _percentile(self.chunk_sizes, 0.99),
+        }
+
+    def to_dict(self, top: int | None = None) -> dict[str, Any]:
+        """
+        JSON-serialisable form.
+
+        Args:
+            top: Paths and documents listed (all that are loaded if None)
+        """
+        return {
+            "chunks": self.chunks,
+            "characters": self.characters,
+            "unique_paths": self.unique_paths,
+            "unique_documents": self.unique_documents,
+            "source_types": dict(self.source_types.most_common()),
+            "languages": dict(self.languages.most_common()),
+            "paths": dict(self.paths.most_common(top)),
+            "documents": dict(self.documents.most_common(top)),
+            "chunk_sizes": {str(k): v for k, v in sorted(self.chunk_sizes.items())},
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> CollectionStats:
+        """Inverse of `to_dict` (also reads the legacy JSON sidecar)."""
+        paths = Counter(data["paths"])
+        documents = Counter(data["documents"])
+        return cls(
+            chunks=data["chunks"],
+            characters=data["characters"],
+            source_types=Counter(data["source_types"]),
+            languages=Counter(data["languages"]),
+            paths=paths,
+            documents=documents,
+            chunk_sizes=Counter({int(k): v for k, v in data["chunk_sizes"].items()}),
+            unique_paths=data.get("unique_paths", len(paths)),
+            unique_documents=data.get("unique_documents", len(documents)),
+        )
+
+
+def scan_collection(vs: VectorStore) -> CollectionStats:
+    """
+    Compute statistics by paging through every stored chunk.
+
+    Only metadata and text are fetched; embeddings are never loaded.
+
+    Args:
+        vs: Collection to scan
+
+    Returns:
+        Exact statistics of the collection
+    """
+    stats = CollectionStats()
+    for store in chroma_stores(vs):
+        offset = 0
+        while True:
+            page = store.get(
+                limit=STATS_SCAN_PAGE_SIZE,
+                offset=offset,
+                include=["metadatas", "documents"],
+            )
+            if not page["ids"]:
+                break
+            for meta, text in zip(page["metadatas"], page["documents"], strict=True):
+                stats.add(meta or {}, text or "")
+            offset += len(page["ids"])
+    return stats
+
+
+def stored_chunks(vs: VectorStore, ids: list[str]) -> list[tuple[dict[str, Any], str]]:
+    """
+    Metadata and text of the chunks among `ids` that are already stored.
+
+    Args:
+        vs: Collection to look in
+        ids: Chunk IDs about to be written or deleted
+
+    Returns:
+        (metadata, text) of every stored chunk
+    """
+    if not ids:
+        return []
+    found = vs.get(ids=ids, include=["metadatas", "documents"])
+    return [
+        (meta or {}, text or "")
+        for meta, text in zip(found["metadatas"], found["documents"], strict=True)
+    ]
+
+
+@contextmanager
+def _connect(collection_path: Path) -> Iterator[sqlite3.Connection]:
+    """Open the sidecar, committing on success."""
+    with closing(sqlite3.connect(collection_path / STATS_FILE)) as conn:
+        with conn:
+            conn.executescript(_SCHEMA)
+            yield conn
+
+
+def _totals(conn: sqlite3.Connection) -> tuple[int, int, int, int] | None:
+    """(chunks, characters, documents, paths), or None if never written."""
+    return conn.execute(
+        "SELECT chunks, characters, documents, paths FROM totals"
+    ).fetchone()
+
+
+def _present(conn: sqlite3.Connection, keys: list[tuple[str, str]]) -> set[tuple[str, str]]:
+    """The (category, key) pairs among `keys` that have a count row."""
+    return {
+        key for key in keys
+        if conn.execute(
+            "SELECT 1 FROM counts WHERE category = ? AND key = ?", key
+        ).fetchone()
+    }
+
+
+def _read_legacy(collection_path: Path) -> CollectionStats | None:
+    """Statistics from a JSON sidecar of an older collection, if it has one."""
+    legacy_path = collection_path / LEGACY_STATS_FILE
+    if not legacy_path.exists():
+        return None
+    return CollectionStats.from_dict(json.loads(legacy_path.read_text()))
+
+
+def read_stats(collection_path: Path, top: int | None = None) -> CollectionStats | None:
+    """
+    Read a collection's statistics sidecar.
+
+    Args:
+        collection_path: Directory of the collection
+        top: Largest per-path and per-document counts to load (all if None);
+            the number of distinct paths and documents is always exact
+
+    Returns:
+        Stored statistics or None if there is no sidecar yet
+    """
+    if not (collection_path / STATS_FILE).exists():
+        return _read_legacy(collection_path)
+
+    with _connect(collection_path) as conn:
+        totals = _totals(conn)
+        if totals is None:
+            return _read_legacy(collection_path)
+        stats = CollectionStats(
+            chunks=totals[0],
+            characters=totals[1],
+            unique_documents=totals[2],
+            unique_paths=totals[3],
+        )
+        for category in _COUNTERS:
+            limit = top if category in _LARGE_COUNTERS and top is not None else -1
+            for key, count in conn.execute(
+                "SELECT key, count FROM counts WHERE category = ?"
+                " ORDER BY count DESC, key LIMIT ?",
+                (category, limit),
+            ):
+                if category == "chunk_sizes":
+                    stats.chunk_sizes[int(key)] = count
+                else:
+                    getattr(stats, category)[key] = count
+    return stats
+
+
+def write_stats(collection_path: Path, stats: CollectionStats) -> None:
+    """Replace a collection's statistics sidecar."""
+    rows = []
+    for name in _COUNTERS:
+        rows.extend((name, str(key), count) for key, count in getattr(stats, name).items())
+    with _connect(collection_path) as conn:
+        conn.execute("DELETE FROM counts")
+        conn.execute("DELETE FROM totals")
+        conn.executemany(_UPSERT, rows)
+        conn.execute(
+            "INSERT INTO totals VALUES (0, ?, ?, ?, ?)",
+            (stats.chunks, stats.characters, stats.unique_documents, stats.unique_paths),
+        )
+    (collection_path / LEGACY_STATS_FILE).unlink(missing_ok=True)
+
+
+def rebuild_stats(collection_path: Path, vs: VectorStore) -> CollectionStats:
+    """
+    Rebuild a collection's statistics sidecar with a full scan.
+
+    Args:
+        collection_path: Directory of the collection
+        vs: The collection
+
+    Returns:
+        The new statistics
+    """
+    with _stats_lock:
+        stats = scan_collection(vs)
+        write_stats(collection_path, stats)
+    return stats
+
+
+def update_stats(
+    collection_path: Path,
+    vs: VectorStore,
+    added: list[Document] | None = None,
+    replaced: list[tuple[dict[str, Any], str]] | None = None,
+) -> None:
+    """
+    Apply a write to a collection's statistics.
+
+    If the collection has no sidecar yet (e.g. it predates statistics), it is
+    built with a full scan instead.
+
+    Args:
+        collection_path: Directory of the collection
+        vs: The collection, after the write
+        added: Chunks that were written
+        replaced: (metadata, text) of chunks overwritten or deleted by the write
+    """
+    changes = [(meta, text, -1) for meta, text in replaced or []]
+    changes += [(doc.metadata, doc.page_content, 1) for doc in added or []]
+
+    with _stats_lock:
+        written = False
+        if (collection_path / STATS_FILE).exists():
+            with _connect(collection_path) as conn:
+                written = _totals(conn) is not None
+        if not written:
+            # First write since statistics (or their SQLite form) existed
+            stats = _read_legacy(collection_path)
+            if stats is None:
+                stats = scan_collection(vs)
+            else:
+                for meta, text, count in changes:
+                    stats.add(meta, text, count)
+            write_stats(collection_path, stats)
+            return
+
+        chunks = characters = 0
+        deltas: Counter[tuple[str, str]] = Counter()
+        for meta, text, count in changes:
+            chunks += count
+            characters += count * len(text)
+            for name, key in _categories(meta, text):
+                deltas[(name, str(key))] += count
+        touched = [key for key, count in deltas.items() if count]
+        keyed = [key for key in touched if key[0] in _LARGE_COUNTERS]
+        with _connect(collection_path) as conn:
+            before = _present(conn, keyed)
+            conn.executemany(_UPSERT, [(*key, deltas[key]) for key in touched])
+            # Entries whose last chunk was removed are dropped, as in `add`
+            conn.executemany(
+                "DELETE FROM counts WHERE category = ? AND key = ? AND count <= 0",
+                touched,
+            )
+            after = _present(conn, keyed)
+            unique = Counter(category for category, _ in after - before)
+            unique.subtract(category for category, _ in before - after)
+            conn.execute(
+                "UPDATE totals SET chunks = chunks + ?, characters = characters + ?,"
+                " documents = documents + ?, paths = paths + ?",
+                (chunks, characters, unique["documents"], unique["paths"]),
+            )
+
+
+def index_bytes(collection_path: Path) -> int:
+    """Bytes the collection occupies on disk."""
+    return sum(
+        f.stat().st_size
+        for f in collection_path.rglob("*")
+        if f.is_file() and not is_control_entry(f, collection_path)
+    )
+
+
+def format_stats(collection: str, stats: CollectionStats, top: int = 10) -> str:
+    """
+    Render statistics for the terminal.
+
+    Args:
+        collection: Collection name
+        stats: Statistics to show
+        top: Entries listed per category
+
+    Returns:
+        Multi-line report
+    """
+    sizes = stats.size_summary()
+    lines = [
+        f"📊 Collection '{collection}' Statistics:",
+        f"Total chunks: {stats.chunks}",
+        f"Documents: {stats.unique_documents}",
+        f"Unique file paths: {stats.unique_paths}",
+        f"Index size: {stats.index_bytes / 1_048_576:.1f} MiB",
+        (
+            f"Chunk size (chars): min {sizes['min']}, p50 {sizes['p50']}, "
+            f"p90 {sizes['p90']}, p99 {sizes['p99']}, max {sizes['max']}, "
+            f"mean {sizes['mean']}"
+        ),
+    ]
+    sections = (
+        ("Source types", stats.source_types),
+        ("Languages", stats.languages),
+        ("Top paths", stats.paths),
+        ("Top documents", stats.documents),
+    )
+    for title, counter in sections:
+        if not counter:
+            continue
+        lines.append(f"{title}:")
+        for name, count in counter.most_common(top):
+            lines.append(f"  - {name}: {count} chunks")
+    return "\n".join(lines)
@@ -0,0 +1,250 @@
+"""
+Coarse summary tier for two-stage (coarse-to-fine) retrieval.
+
+The directory summaries produced at ingest time, plus a short digest of every
+file, are embedded into a separate small Chroma collection stored next to the
+chunk collection. A two-stage search first asks this tier which directories
+and files are relevant, then runs the chunk search only within those paths.
+
+Each collection version has its own tier. Searches read the tier of the
+version they hold, so the scope and the chunks always come from the same
+version, and a version's tier is closed when the version is retired.
+
+A collection may hold several repositories (e.g. from a batch manifest).
+Tier entries carry their repository, so each repository's run replaces only
+its own entries and a scope names (repository, path) pairs.
+"""
+from __future__ import annotations
+
+import hashlib
+import threading
+from pathlib import Path
+from typing import Any
+
+from langchain_community.vectorstores import Chroma
+from langchain_core.documents import Document
+
+from config import COARSE_FILE_DIGEST_CHARS, COARSE_MAX_PATHS
+from summaries.dir_summarizer import DirectorySummary
+from vectordb.filters import and_filters
+from vectordb.vector_store import collection_path, get_embedder, on_version_retired
+
+# Directory (inside the collection directory) holding the summary tier
+SUMMARY_TIER_DIR = "summary-tier"
+
+# Open tiers, and the (repository, file path) pairs they cover, by tier directory
+_tiers: dict[Path, Chroma] = {}
+_file_paths: dict[Path, list[tuple[str, str]]] = {}
+_lock = threading.Lock()
+
+
+def _tier_name(collection_name: str) -> str:
+    return f"{collection_name}__summaries"
+
+
+def _new_tier(collection_name: str, tier_path: Path) -> Chroma:
+    return Chroma(
+        collection_name=_tier_name(collection_name),
+        embedding_function=get_embedder(),
+        persist_directory=str(tier_path),
+    )
+
+
+def _open_tier(collection_name: str, version_dir: Path) -> Chroma | None:
+    """Open the summary tier of a collection version, if it has one."""
+    tier_path = version_dir / SUMMARY_TIER_DIR
+    with _lock:
+        tier = _tiers.get(tier_path)
+        if tier is None and tier_path.exists():
+            tier = _tiers[tier_path] = _new_tier(collection_name, tier_path)
+        return tier
+
+
+def _close_tiers(version_dir: Path) -> None:
+    """Forget the tier of a version that is no longer read."""
+    tier_path = version_dir / SUMMARY_TIER_DIR
+    with _lock:
+        _tiers.pop(tier_path, None)
+        _file_paths.pop(tier_path, None)
+
+
+on_version_retired(_close_tiers)
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def build_summary_tier(
+    collection_name: str,
+    repo: str,
+    summaries: dict[str, DirectorySummary],
+    repo_docs: list[Document],
+) -> int:
+    """
+    Store a repository's directory summaries and file digests as the coarse tier.
+
+    Only entries whose text changed are embedded again, and entries of the
+    repository's directories and files that no longer exist are deleted.
+    Entries of other repositories in the collection are left alone.
+
+    Args:
+        collection_name: Chunk collection the tier belongs to
+        repo: Repository the summaries describe (as in the chunk metadata)
+        summaries: Directory summaries from `build_directory_summaries`
+        repo_docs: Repository documents, one per file
+
+    Returns:
+        Number of the repository's entries in the tier
+    """
+    contents = {
+        str(d.metadata.get("path", "")).strip("/"): d.page_content
+        for d in repo_docs
+    }
+
+    entries: list[Document] = []
+    for path, node in summaries.items():
+        entries.append(Document(
+            id=f"dir:{repo}:{path}",
+            page_content=(
+                f"Directory {node.display_path}\n{node.summary}\n"
+                f"Files: {', '.join(node.files)}"
+            ),
+            metadata={"kind": "directory", "repo": repo, "path": path},
+        ))
+        for file_path in node.files:
+            head = contents.get(file_path, "")[:COARSE_FILE_DIGEST_CHARS]
+            entries.append(Document(
+                id=f"file:{repo}:{file_path}",
+                page_content=(
+                    f"File {file_path}\n"
+                    f"In {node.display_path}: {node.summary}\n{head}"
+                ),
+                metadata={"kind": "file", "repo": repo, "path": file_path, "dir": path},
+            ))
+    for entry in entries:
+        entry.metadata["digest"] = _digest(entry.page_content)
+
+    # Built in the version being written, which no query reads yet
+    tier = _new_tier(collection_name, collection_path(collection_name) / SUMMARY_TIER_DIR)
+
+    # The tier is small, so read all of it: entries without a repository
+    # predate per-repository tiers and are replaced as well
+    stored = tier.get(include=["metadatas"])
+    digests: dict[str, str | None] = {}
+    stale: list[str] = []
+    for entry_id, meta in zip(stored["ids"], stored["metadatas"], strict=True):
+        meta = meta or {}
+        if meta.get("repo") == repo:
+            digests[entry_id] = meta.get("digest")
+        elif "repo" not in meta:
+            stale.append(entry_id)
+
+    current = {e.id for e in entries if e.id}
+    stale += [entry_id for entry_id in digests if entry_id not in current]
+    if stale:
+        tier.delete(ids=stale)
+    changed = [e for e in entries if digests.get(e.id or "") != e.metadata["digest"]]
+    batch_size = 100
+    for i in range(0, len(changed), batch_size):
+        tier.add_documents(changed[i:i + batch_size])
+    return len(entries)
+
+
+def _tier_file_paths(tier_path: Path, tier: Chroma) -> list[tuple[str, str]]:
+    """All (repository, file path) pairs covered by a tier, cached per tier."""
+    with _lock:
+        cached = _file_paths.get(tier_path)
+    if cached is not None:
+        return cached
+
+    result = tier.get(where={"kind": "file"}, include=["metadatas"])
+    paths = sorted(
+        (str(m.get("repo", "")), str(m["path"])) for m in result["metadatas"] if m
+    )
+    with _lock:
+        _file_paths[tier_path] = paths
+    return paths
+
+
+def scope_paths(
+    collection_name: str,
+    version_dir: Path,
+    embedding: list[float],
+    top_n: int,
+) -> list[tuple[str, str]] | None:
+    """
+    Pick the files worth searching for a query.
+
+    Args:
+        collection_name: Chunk collection to scope
+        version_dir: Directory of the collection version being searched
+            (`store_directory` of the store the query holds)
+        embedding: Query embedding
+        top_n: Number of summary entries to take from the tier
+
+    Returns:
+        (repository, file path) pairs of the best matching files and of every
+        file under the best matching directories, or None if the collection
+        has no summary tier
+    """
+    tier = _open_tier(collection_name, version_dir)
+    if tier is None:
+        return None
+
+    hits = tier.similarity_search_by_vector(embedding, k=top_n)
+    if not hits:
+        return None
+
+    all_files: list[tuple[str, str]] | None = None
+    scoped: dict[tuple[str, str], None] = {}
+    for hit in hits:
+        repo = str(hit.metadata.get("repo", ""))
+        path = str(hit.metadata.get("path", ""))
+        if hit.metadata.get("kind") == "file":
+            scoped[(repo, path)] = None
+            continue
+        if not path:
+            # The repository root covers every file and scopes nothing
+            continue
+
+        if all_files is None:
+            all_files = _tier_file_paths(version_dir / SUMMARY_TIER_DIR, tier)
+        scoped.update(
+            ((r, p), None) for r, p in all_files
+            if r == repo and p.startswith(f"{path}/")
+        )
+
+    return list(scoped)[:COARSE_MAX_PATHS] or None
+
+
+def path_scope_filter(
+    collection_name: str,
+    version_dir: Path,
+    embedding: list[float],
+    top_n: int,
+) -> dict[str, Any] | None:
+    """
+    Build a `where` clause restricting a search to the scoped paths.
+
+    Args:
+        collection_name: Chunk collection to scope
+        version_dir: Directory of the collection version being searched
+        embedding: Query embedding
+        top_n: Number of summary entries to take from the tier
+
+    Returns:
+        Filter on `repo` and `path`, or None when the search should not be
+        scoped
+    """
+    scoped = scope_paths(collection_name, version_dir, embedding, top_n)
+    if not scoped:
+        return None
+    by_repo: dict[str, list[str]] = {}
+    for repo, path in scoped:
+        by_repo.setdefault(repo, []).append(path)
+    clauses = [
+        and_filters({"repo": repo} if repo else None, {"path": {"$in": paths}})
+        for repo, paths in by_repo.items()
+    ]
+    return clauses[0] if len(clauses) == 1 else {"$or": clauses}
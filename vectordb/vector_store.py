@@ -1,62 +1,363 @@
 """
 Vector store helpers for Chroma.
+
+Collections are versioned (see `vectordb.versions`): writes go to a new
+version that replaces the live one atomically when complete, and readers in
+long-running processes move to the new version on their next query.
 """
 from __future__ import annotations
 
+import fnmatch
+import hashlib
+import os
+import threading
+from collections.abc import Callable, Container, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
 # Type imports handled by __future__ annotations
 from langchain_community.vectorstores import Chroma
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 from langchain_openai import OpenAIEmbeddings
 
-from config import EMBED_MODEL_NAME, VECTOR_STORE_DIR
+from config import (
+    EMBED_BATCH_SIZE,
+    EMBED_MODEL_NAME,
+    STATS_TOP_ENTRIES,
+    VECTOR_STORE_DIR,
+)
+from processing.snippets import estimate_tokens
+from vectordb.adjacency import remove_from_adjacency, update_adjacency
+from vectordb.chroma_systems import release_systems
+from vectordb.sharding import ShardedVectorStore, is_sharded, rebalance
+from vectordb.stats import (
+    CollectionStats,
+    index_bytes,
+    read_stats,
+    rebuild_stats,
+    scan_collection,
+    stored_chunks,
+    update_stats,
+)
+from vectordb.versions import (
+    add_lease,
+    collect_garbage,
+    create_version,
+    current_version,
+    is_control_entry,
+    mark_staging,
+    publish_version,
+    remove_lease,
+    version_path,
+    writer_lock,
+)
+
+
+class MeteredEmbeddings(Embeddings):
+    """
+    Embedding model wrapper that counts usage and can apply a rate budget.
+
+    Args:
+        inner: The embedding model doing the actual work
+    """
+
+    def __init__(self, inner: Embeddings) -> None:
+        self.inner = inner
+        self.texts_embedded = 0
+        # Called with the estimated token count before every request
+        self.throttle: Callable[[int], None] | None = None
+
+    def _before_request(self, texts: list[str]) -> None:
+        if self.throttle is not None:
+            self.throttle(sum(estimate_tokens(t) for t in texts))
+        self.texts_embedded += len(texts)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        self._before_request(texts)
+        return self.inner.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        self._before_request([text])
+        return self.inner.embed_query(text)
+
+
+_embedder = MeteredEmbeddings(OpenAIEmbeddings(model=EMBED_MODEL_NAME))
+
+# A collection is either a single Chroma index or a set of Chroma shards
+CollectionStore = Chroma | ShardedVectorStore
+
+
+@dataclass
+class _Reader:
+    """A collection version opened for queries by this process."""
+
+    root: Path
+    path: Path
+    store: CollectionStore
+    # Queries currently using the version
+    active: int = 0
+    # Superseded by a newer version; closed when the last query finishes
+    retired: bool = False
+
+
+# Collection versions opened by long-running processes, shared between callers
+_readers: dict[str, _Reader] = {}
+_opening: set[tuple[str, Path]] = set()
+_readers_lock = threading.Lock()
+
+# Opens newly published versions and deletes retired ones in the background,
+# so queries never wait for either
+_opener = ThreadPoolExecutor(max_workers=2, thread_name_prefix="collection-open")
+
+# Callbacks dropping per-version caches (see `on_version_retired`)
+_retire_hooks: list[Callable[[Path], None]] = []
+
+# Collections whose writes, in the current context, go to a version being built
+_staging: ContextVar[dict[str, Path]] = ContextVar("staging", default={})
+
+
+def get_embedder() -> Embeddings:
+    """Get the embedding model shared by all collections."""
+    return _embedder
+
+
+def set_embedding_throttle(throttle: Callable[[int], None] | None) -> None:
+    """
+    Install a callback that blocks until an embedding request may proceed.
+
+    Args:
+        throttle: Called with the estimated tokens of each request, or None
+            to remove the current throttle
+    """
+    if isinstance(_embedder, MeteredEmbeddings):
+        _embedder.throttle = throttle
+
+
+def collection_root(collection_name: str) -> Path:
+    """Directory holding all versions of a collection."""
+    return VECTOR_STORE_DIR / collection_name
+
+
+def _published_path(collection_name: str) -> Path:
+    """Directory of the live version of a collection."""
+    root = collection_root(collection_name)
+    return version_path(root, current_version(root))
+
+
+def collection_path(collection_name: str) -> Path:
+    """
+    Directory holding a collection's index and its sidecar data.
+
+    Inside `staging_collection` this is the version being built; elsewhere it
+    is the live version.
+
+    Args:
+        collection_name: Name of the collection
+
+    Returns:
+        Path of the collection directory (which may not exist yet)
+    """
+    staged = _staging.get().get(collection_name)
+    if staged is not None:
+        return staged
+    return _published_path(collection_name)
+
+
+def _has_index(path: Path) -> bool:
+    """Whether a collection directory contains a (possibly sharded) index."""
+    return is_sharded(path) or (path / "chroma.sqlite3").exists()
+
+
+def list_collections() -> list[str]:
+    """
+    List the collections that exist under the vector store directory.
+
+    Returns:
+        Sorted collection names
+    """
+    if not VECTOR_STORE_DIR.exists():
+        return []
+    return sorted(
+        d.name for d in VECTOR_STORE_DIR.iterdir()
+        if d.is_dir() and _has_index(_published_path(d.name))
+    )
+
+
+def resolve_collections(spec: str | list[str]) -> list[str]:
+    """
+    Expand collection names and glob patterns into existing collections.
+
+    Args:
+        spec: A name or glob (e.g. "org-*"), a comma-separated list of them,
+            or a list of them
+
+    Returns:
+        Matching collection names, in order of first match, without duplicates
+    """
+    patterns = spec.split(",") if isinstance(spec, str) else spec
+    available = list_collections()
+
+    resolved: list[str] = []
+    for pattern in (p.strip() for p in patterns):
+        if not pattern:
+            continue
+        if any(ch in pattern for ch in "*?["):
+            matches = fnmatch.filter(available, pattern)
+        else:
+            matches = [pattern] if pattern in available else []
+        resolved.extend(m for m in matches if m not in resolved)
+    return resolved
+
+
+def collection_version(collection_name: str) -> str | None:
+    """
+    Identify the current contents of a collection.
+
+    The version changes whenever documents are written to the collection, so
+    anything derived from its contents can be invalidated by comparing it.
+
+    Args:
+        collection_name: Name of the collection
+
+    Returns:
+        Opaque version string or None if the collection does not exist
+    """
+    path = collection_path(collection_name)
+    if not path.exists():
+        return None
+
+    # Shards keep their index files one level down
+    stamps = [path.name] + [
+        f"{f.relative_to(path)}:{f.stat().st_mtime_ns}:{f.stat().st_size}"
+        for f in sorted(path.glob("**/*.sqlite3"))
+        if not is_control_entry(f, path)
+    ]
+    return hashlib.sha1("|".join(stamps).encode()).hexdigest()[:16]
 
-_embedder = OpenAIEmbeddings(model=EMBED_MODEL_NAME)
+
+def collections_version(collection_names: list[str]) -> str | None:
+    """
+    Identify the current contents of several collections together.
+
+    Args:
+        collection_names: Names of the collections
+
+    Returns:
+        Opaque version string that changes when any of the collections
+        changes, or None if none of them exists
+    """
+    versions = [
+        f"{name}:{version}"
+        for name in sorted(collection_names)
+        if (version := collection_version(name)) is not None
+    ]
+    if not versions:
+        return None
+    return hashlib.sha1("|".join(versions).encode()).hexdigest()[:16]
+
+
+def _add_in_batches(
+    vs: CollectionStore,
+    path: Path,
+    docs: list[Document],
+    skip: Container[int] = (),
+    on_batch: Callable[[int, int], None] | None = None,
+) -> None:
+    """
+    Embed and write documents batch by batch.
+
+    Args:
+        vs: Collection to write to
+        path: Directory of the collection
+        docs: Documents to add
+        skip: Start offsets of batches that are already stored
+        on_batch: Called with the (start, end) range of every batch written
+    """
+    for i in range(0, len(docs), EMBED_BATCH_SIZE):
+        if i in skip:
+            continue
+        batch = docs[i:i + EMBED_BATCH_SIZE]
+        # Chunks being overwritten are counted out of the statistics
+        replaced = stored_chunks(vs, [d.id for d in batch if d.id])
+        vs.add_documents(batch)
+        if isinstance(vs, Chroma):
+            vs.persist()
+        update_stats(path, vs, batch, replaced)
+        update_adjacency(path, vs, batch)
+        if on_batch is not None:
+            on_batch(i, i + len(batch))
 
 
-def build_vector_store(docs: list[Document], collection_name: str) -> Chroma:
+def build_vector_store(
+    docs: list[Document],
+    collection_name: str,
+    *,
+    shards: int | None = None,
+    shard_strategy: str = "hash",
+    skip: Container[int] = (),
+    on_batch: Callable[[int, int], None] | None = None,
+) -> CollectionStore:
     """
     Create a new vector store from documents.
 
     Args:
         docs: Documents to embed and store
         collection_name: Name for the collection
+        shards: Split the collection over this many shards (unsharded if None)
+        shard_strategy: Route chunks to shards by "hash" of chunk ID or by
+            "source" file/page
+        skip: Start offsets of batches of `docs` that are already stored
+        on_batch: Called with the (start, end) range of every batch written
 
     Returns:
-        Chroma vector store instance
+        Chroma vector store instance, or a sharded store if `shards` is set
     """
-    # Process documents in batches to avoid OpenAI token limits
-    batch_size = 100  # Process 100 documents at a time
-    
-    if not docs:
-        # Create empty vector store if no documents
+    vs: CollectionStore
+    if shards:
+        vs = ShardedVectorStore.create(
+            collection_name,
+            collection_path(collection_name),
+            _embedder,
+            shards,
+            shard_strategy,
+        )
+    else:
         vs = Chroma(
             collection_name=collection_name,
             embedding_function=_embedder,
-            persist_directory=str(VECTOR_STORE_DIR / collection_name),
+            persist_directory=str(collection_path(collection_name)),
         )
         vs.persist()
-        return vs
-    
-    # Create initial vector store with first batch
-    first_batch = docs[:batch_size]
-    vs = Chroma.from_documents(
-        first_batch,
-        embedding=_embedder,
-        collection_name=collection_name,
-        persist_directory=str(VECTOR_STORE_DIR / collection_name),
-    )
-    vs.persist()
-    
-    # Add remaining documents in batches
-    for i in range(batch_size, len(docs), batch_size):
-        batch = docs[i:i + batch_size]
-        vs.add_documents(batch)
-        vs.persist()
-    
+
+    # Process documents in batches to avoid OpenAI token limits
+    _add_in_batches(vs, collection_path(collection_name), docs, skip, on_batch)
     return vs
 
 
-def load_vector_store(collection_name: str) -> Chroma | None:
+def _open_path(collection_name: str, path: Path) -> CollectionStore | None:
+    """Open the index in a collection directory, if there is one."""
+    try:
+        if not _has_index(path):
+            return None
+
+        if is_sharded(path):
+            return ShardedVectorStore(collection_name, path, _embedder)
+
+        return Chroma(
+            collection_name=collection_name,
+            embedding_function=_embedder,
+            persist_directory=str(path),
+        )
+    except Exception:
+        return None
+
+
+def load_vector_store(collection_name: str) -> CollectionStore | None:
     """
     Load an existing vector store.
 
@@ -64,45 +365,419 @@ def load_vector_store(collection_name: str) -> Chroma | None:
         collection_name: Name of the collection to load
 
     Returns:
-        Chroma vector store instance or None if not found
+        Chroma vector store instance (or sharded store) or None if not found
     """
-    try:
-        collection_path = VECTOR_STORE_DIR / collection_name
-        if not collection_path.exists():
-            return None
+    return _open_path(collection_name, collection_path(collection_name))
 
-        return Chroma(
-            collection_name=collection_name,
-            embedding_function=_embedder,
-            persist_directory=str(collection_path),
-        )
-    except Exception:
+
+def _open_reader(collection_name: str, path: Path) -> _Reader | None:
+    """Open a version for queries and take a reader lease on it."""
+    store = _open_path(collection_name, path)
+    if store is None:
         return None
+    add_lease(path)
+    return _Reader(collection_root(collection_name), path, store)
+
+
+def on_version_retired(hook: Callable[[Path], None]) -> None:
+    """
+    Register a callback for versions this process stops reading.
+
+    Caches built on a version (e.g. open sidecar indexes) should be dropped by
+    the callback, which gets the version's directory.
+
+    Args:
+        hook: Called with the directory of every retired version
+    """
+    _retire_hooks.append(hook)
+
+
+def _release_chroma(version_dir: Path) -> None:
+    """Stop the Chroma systems (and loaded indexes) cached for a version."""
+    prefix = f"{version_dir}{os.sep}"
+    release_systems(
+        lambda identifier: identifier == str(version_dir)
+        # An unversioned collection directory also holds the newer versions
+        or (
+            identifier.startswith(prefix)
+            and not is_control_entry(Path(identifier), version_dir)
+        )
+    )
+
+
+def _close_reader(reader: _Reader) -> None:
+    """Release a superseded version and delete versions nobody reads."""
+    for hook in _retire_hooks:
+        hook(reader.path)
+    _release_chroma(reader.path)
+    remove_lease(reader.path)
+    _opener.submit(collect_garbage, reader.root)
+
+
+def _swap_in(collection_name: str, path: Path) -> None:
+    """Open a newly published version and make it the one new queries use."""
+    reader = None
+    retired = None
+    try:
+        reader = _open_reader(collection_name, path)
+    finally:
+        with _readers_lock:
+            _opening.discard((collection_name, path))
+            if reader is not None:
+                old = _readers.get(collection_name)
+                _readers[collection_name] = reader
+                if old is not None:
+                    old.retired = True
+                    if old.active == 0:
+                        retired = old
+    if retired is not None:
+        _close_reader(retired)
+
+
+def store_directory(vs: CollectionStore) -> Path:
+    """
+    Directory of the collection version an open store reads from.
+
+    Sidecars used alongside a query (e.g. the adjacency index) must come from
+    this directory rather than `collection_path`, which may already point at
+    a newer version.
+
+    Args:
+        vs: Store returned by `reading_collection` or `load_vector_store`
+
+    Returns:
+        The version's directory
+    """
+    if isinstance(vs, ShardedVectorStore):
+        return vs.collection_path
+    return Path(vs._persist_directory)
+
+
+@contextmanager
+def reading_collection(collection_name: str) -> Iterator[CollectionStore | None]:
+    """
+    Hold the live version of a collection for the duration of a query.
+
+    The version is opened once per process and shared. When a new version is
+    published, it is opened in the background while queries keep using the
+    previous one, then swapped in; the previous version is released once its
+    last query finishes.
+
+    Args:
+        collection_name: Name of the collection
+
+    Yields:
+        The collection's store, or None if the collection does not exist
+    """
+    path = _published_path(collection_name)
+    with _readers_lock:
+        reader = _readers.get(collection_name)
+        if reader is not None:
+            reader.active += 1
+            if reader.path != path and (collection_name, path) not in _opening:
+                _opening.add((collection_name, path))
+                _opener.submit(_swap_in, collection_name, path)
+
+    if reader is None:
+        # Nothing to serve in the meantime: open the first version directly
+        opened = _open_reader(collection_name, path)
+        with _readers_lock:
+            reader = _readers.get(collection_name)
+            if reader is None and opened is not None:
+                _readers[collection_name] = reader = opened
+                opened = None
+            if reader is not None:
+                reader.active += 1
+        if opened is not None:
+            # Another thread opened it first
+            remove_lease(opened.path)
+
+    try:
+        yield reader.store if reader is not None else None
+    finally:
+        if reader is not None:
+            with _readers_lock:
+                reader.active -= 1
+                finished = reader.retired and reader.active == 0
+            if finished:
+                _close_reader(reader)
+
+
+@contextmanager
+def staging_collection(
+    collection_name: str,
+    *,
+    version: str | None = None,
+    rebuild: bool = False,
+) -> Iterator[str]:
+    """
+    Direct writes to a collection into a new version, published on success.
+
+    Within the block, `collection_path` (and everything built on it) refers
+    to the new version, while other contexts and processes keep reading the
+    live one. When the block completes, the new version becomes live in one
+    atomic step. Only one writer at a time builds a version of a collection;
+    others wait until it has published. If the block raises, the version is
+    left in place so a resumed run can continue it; it is deleted later if
+    nothing resumes it. A `version` that is already live is not continued; a
+    fresh copy is written instead. Nested use for the same collection joins
+    the enclosing version.
+
+    Args:
+        collection_name: Name of the collection
+        version: Unfinished version to continue (e.g. from a journal)
+        rebuild: Start from an empty version instead of a copy of the live one
+
+    Yields:
+        Name of the version being written
+    """
+    staged = _staging.get()
+    if collection_name in staged:
+        yield staged[collection_name].name
+        return
+
+    root = collection_root(collection_name)
+    # Other processes writing this collection wait here, so each copies the
+    # version the previous one published
+    with writer_lock(root):
+        # A version that has been published since (e.g. by an enclosing run)
+        # is read by queries and must never be written in place
+        if (
+            version is not None
+            and version != current_version(root)
+            and version_path(root, version).exists()
+        ):
+            mark_staging(root, version)
+        else:
+            source = None if rebuild else _published_path(collection_name)
+            version = create_version(root, copy_from=source)
+
+        token = _staging.set({**staged, collection_name: version_path(root, version)})
+        try:
+            yield version
+        finally:
+            _staging.reset(token)
+        publish_version(root, version)
+    collect_garbage(root)
+
+
+def query_by_vectors(
+    vs: CollectionStore,
+    embeddings: list[list[float]],
+    k: int,
+    where: dict[str, Any] | None = None,
+) -> list[list[tuple[Document, float]]]:
+    """
+    Run several vector queries against a collection in one call.
+
+    Args:
+        vs: Collection to query
+        embeddings: Query vectors
+        k: Results per query
+        where: Optional Chroma metadata filter
+
+    Returns:
+        For each query, the top-k (document, distance) pairs
+    """
+    if isinstance(vs, ShardedVectorStore):
+        return vs.query_by_vectors(embeddings, k, where)
+
+    response = vs._collection.query(
+        query_embeddings=embeddings,  # type: ignore[arg-type]
+        n_results=k,
+        where=where,
+        include=["documents", "metadatas", "distances"],  # type: ignore[list-item]
+    )
+    return [
+        [
+            (Document(page_content=text, metadata=meta or {}, id=chunk_id), dist)
+            for chunk_id, text, meta, dist in zip(
+                response["ids"][row],
+                response["documents"][row],  # type: ignore[index]
+                response["metadatas"][row],  # type: ignore[index]
+                response["distances"][row],  # type: ignore[index]
+                strict=True,
+            )
+        ]
+        for row in range(len(embeddings))
+    ]
 
 
 def add_documents_to_store(
     docs: list[Document],
-    collection_name: str
-) -> Chroma:
+    collection_name: str,
+    *,
+    shards: int | None = None,
+    shard_strategy: str = "hash",
+    skip: Container[int] = (),
+    on_batch: Callable[[int, int], None] | None = None,
+) -> CollectionStore:
     """
     Add documents to an existing vector store or create new one.
 
     Args:
         docs: Documents to add
         collection_name: Name of the collection
+        shards: Shard count used if the collection has to be created
+        shard_strategy: Shard routing used if the collection has to be created
+        skip: Start offsets of batches of `docs` that are already stored
+        on_batch: Called with the (start, end) range of every batch written
 
     Returns:
-        Updated Chroma vector store instance
+        Updated Chroma vector store instance (or sharded store)
     """
     vs = load_vector_store(collection_name)
     if vs is not None:
         # Add documents in batches to avoid token limits
-        batch_size = 100
-        for i in range(0, len(docs), batch_size):
-            batch = docs[i:i + batch_size]
-            vs.add_documents(batch)
-            vs.persist()
+        _add_in_batches(vs, collection_path(collection_name), docs, skip, on_batch)
         return vs
     else:
         # Collection doesn't exist, create new one
-        return build_vector_store(docs, collection_name)
+        return build_vector_store(
+            docs,
+            collection_name,
+            shards=shards,
+            shard_strategy=shard_strategy,
+            skip=skip,
+            on_batch=on_batch,
+        )
+
+
+def stored_ids(vs: CollectionStore, ids: list[str]) -> set[str]:
+    """
+    Check which chunk IDs are present in a collection.
+
+    Args:
+        vs: Collection to check
+        ids: Chunk IDs to look up
+
+    Returns:
+        The subset of `ids` that is stored
+    """
+    found: set[str] = set()
+    for i in range(0, len(ids), EMBED_BATCH_SIZE):
+        found.update(vs.get(ids=ids[i:i + EMBED_BATCH_SIZE], include=[])["ids"])
+    return found
+
+
+def stored_chunk_ids(collection_name: str, where: dict[str, Any]) -> list[str]:
+    """
+    IDs of the stored chunks matching a metadata filter.
+
+    Args:
+        collection_name: Name of the collection
+        where: Chroma metadata filter
+
+    Returns:
+        Chunk IDs (empty if the collection does not exist)
+    """
+    vs = load_vector_store(collection_name)
+    if vs is None:
+        return []
+    return list(vs.get(where=where, include=[])["ids"])
+
+
+def delete_chunks(collection_name: str, ids: list[str]) -> int:
+    """
+    Delete chunks by ID, keeping the statistics and adjacency index in step.
+
+    Args:
+        collection_name: Name of the collection
+        ids: Chunk IDs to delete (IDs that are not stored are ignored)
+
+    Returns:
+        Number of chunks deleted
+    """
+    vs = load_vector_store(collection_name)
+    if vs is None:
+        return 0
+
+    path = collection_path(collection_name)
+    deleted = 0
+    for i in range(0, len(ids), EMBED_BATCH_SIZE):
+        batch = ids[i:i + EMBED_BATCH_SIZE]
+        removed = stored_chunks(vs, batch)
+        if not removed:
+            continue
+        vs.delete(ids=batch)
+        if isinstance(vs, Chroma):
+            vs.persist()
+        update_stats(path, vs, replaced=removed)
+        remove_from_adjacency(path, batch)
+        deleted += len(removed)
+    return deleted
+
+
+def get_collection_stats(
+    collection_name: str,
+    *,
+    refresh: bool = False,
+    top: int | None = STATS_TOP_ENTRIES,
+) -> CollectionStats | None:
+    """
+    Exact statistics of a collection.
+
+    Statistics are read from the sidecar kept up to date by every write. A
+    collection without one is scanned for this call only; the sidecar is
+    written by its next ingest, never into the version queries read. With
+    `refresh`, the sidecar is rebuilt with a scan and published as a new
+    version of the collection.
+
+    Args:
+        collection_name: Name of the collection
+        refresh: Rebuild the statistics from the stored chunks
+        top: Largest per-path and per-document counts to include (all if None)
+
+    Returns:
+        Statistics or None if the collection does not exist
+    """
+    if not _has_index(collection_path(collection_name)):
+        return None
+
+    if refresh:
+        with staging_collection(collection_name):
+            vs = load_vector_store(collection_name)
+            if vs is not None:
+                rebuild_stats(collection_path(collection_name), vs)
+
+    path = collection_path(collection_name)
+    stats = read_stats(path, top)
+    if stats is None:
+        vs = load_vector_store(collection_name)
+        if vs is None:
+            return None
+        stats = scan_collection(vs)
+    stats.index_bytes = index_bytes(path)
+    return stats
+
+
+def reshard_collection(
+    collection_name: str,
+    shards: int,
+    shard_strategy: str | None = None,
+) -> int:
+    """
+    Change the number of shards of a collection without re-embedding.
+
+    The new layout is built as a new version, so queries are not affected
+    until it is complete.
+
+    Args:
+        collection_name: Name of the collection
+        shards: Desired number of shards
+        shard_strategy: New routing strategy (defaults to the current one)
+
+    Returns:
+        Number of chunks moved between shards
+    """
+    if not _has_index(collection_path(collection_name)):
+        raise ValueError(f"Collection '{collection_name}' not found")
+
+    with staging_collection(collection_name):
+        return rebalance(
+            collection_name,
+            collection_path(collection_name),
+            _embedder,
+            shards,
+            shard_strategy,
+        )
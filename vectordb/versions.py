@@ -0,0 +1,225 @@
+"""
+Blue/green versions of a collection directory.
+
+Writers never modify the version that servers are reading. Ingestion builds a
+new version next to it and then switches an atomic pointer:
+
+    <collection>/CURRENT                  name of the live version
+    <collection>/versions/<version>/      index, shards, stats, blobs, ...
+    <collection>/versions/<version>/.readers/<pid>
+                                          one lease per process reading it
+    <collection>/.writer.lock             held by the process writing a version
+
+A version being built carries a `.staging` marker naming the writer's PID.
+Writers hold an exclusive lock on `.writer.lock` from the moment they copy
+the live version until they publish theirs, so two processes writing the same
+collection (e.g. a CLI refresh and a server job) take turns instead of the
+second publish silently dropping the first one's writes.
+Old versions are deleted once they are no longer current and no live process
+holds a lease on them. Collections created before versioning keep their files
+directly in `<collection>/` and are read from there until the first versioned
+write switches them over.
+"""
+from __future__ import annotations
+
+import fcntl
+import os
+import shutil
+import time
+import uuid
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+CURRENT_FILE = "CURRENT"
+VERSIONS_DIR = "versions"
+LEASES_DIR = ".readers"
+STAGING_MARKER = ".staging"
+WRITER_LOCK = ".writer.lock"
+
+# Entries of a collection directory that belong to the versioning itself
+# rather than to an (unversioned) index
+_CONTROL_ENTRIES = {
+    CURRENT_FILE, VERSIONS_DIR, LEASES_DIR, WRITER_LOCK, f"{CURRENT_FILE}.tmp"
+}
+
+
+def current_version(root: Path) -> str | None:
+    """
+    Name of the live version of a collection.
+
+    Args:
+        root: Collection directory
+
+    Returns:
+        Version name, or None for an unversioned (or empty) collection
+    """
+    try:
+        return (root / CURRENT_FILE).read_text().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def version_path(root: Path, version: str | None) -> Path:
+    """Directory holding a version (the collection directory if unversioned)."""
+    return root if version is None else root / VERSIONS_DIR / version
+
+
+def is_control_entry(path: Path, root: Path) -> bool:
+    """Whether `path` inside an unversioned collection belongs to versioning."""
+    parts = path.relative_to(root).parts
+    return bool(parts) and parts[0] in _CONTROL_ENTRIES
+
+
+@contextmanager
+def writer_lock(root: Path) -> Iterator[None]:
+    """
+    Hold the collection's writer lock, waiting for any other writer to finish.
+
+    The lock is released by the operating system if the process dies.
+
+    Args:
+        root: Collection directory
+    """
+    root.mkdir(parents=True, exist_ok=True)
+    with open(root / WRITER_LOCK, "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def create_version(root: Path, copy_from: Path | None = None) -> str:
+    """
+    Start building a new version.
+
+    Args:
+        root: Collection directory
+        copy_from: Version directory to start from (empty version if None)
+
+    Returns:
+        Name of the new version
+    """
+    version = f"v{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:6]}"
+    path = version_path(root, version)
+    if copy_from is not None and copy_from.exists():
+        shutil.copytree(
+            copy_from,
+            path,
+            ignore=lambda d, names: [
+                n for n in names
+                if n in (LEASES_DIR, STAGING_MARKER)
+                or (Path(d) == root and n in _CONTROL_ENTRIES)
+            ],
+        )
+    else:
+        path.mkdir(parents=True)
+    mark_staging(root, version)
+    return version
+
+
+def mark_staging(root: Path, version: str) -> None:
+    """Record that this process is building `version`."""
+    (version_path(root, version) / STAGING_MARKER).write_text(str(os.getpid()))
+
+
+def publish_version(root: Path, version: str) -> None:
+    """
+    Atomically make `version` the live version of the collection.
+
+    Args:
+        root: Collection directory
+        version: Finished version to switch to
+    """
+    (version_path(root, version) / STAGING_MARKER).unlink(missing_ok=True)
+    tmp = root / f"{CURRENT_FILE}.tmp"
+    tmp.write_text(version)
+    os.replace(tmp, root / CURRENT_FILE)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _live_pids(directory: Path) -> list[int]:
+    """PIDs named by files in `directory` whose processes still run."""
+    if not directory.exists():
+        return []
+    pids: list[int] = []
+    for entry in directory.iterdir():
+        try:
+            pid = int(entry.name)
+        except ValueError:
+            continue
+        if _pid_alive(pid):
+            pids.append(pid)
+        else:
+            # Lease of a process that exited without releasing it
+            entry.unlink(missing_ok=True)
+    return pids
+
+
+def add_lease(path: Path) -> None:
+    """Register this process as a reader of the version at `path`."""
+    leases = path / LEASES_DIR
+    leases.mkdir(exist_ok=True)
+    (leases / str(os.getpid())).touch()
+
+
+def remove_lease(path: Path) -> None:
+    """Drop this process's reader lease on the version at `path`."""
+    (path / LEASES_DIR / str(os.getpid())).unlink(missing_ok=True)
+
+
+def _in_use(path: Path) -> bool:
+    """Whether a version is being built or read by a live process."""
+    marker = path / STAGING_MARKER
+    if marker.exists():
+        try:
+            if _pid_alive(int(marker.read_text().strip())):
+                return True
+        except ValueError:
+            return True
+    return bool(_live_pids(path / LEASES_DIR))
+
+
+def collect_garbage(root: Path) -> list[str]:
+    """
+    Delete versions that are neither current nor in use.
+
+    Args:
+        root: Collection directory
+
+    Returns:
+        Names of the deleted versions ("" for pre-versioning files)
+    """
+    current = current_version(root)
+    if current is None:
+        return []
+
+    removed: list[str] = []
+    versions = root / VERSIONS_DIR
+    if versions.exists():
+        for path in versions.iterdir():
+            if path.name == current or not path.is_dir() or _in_use(path):
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            removed.append(path.name)
+
+    # Index files from before the collection was versioned
+    legacy = [e for e in root.iterdir() if e.name not in _CONTROL_ENTRIES]
+    if legacy and not _live_pids(root / LEASES_DIR):
+        for entry in legacy:
+            if entry.is_dir():
+                shutil.rmtree(entry, ignore_errors=True)
+            else:
+                entry.unlink(missing_ok=True)
+        removed.append("")
+    return removed